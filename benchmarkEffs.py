@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+import os, sys
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import subprocess
+from argparse import ArgumentParser
+
+from helpers.synthetic import generateFiles
+
+# Throughput benchmark of the efficiency drivers on synthetic NanoAOD files.
+# Every driver runs in a fresh interpreter, which times the stages of the
+# PostProcessor loop (open the input, preselection, event loop, writing the
+# histograms) or of the columnar loop, and reports its peak resident memory.
+# The results are written as JSON and can be compared to an earlier file to
+# catch throughput or memory regressions. With --bootstrap the drivers are
+# also run with bootstrap replicas, e.g. to see the cost of 100 and 1000.
+
+DRIVERS = ["MET", "PFHT", "AK8", "AK8-columnar", "All", "Config"]
+STAGES = ["open", "preselection", "read", "analyze", "write"]
+
+def getDriver(name, bootstrap=0):
+    '''
+    Modules, preselection and histogram directory of a driver, as set up by its script.
+    '''
+    if name == "MET":
+        import getEffsMET
+        return [getEffsMET.TrigMETAnalysis(bootstrap=bootstrap)], getEffsMET.preselection, "metTrigAnalyzerNanoAOD"
+    if name == "PFHT":
+        import getEffsPFHT
+        return [getEffsPFHT.TrigPFHTAnalysis(bootstrap=bootstrap)], getEffsPFHT.preselection, "pfhtTrigAnalyzerNanoAOD"
+    if name in ["AK8", "AK8-columnar"]:
+        import getEffsAK8
+        return [getEffsAK8.TrigHadAnalysis(bootstrap=bootstrap)], getEffsAK8.preselection, "hadTrigAnalyzerNanoAOD"
+    if name == "All":
+        import getEffsAll
+        return getEffsAll.getAnalyses(bootstrap=bootstrap), getEffsAll.preselection, "allTrigAnalyzerNanoAOD"
+    if name == "Config":
+        from helpers.engine import EfficiencyEngine, loadSpec
+        spec = loadSpec(os.path.join(os.path.dirname(os.path.abspath(__file__)), "configs", "efficiencies.yaml"))
+        return [EfficiencyEngine(spec, bootstrap=bootstrap)], spec["preselection"], "allTrigAnalyzerNanoAOD"
+    raise ValueError(f"Unknown driver {name}")
+
+def benchmarkLoop(modules, files, cut, histFileName, histDirName):
+    '''
+    The steps of PostProcessor(..., noOut=True).run() with a timer around each of them.
+    '''
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import eventLoop
+    from PhysicsTools.NanoAODTools.postprocessing.framework.preskimming import preSkim
+    from PhysicsTools.NanoAODTools.postprocessing.framework.branchselection import BranchSelection
+    from PhysicsTools.NanoAODTools.postprocessing.framework.treeReaderArrayTools import InputTree
+    from helpers.branches import writeBranchSelection
+
+    times = dict.fromkeys(STAGES, 0.)
+    times["read"] = None
+    nIn, nSel = 0, 0
+
+    t0 = time.time()
+    histFile = ROOT.TFile.Open(histFileName, "RECREATE")
+    for m in modules:
+        m.beginJob(histFile=histFile, histDirName=histDirName)
+    branchsel = writeBranchSelection(modules, cut)
+    times["open"] += time.time() - t0
+
+    for fname in files:
+        t0 = time.time()
+        inFile = ROOT.TFile.Open(fname)
+        tree = inFile.Get("Events")
+        BranchSelection(branchsel).selectBranches(tree)
+        times["open"] += time.time() - t0
+
+        t0 = time.time()
+        elist, jsonFilter = preSkim(tree, None, cut)
+        times["preselection"] += time.time() - t0
+
+        nIn += tree.GetEntries()
+        nSel += elist.GetN() if elist else tree.GetEntries()
+        t0 = time.time()
+        eventLoop(modules, inFile, None, InputTree(tree, elist), None, progress=False)
+        times["analyze"] += time.time() - t0
+        inFile.Close()
+
+    t0 = time.time()
+    for m in modules:
+        m.endJob()
+    times["write"] += time.time() - t0
+    os.remove(branchsel)
+    return nIn, nSel, times
+
+def benchmarkColumnar(module, files, histFileName, histDirName, stepSize=100000):
+    '''
+    The steps of runColumnar() with a timer around each of them. The
+    preselection is part of analyzeChunk() and counted as analysis time.
+    '''
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    import uproot
+
+    times = dict.fromkeys(STAGES, 0.)
+    times["preselection"] = None
+    nIn = 0
+
+    t0 = time.time()
+    histFile = ROOT.TFile.Open(histFileName, "RECREATE")
+    module.beginJob(histFile=histFile, histDirName=histDirName)
+    times["open"] += time.time() - t0
+
+    for fname in files:
+        t0 = time.time()
+        tree = uproot.open(fname)["Events"]
+        times["open"] += time.time() - t0
+
+        chunks = tree.iterate(module.requiredBranches(), step_size=stepSize, library="ak")
+        while True:
+            t0 = time.time()
+            arrays = next(chunks, None)
+            times["read"] += time.time() - t0
+            if arrays is None:
+                break
+            t0 = time.time()
+            module.analyzeChunk(arrays)
+            times["analyze"] += time.time() - t0
+            nIn += len(arrays)
+
+    t0 = time.time()
+    module.endJob()
+    times["write"] += time.time() - t0
+    return nIn, None, times
+
+def runDriver(name, files, histFileName, bootstrap=0):
+    t0 = time.time()
+    modules, cut, histDirName = getDriver(name, bootstrap)
+    setup = time.time() - t0
+    if name.endswith("-columnar"):
+        nIn, nSel, times = benchmarkColumnar(modules[0], files, histFileName, histDirName)
+    else:
+        nIn, nSel, times = benchmarkLoop(modules, files, cut, histFileName, histDirName)
+    wallTime = time.time() - t0
+    return {"driver": f"{name}+bootstrap{bootstrap}" if bootstrap else name,
+            "files": len(files),
+            "entries": nIn,
+            "selected": nSel,
+            "setupTime": setup,
+            "wallTime": wallTime,
+            "eventsPerSecond": nIn / wallTime if wallTime > 0 else None,
+            # ru_maxrss is in kB on Linux
+            "peakRSSMB": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.,
+            "stages": times}
+
+def gitVersion():
+    try:
+        return subprocess.check_output(["git", "describe", "--always", "--dirty"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, reference, tolerance):
+    '''
+    Regressions of the throughput or the peak memory beyond tolerance with
+    respect to the results of an earlier run, as a list of messages.
+    '''
+    previous = {r["driver"]: r for r in reference["results"]}
+    regressions = []
+    for r in results["results"]:
+        old = previous.get(r["driver"])
+        if old is None:
+            continue
+        if r["eventsPerSecond"] < (1. - tolerance) * old["eventsPerSecond"]:
+            regressions.append("%s: %.0f events/s, was %.0f" % (r["driver"], r["eventsPerSecond"], old["eventsPerSecond"]))
+        if r["peakRSSMB"] > (1. + tolerance) * old["peakRSSMB"]:
+            regressions.append("%s: peak RSS %.0f MB, was %.0f MB" % (r["driver"], r["peakRSSMB"], old["peakRSSMB"]))
+    return regressions
+
+def printTable(results):
+    print("%-26s %10s %10s %9s %9s" % ("driver", "entries", "events/s", "RSS [MB]", "wall [s]") + "".join(" %12s" % s for s in STAGES))
+    for r in results:
+        print("%-26s %10d %10.0f %9.0f %9.2f" % (r["driver"], r["entries"], r["eventsPerSecond"], r["peakRSSMB"], r["wallTime"])
+              + "".join(" %12s" % ("-" if r["stages"][s] is None else "%.2f" % r["stages"][s]) for s in STAGES))
+
+def main(args):
+    if args.child:
+        result = runDriver(args.child, args.inputs, args.histFile, args.replicas)
+        with open(args.output, "w") as fout:
+            json.dump(result, fout)
+        return
+
+    workDir = tempfile.mkdtemp(prefix="trigeff_bench_")
+    try:
+        inputs = args.inputs
+        if not inputs:
+            dataDir = args.dataDir or os.path.join(workDir, "data")
+            inputs = [os.path.join(dataDir, f"synthetic_{i:04d}.root") for i in range(args.files)]
+            if not all(os.path.exists(f) for f in inputs):
+                t0 = time.time()
+                inputs = generateFiles(dataDir, args.files, args.events, seed=args.seed)
+                print(f"Generated {args.files} x {args.events} synthetic events in {dataDir} ({time.time()-t0:.1f} s)")
+
+        results = {"version": gitVersion(),
+                   "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "host": platform.node(),
+                   "python": platform.python_version(),
+                   "inputs": inputs,
+                   "results": []}
+        for driver, replicas in [(driver, replicas) for driver in args.drivers for replicas in [0] + args.bootstrap]:
+            for i in range(args.repeat):
+                out = os.path.join(workDir, f"{driver}_{replicas}_{i}.json")
+                cmd = [sys.executable, os.path.abspath(__file__), "--child", driver, "--replicas", str(replicas),
+                       "--histfile", os.path.join(workDir, f"{driver}.root"), "-o", out, "--input"] + inputs
+                if subprocess.call(cmd) != 0:
+                    sys.exit(f"Benchmark of {driver} failed")
+                with open(out) as fin:
+                    result = json.load(fin)
+                # Keep the fastest of the repetitions
+                best = [r for r in results["results"] if r["driver"] == result["driver"]]
+                if not best:
+                    results["results"].append(result)
+                elif result["wallTime"] < best[0]["wallTime"]:
+                    results["results"][results["results"].index(best[0])] = result
+    finally:
+        shutil.rmtree(workDir, ignore_errors=True)
+
+    printTable(results["results"])
+    with open(args.output, "w") as fout:
+        json.dump(results, fout, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.reference:
+        with open(args.reference) as fin:
+            regressions = compare(results, json.load(fin), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+
+    RESULTS = "benchmark.json"
+    EVENTS  = 200000
+    FILES   = 2
+
+    parser = ArgumentParser(description="Measure the throughput, peak memory and per-stage time of the efficiency drivers on synthetic NanoAOD files")
+    parser.add_argument("--drivers", dest="drivers", nargs="+", choices=DRIVERS, default=DRIVERS, help="Drivers to benchmark [default: %s]" % (" ".join(DRIVERS)))
+    parser.add_argument("--input", dest="inputs", nargs="+", default=None, help="Input NanoAOD files [default: synthetic files]")
+    parser.add_argument("-n", "--events", dest="events", type=int, action="store", default=EVENTS, help="Number of synthetic events per file [default: %s]" % (EVENTS))
+    parser.add_argument("--files", dest="files", type=int, action="store", default=FILES, help="Number of synthetic files [default: %s]" % (FILES))
+    parser.add_argument("--seed", dest="seed", type=int, action="store", default=0, help="Random seed of the synthetic files [default: %s]" % (0))
+    parser.add_argument("--data-dir", dest="dataDir", type=str, action="store", default=None, help="Directory where the synthetic files are kept and reused by later runs [default: a temporary directory]")
+    parser.add_argument("--repeat", dest="repeat", type=int, action="store", default=1, help="Number of runs per driver, the fastest one is kept [default: %s]" % (1))
+    parser.add_argument("--reference", dest="reference", type=str, action="store", default=None, help="Results of an earlier run; exit with an error if a driver got slower or uses more memory [default: no comparison]")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, action="store", default=0.15, help="Relative change tolerated by --reference [default: %s]" % (0.15))
+    parser.add_argument("--bootstrap", dest="bootstrap", type=int, nargs="+", default=[], help="Also run every driver with these numbers of bootstrap replicas, e.g. --bootstrap 100 1000 [default: none]")
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=RESULTS, help="Output JSON file [default: %s]" % (RESULTS))
+    parser.add_argument("--child", dest="child", type=str, action="store", default=None, help="(internal) benchmark one driver in this process")
+    parser.add_argument("--replicas", dest="replicas", type=int, action="store", default=0, help="(internal) bootstrap replicas of --child")
+    parser.add_argument("--histfile", dest="histFile", type=str, action="store", default="benchmark_histos.root", help="(internal) histogram file of --child")
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import os, sys
+import json
+import time
+import platform
+import numpy as np
+from argparse import ArgumentParser
+from helpers.utils import importROOT
+from helpers.lookup import EfficiencyLookup
+
+# Benchmark of the efficiency lookup tables of helpers/lookup.py against the
+# per-event TEfficiency path (FindFixBin and GetEfficiency) on the 2D maps of
+# a histogram file. Random points are drawn over the axes and 10% beyond them
+# on each side, to exercise the clamping. The rate of the batch lookup, with
+# and without interpolation, is measured on --points points and the rate of
+# TEfficiency on the first --root-points of them, where both must give the
+# same efficiency in every bin inside the axes with events. The results are
+# written as JSON; the script exits with an error if they disagree.
+
+MAPS = {"AK8": ("hadTrigAnalyzerNanoAOD", "h_AK8_mSD_vs_pt_passTrgOR", "h_AK8_mSD_vs_pt"),
+        "MET": ("metTrigAnalyzerNanoAOD", "h_met_pt_vs_pv_passed", "h_met_pt_vs_pv_all"),
+        "PFHT": ("pfhtTrigAnalyzerNanoAOD", "h_pfht_vs_pv_passed", "h_pfht_vs_pv_all"),
+        }
+
+def randomPoints(edges, n, rng, margin=0.1):
+    width = edges[-1] - edges[0]
+    return rng.uniform(edges[0] - margin * width, edges[-1] + margin * width, n)
+
+def best(function, repeat):
+    times = []
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - t0)
+        del result
+    return min(times)
+
+def evaluateROOT(teff, x, y):
+    return np.array([teff.GetEfficiency(teff.FindFixBin(xi, yi)) for xi, yi in zip(x, y)])
+
+def benchmarkMap(ROOT, num, den, args, rng):
+    lookup = EfficiencyLookup.fromHistograms(num, den)
+    interpolated = EfficiencyLookup.fromHistograms(num, den, interpolate=True)
+    x, y = randomPoints(lookup.xedges, args.points, rng), randomPoints(lookup.yedges, args.points, rng)
+    out = np.empty(args.points)
+    result = {"bins": lookup.nx * lookup.ny, "points": args.points}
+    result["lookup"] = args.points / best(lambda: lookup(x, y, out), args.repeat)
+    result["interpolated"] = args.points / best(lambda: interpolated(x, y, out), args.repeat)
+
+    teff = ROOT.TEfficiency(num, den)
+    nROOT = min(args.rootPoints, args.points)
+    xr, yr = x[:nROOT], y[:nROOT]
+    t0 = time.perf_counter()
+    reference = evaluateROOT(teff, xr, yr)
+    result["TEfficiency"] = nROOT / (time.perf_counter() - t0)
+    result["speedup"] = result["lookup"] / result["TEfficiency"]
+
+    inside = ((xr >= lookup.xedges[0]) & (xr < lookup.xedges[-1]) & (yr >= lookup.yedges[0]) & (yr < lookup.yedges[-1]))
+    values = lookup(xr, yr)
+    compared = inside & np.isfinite(values)
+    result["compared"] = int(compared.sum())
+    result["maxDifference"] = float(np.max(np.abs(values[compared] - reference[compared]), initial=0.))
+    return result
+
+def main(args):
+    ROOT = importROOT()
+    rng = np.random.default_rng(args.seed)
+    results = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": platform.node(),
+               "python": platform.python_version(),
+               "rfile": args.rfile,
+               "maps": {}}
+    f = ROOT.TFile(args.rfile, "READ")
+    for name in args.maps:
+        dirName, numName, denName = MAPS[name]
+        fdir = f.GetDirectory(dirName)
+        num, den = (fdir.Get(numName), fdir.Get(denName)) if fdir else (None, None)
+        if not num or not den:
+            print(f"Skipping {name}: no {dirName}/{numName} and {denName} in {args.rfile}")
+            continue
+        results["maps"][name] = benchmarkMap(ROOT, num, den, args, rng)
+    f.Close()
+
+    print("%-6s %8s %14s %14s %14s %9s %10s" % ("map", "bins", "lookup [1/s]", "interp. [1/s]", "TEff. [1/s]", "speedup", "max diff."))
+    for name, r in results["maps"].items():
+        print("%-6s %8d %14.3g %14.3g %14.3g %9.0f %10.2g" % (name, r["bins"], r["lookup"], r["interpolated"], r["TEfficiency"], r["speedup"], r["maxDifference"]))
+    with open(args.output, "w") as fout:
+        json.dump(results, fout, indent=2)
+    print(f"Results written to {args.output}")
+
+    failures = [f"{name}: lookup and TEfficiency differ by {r['maxDifference']:.3g}" for name, r in results["maps"].items() if r["maxDifference"] > 1e-12]
+    for message in failures:
+        print(f"MISMATCH {message}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+
+    TRGROOTFILE = "histos_AllTrigNanoAOD.root"
+    RESULTS     = "lookup.json"
+    POINTS      = 10000000
+    ROOTPOINTS  = 100000
+
+    parser = ArgumentParser(description="Benchmark the efficiency lookup tables against TEfficiency")
+    parser.add_argument("--rfile", dest="rfile", type=str, action="store", default=TRGROOTFILE, help="ROOT file containing the 2D efficiency maps [default: %s]" % (TRGROOTFILE))
+    parser.add_argument("--maps", dest="maps", nargs="+", choices=list(MAPS), default=list(MAPS), help="Maps to benchmark [default: %s]" % (" ".join(MAPS)))
+    parser.add_argument("-n", "--points", dest="points", type=int, action="store", default=POINTS, help="Number of points evaluated by the lookup tables [default: %s]" % (POINTS))
+    parser.add_argument("--root-points", dest="rootPoints", type=int, action="store", default=ROOTPOINTS, help="Number of points evaluated with TEfficiency [default: %s]" % (ROOTPOINTS))
+    parser.add_argument("--repeat", dest="repeat", type=int, action="store", default=3, help="Number of runs of the lookup tables, the fastest one is kept [default: %s]" % (3))
+    parser.add_argument("--seed", dest="seed", type=int, action="store", default=0, help="Random seed of the points [default: %s]" % (0))
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=RESULTS, help="Output JSON file [default: %s]" % (RESULTS))
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+import os, sys
+import json
+import time
+import platform
+import subprocess
+from argparse import ArgumentParser
+
+# Startup benchmark of the plotting and fitting entry points. Every script is
+# run with --help in a fresh interpreter and the fastest of --repeat runs is
+# kept, next to a bare interpreter for reference. The scripts and the helpers
+# they import must not import ROOT before a histogram file is opened, which is
+# checked by importing each of them and looking for ROOT in sys.modules. The
+# results are written as JSON; with --reference the script exits with an error
+# if a script starts more than --tolerance slower, and in any case if one of
+# them takes longer than --max-time or imports ROOT.
+
+SCRIPTS = ["plotHadEff.py", "plotMETEff.py", "plotPFHTEff.py", "fitEffs.py"]
+MODULES = ["helpers.utils", "helpers.bootstrap", "helpers.render", "helpers.turnon"] + [s[:-3] for s in SCRIPTS]
+
+# Below this absolute difference in seconds a slower startup is timing noise
+NOISE = 0.05
+
+def timeCommand(cmd, repeat, cwd):
+    best = None
+    for i in range(repeat):
+        t0 = time.perf_counter()
+        subprocess.run(cmd, cwd=cwd, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True)
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+def importsROOT(module, cwd):
+    out = subprocess.check_output([sys.executable, "-c", f"import sys, {module}; print('ROOT' in sys.modules)"], cwd=cwd, text=True)
+    return out.strip() == "True"
+
+def compare(results, reference, tolerance):
+    '''
+    Scripts that start more than tolerance (and NOISE) slower than in an earlier run, as a list of messages.
+    '''
+    previous = reference["startup"]
+    regressions = []
+    for name, t in results["startup"].items():
+        old = previous.get(name)
+        if old is not None and t > (1. + tolerance) * old and t - old > NOISE:
+            regressions.append("%s: %.3f s, was %.3f s" % (name, t, old))
+    return regressions
+
+def main(args):
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = {"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+               "host": platform.node(),
+               "python": platform.python_version(),
+               "startup": {},
+               "importsROOT": {}}
+    results["startup"]["python"] = timeCommand([sys.executable, "-c", "pass"], args.repeat, cwd)
+    for script in args.scripts:
+        results["startup"][f"{script} --help"] = timeCommand([sys.executable, script, "--help"], args.repeat, cwd)
+    for module in MODULES:
+        results["importsROOT"][module] = importsROOT(module, cwd)
+
+    print("%-28s %10s" % ("command", "time [s]"))
+    for name, t in results["startup"].items():
+        print("%-28s %10.3f" % (name, t))
+    with open(args.output, "w") as fout:
+        json.dump(results, fout, indent=2)
+    print(f"Results written to {args.output}")
+
+    failures = [f"{module} imports ROOT" for module, imported in results["importsROOT"].items() if imported]
+    failures += ["%s: %.3f s, more than %.3f s" % (name, t, args.maxTime) for name, t in results["startup"].items() if t > args.maxTime]
+    if args.reference:
+        with open(args.reference) as fin:
+            failures += compare(results, json.load(fin), args.tolerance)
+    for message in failures:
+        print(f"REGRESSION {message}")
+    if failures:
+        sys.exit(1)
+
+if __name__ == "__main__":
+
+    RESULTS = "startup.json"
+    MAXTIME = 1.5
+
+    parser = ArgumentParser(description="Benchmark the startup time of the plotting and fitting scripts")
+    parser.add_argument("--scripts", dest="scripts", nargs="+", choices=SCRIPTS, default=SCRIPTS, help="Scripts to benchmark [default: %s]" % (" ".join(SCRIPTS)))
+    parser.add_argument("--repeat", dest="repeat", type=int, action="store", default=5, help="Number of runs per script, the fastest one is kept [default: %s]" % (5))
+    parser.add_argument("--max-time", dest="maxTime", type=float, action="store", default=MAXTIME, help="Exit with an error if a script takes longer than this many seconds to start [default: %s]" % (MAXTIME))
+    parser.add_argument("--reference", dest="reference", type=str, action="store", default=None, help="Results of an earlier run; exit with an error if a script starts slower [default: no comparison]")
+    parser.add_argument("--tolerance", dest="tolerance", type=float, action="store", default=0.25, help="Relative change tolerated by --reference [default: %s]" % (0.25))
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=RESULTS, help="Output JSON file [default: %s]" % (RESULTS))
+    args = parser.parse_args()
+    main(args)
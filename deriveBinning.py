@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+'''
+DESCRIPTION:
+Derive adaptive binnings from the fine-grid counts written by the drivers
+with --sketch (see helpers/sketch.py). The counts of the given histogram files
+are merged per directory, and the bins of every observable are chosen from
+the low to the high end of its range so that each has at least --min-count
+denominator entries and, with --max-uncertainty, an efficiency uncertainty of
+at most that much. The edges are edges of the fine grid of each observable,
+so the counts per bin are exact. The edges are written as a JSON file
+per directory and observable, which the drivers book with --binning.
+
+'''
+#================
+# Import modules
+#================
+import json
+import numpy as np
+from argparse import ArgumentParser
+from helpers.sketch import sketchFiles, readSketches, mergeSketches, adaptiveEdges
+
+# Ranges of the observables, those of the default binnings, within the grids of helpers/sketch.py
+RANGES = {"pt": (200., 1000.), "mSD": (0., 400.), "eta": (-2.4, 2.4), "met_pt": (100., 600.), "pfht": (200., 1500.), "pv": (0., 100.)}
+
+# Steps of the bin edges, multiples of the grid steps
+RESOLUTIONS = {"pt": 5., "mSD": 5., "eta": 0.1, "met_pt": 5., "pfht": 10., "pv": 1.}
+
+def parseOverrides(texts, defaults):
+    values = dict(defaults)
+    for text in texts:
+        var, value = text.split(":", 1)
+        values[var] = tuple(float(v) for v in value.split(":")) if ":" in value else float(value)
+    return values
+
+def main(args):
+
+    ranges = parseOverrides(args.ranges, RANGES)
+    resolutions = parseOverrides(args.resolutions, RESOLUTIONS)
+
+    byDir = {}
+    for rfile in args.rfiles:
+        for directory, path in sketchFiles(rfile).items():
+            byDir.setdefault(directory, []).append(readSketches(path)[1])
+    if not byDir:
+        raise SystemExit(f"No sketch files next to {', '.join(args.rfiles)}, run the drivers with --sketch first")
+
+    binning = {}
+    print("%-26s %-8s %6s %10s %10s %10s" % ("directory", "variable", "bins", "entries", "min./bin", "max. unc."))
+    for directory, books in sorted(byDir.items()):
+        binning[directory] = {}
+        for var, grid in mergeSketches(books).items():
+            if grid.n == 0:
+                continue
+            low, high = ranges.get(var, (grid.low, grid.high))
+            try:
+                edges = adaptiveEdges(grid, low, high, minCount=args.minCount, maxUncertainty=args.maxUncertainty, resolution=resolutions.get(var, 0.))
+            except ValueError as e:
+                raise SystemExit(f"{directory} {var}: {e}")
+            binning[directory][var] = edges
+
+            n, k = [np.diff(counts).astype(np.float64) for counts in grid.cumulative(edges)]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                eff = k / n
+                unc = np.sqrt(eff * (1. - eff) / n)
+            print("%-26s %-8s %6d %10d %10d %10.4f" % (directory, var, len(edges) - 1, grid.n, n.min(), np.nanmax(unc)))
+
+    with open(args.output, "w") as fout:
+        json.dump(binning, fout, indent=2)
+    print(f"Binnings written to {args.output}")
+
+if __name__ == "__main__":
+
+    TRGROOTFILE = "histos_AllTrigNanoAOD.root"
+    MINCOUNT    = 1000
+    OUTPUT      = "binning.json"
+
+    parser = ArgumentParser(description="Derive equal-statistics binnings from the fine-grid counts of a first pass")
+    parser.add_argument("--rfile", dest="rfiles", type=str, nargs="+", default=[TRGROOTFILE], help="Histogram files of drivers run with --sketch, the counts next to them are merged [default: %s]" % (TRGROOTFILE))
+    parser.add_argument("--min-count", dest="minCount", type=float, action="store", default=MINCOUNT, help="Minimum number of denominator entries per bin [default: %s]" % (MINCOUNT))
+    parser.add_argument("--max-uncertainty", dest="maxUncertainty", type=float, action="store", default=None, help="Maximum binomial uncertainty of the efficiency per bin, e.g. 0.01 [default: no limit]")
+    parser.add_argument("--range", dest="ranges", nargs="+", default=[], metavar="VAR:LOW:HIGH", help="Range of the bins of an observable, grid edges within the grid [default: %s]" % (RANGES))
+    parser.add_argument("--resolution", dest="resolutions", nargs="+", default=[], metavar="VAR:STEP", help="Bin edges of an observable are multiples of STEP from the low end, a multiple of the grid step, or 0 for any grid edge [default: %s]" % (RESOLUTIONS))
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=OUTPUT, help="Output JSON file of the binnings, per directory and observable [default: %s]" % (OUTPUT))
+
+    args = parser.parse_args()
+    main(args)
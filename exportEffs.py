@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+'''
+DESCRIPTION:
+Export every numerator/denominator pair of the had, MET and PF HT efficiency
+histograms, with the efficiency and its Clopper-Pearson interval per bin, to
+an Arrow IPC table keyed by (analysis, variable, selection, trigger path, bin)
+that can be memory-mapped and sliced per path without ROOT (see
+helpers/effstable.py).
+
+'''
+#================
+# Import modules
+#================
+import time
+import math
+import numpy as np
+from argparse import ArgumentParser
+from helpers.utils import importROOT
+from helpers.bootstrap import readReplicas, efficiencyQuantiles
+from helpers.effstable import writeTable, EfficiencyTable
+from fitEffs import SELECTIONS, findCurves
+
+# Denominators per directory, as (variable, selection, denominator, prefix of
+# the numerators), see fitEffs.py
+PAIRS = {"hadTrigAnalyzerNanoAOD": [(var, sel, f"h_AK8_{var}_{sel}" if sel else f"h_AK8_{var}", f"h_AK8_{var}_pass") for var in ["pt", "mSD", "eta"] for sel in SELECTIONS]
+                                   + [("mSD_vs_pt", "", "h_AK8_mSD_vs_pt", "h_AK8_mSD_vs_pt_pass")],
+         "metTrigAnalyzerNanoAOD": [(var, "", f"h_{var}_all", f"h_{var}_pass") for var in ["met_pt", "pv", "met_pt_vs_pv"]],
+         "pfhtTrigAnalyzerNanoAOD": [(var, "", f"h_{var}_all", f"h_{var}_pass") for var in ["pfht", "pv", "pfht_vs_pv"]],
+         }
+
+# Trigger path of the numerators not named after a path
+PATHS = {"passTrgOR": "OR", "passed": "OR", "passedL1": "L1_HTT280er", "passedHLT": "HLT_PFHT1050"}
+
+def pathName(label):
+    if "HLT_" in label:
+        return label[label.index("HLT_"):]
+    return PATHS.get(label, label)
+
+def binColumns(ROOT, num, den, level, numReplicas=None, denReplicas=None):
+    '''
+    Columns of the in-range bins of a TH1 or TH2 pair, bin numbered x fastest
+    from 0. The replicas are indexed by global bin number (0 is the
+    underflow), like the cells, see bootstrap.py.
+    '''
+    nx = den.GetNbinsX()
+    ny = den.GetNbinsY() if den.GetDimension() > 1 else 0
+    xaxis, yaxis = den.GetXaxis(), den.GetYaxis()
+    cells = [(ix, iy) for iy in (range(1, ny + 1) if ny else [0]) for ix in range(1, nx + 1)]
+    if numReplicas is not None and denReplicas is not None:
+        bands = efficiencyQuantiles(numReplicas, denReplicas)
+    else:
+        bands = None
+
+    columns = {name: [] for name in ["bin", "xlow", "xhigh", "ylow", "yhigh", "num", "den", "eff", "effLow", "effHigh", "bootstrapLow", "bootstrapHigh"]}
+    for i, (ix, iy) in enumerate(cells):
+        cell = den.GetBin(ix, iy) if ny else ix
+        k, n = num.GetBinContent(cell), den.GetBinContent(cell)
+        columns["bin"].append(i)
+        columns["xlow"].append(xaxis.GetBinLowEdge(ix))
+        columns["xhigh"].append(xaxis.GetBinUpEdge(ix))
+        columns["ylow"].append(yaxis.GetBinLowEdge(iy) if ny else math.nan)
+        columns["yhigh"].append(yaxis.GetBinUpEdge(iy) if ny else math.nan)
+        columns["num"].append(k)
+        columns["den"].append(n)
+        columns["eff"].append(k / n if n > 0 else math.nan)
+        # The interval TEfficiency draws with kFCP, from the (rounded) counts
+        columns["effLow"].append(ROOT.TEfficiency.ClopperPearson(int(round(n)), int(round(k)), level, False))
+        columns["effHigh"].append(ROOT.TEfficiency.ClopperPearson(int(round(n)), int(round(k)), level, True))
+        columns["bootstrapLow"].append(bands[0][cell] if bands is not None else math.nan)
+        columns["bootstrapHigh"].append(bands[1][cell] if bands is not None else math.nan)
+    return {name: np.array(values) for name, values in columns.items()}
+
+def main(args):
+
+    ROOT = importROOT()
+    start = time.time()
+    groups = []
+    for rfile in args.rfiles:
+        f = ROOT.TFile(rfile, "READ")
+        for dirName, var, sel, label, numName, denName in findCurves(f, PAIRS):
+            key = (dirName, var, sel, pathName(label))
+            if key in [k for k, columns in groups]:
+                raise SystemExit(f"{'/'.join(key)} is in more than one input file")
+            fdir = f.GetDirectory(dirName)
+            num, den = fdir.Get(numName), fdir.Get(denName)
+            numReplicas = readReplicas(fdir, numName)
+            denReplicas = readReplicas(fdir, denName) if numReplicas is not None else None
+            groups.append((key, binColumns(ROOT, num, den, args.level, numReplicas, denReplicas)))
+            if args.verbose:
+                print(f"{'/'.join(key):70s} {numName} / {denName}")
+        f.Close()
+    if not groups:
+        raise SystemExit(f"No numerator/denominator pairs found in {', '.join(args.rfiles)}")
+
+    n = writeTable(args.output, groups, metadata={"rfiles": args.rfiles, "level": args.level, "date": time.strftime("%Y-%m-%dT%H:%M:%S")})
+    table = EfficiencyTable(args.output)
+    print(f"Wrote {n} efficiencies with {table.read().num_rows} bins to {args.output} in {time.time() - start:.1f} s")
+
+if __name__ == "__main__":
+
+    VERBOSE     = False
+    TRGROOTFILE = "histos_AllTrigNanoAOD.root"
+    LEVEL       = 0.682689492137
+    OUTPUT      = "efficiencies.arrow"
+
+    parser = ArgumentParser(description="Export the trigger efficiencies to an indexed Arrow table")
+    parser.add_argument("-v", "--verbose", dest="verbose", default=VERBOSE, action="store_true", help="Print every exported pair [default: %s]" % (VERBOSE))
+    parser.add_argument("--rfile", dest="rfiles", type=str, nargs="+", default=[TRGROOTFILE], help="ROOT files containing the denominators and numerators, with the had, MET and/or PF HT directories [default: %s]" % (TRGROOTFILE))
+    parser.add_argument("--level", dest="level", type=float, action="store", default=LEVEL, help="Confidence level of the Clopper-Pearson intervals [default: %s]" % (LEVEL))
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=OUTPUT, help="Output Arrow IPC file [default: %s]" % (OUTPUT))
+
+    args = parser.parse_args()
+    main(args)
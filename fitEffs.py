@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+'''
+DESCRIPTION:
+Fit the turn-on curves of all numerator/denominator pairs of the had, MET and
+PF HT efficiency histograms in one batched binomial likelihood fit, write the
+fitted parameters, covariances and the 50/95/99% points to a JSON file, and
+derive the AK8 jet plateau cuts used by the next pass of getEffsAK8.py.
+
+'''
+#================
+# Import modules
+#================
+import json
+import math
+import time
+import numpy as np
+from argparse import ArgumentParser
+from helpers.turnon import MODELS, PARAMETERS, fitTurnOns, turnOnPoints
+from helpers.utils import importROOT
+
+# Denominators of the turn-on curves per directory, as (variable, selection,
+# denominator, prefix of the numerators); every histogram named prefix + label
+# (+ "_" + selection) in the directory is a numerator of the denominator
+SELECTIONS = ["", "plateauMSD", "plateauPt", "plateauMSDPt"]
+CURVES = {"hadTrigAnalyzerNanoAOD": [(var, sel, f"h_AK8_{var}_{sel}" if sel else f"h_AK8_{var}", f"h_AK8_{var}_pass") for var in ["pt", "mSD"] for sel in SELECTIONS],
+          "metTrigAnalyzerNanoAOD": [("met", "", "h_met_pt_all", "h_met_pt_pass")],
+          "pfhtTrigAnalyzerNanoAOD": [("pfht", "", "h_pfht_all", "h_pfht_pass")],
+          }
+
+# The AK8 plateau cut on each variable comes from the OR of the signal paths
+# with the other variable on its plateau
+PLATEAU_CURVES = {"pt": ("plateauMSD", "passTrgOR"), "mSD": ("plateauPt", "passTrgOR")}
+# Cuts kept for a variable whose turn-on fit did not converge, the plateau_cuts of getEffsAK8.py
+PLATEAU_CUTS = {"mSD": 50., "pt": 480.}
+
+def readCounts(h):
+    n = h.GetNbinsX()
+    axis = h.GetXaxis()
+    return (np.array([axis.GetBinCenter(i) for i in range(1, n + 1)]),
+            np.array([h.GetBinContent(i) for i in range(1, n + 1)]))
+
+def findCurves(f, curves=CURVES):
+    '''
+    (directory, variable, selection, numerator label, numerator, denominator)
+    of all curves in the file, with the denominators of curves.
+    '''
+    found = []
+    for dirName, dens in curves.items():
+        fdir = f.GetDirectory(dirName)
+        if not fdir:
+            continue
+        names = [key.GetName() for key in fdir.GetListOfKeys()]
+        for var, sel, denName, prefix in dens:
+            if denName not in names:
+                continue
+            suffix = f"_{sel}" if sel else ""
+            for name in names:
+                if not name.startswith(prefix) or not name.endswith(suffix) or name.endswith("_bootstrap"):
+                    continue
+                label = name[len(prefix) - len("pass"):len(name) - len(suffix)]
+                if "_plateau" in label or "_vs_" in label:
+                    continue
+                found.append((dirName, var, sel, label, name, denName))
+    return found
+
+def plateauCuts(results, point, level, defaults):
+    '''
+    Plateau cuts of the AK8 jet analysis at the given turn-on level, rounded up to the GeV.
+    '''
+    cuts = dict(defaults)
+    for var, (sel, label) in PLATEAU_CURVES.items():
+        fit = [r for r in results if r["directory"] == "hadTrigAnalyzerNanoAOD" and r["variable"] == var and r["selection"] == sel and r["numerator"] == label]
+        cov = np.array(fit[0]["cov"]) if fit else None
+        if not fit or not fit[0]["converged"] or not np.all(np.isfinite(cov)) or not np.all(np.diag(cov) > 0.):
+            print(f"No converged fit with finite uncertainties of the {var} turn-on, keeping the plateau cut {var} > {cuts[var]}")
+            continue
+        cuts[var] = float(math.ceil(fit[0]["points"][point][0]))
+    return {"hadTrigAnalyzerNanoAOD": cuts, "level": level}
+
+def main(args):
+
+    ROOT = importROOT()
+    f = ROOT.TFile(args.rfile, "READ")
+    curves = findCurves(f)
+    if not curves:
+        raise SystemExit(f"No turn-on curves found in {args.rfile}")
+
+    # Stack all curves, padded with empty bins to the longest one
+    counts = []
+    for dirName, var, sel, label, numName, denName in curves:
+        fdir = f.GetDirectory(dirName)
+        x, n = readCounts(fdir.Get(denName))
+        k = readCounts(fdir.Get(numName))[1]
+        counts.append((x, n, np.minimum(k, n)))
+    nbins = max(len(x) for x, n, k in counts)
+    x, n, k = [np.array([np.pad(c[i], (0, nbins - len(c[i]))) for c in counts]) for i in range(3)]
+
+    start = time.time()
+    fit = fitTurnOns(x, n, k, model=args.model)
+    points, errors = turnOnPoints(fit["params"], fit["cov"], args.levels, model=args.model)
+    print(f"Fitted {len(curves)} turn-on curves ({args.model}) in {time.time() - start:.2f} s, {fit['iterations']} iterations, {fit['converged'].sum()} converged")
+
+    results = []
+    for i, (dirName, var, sel, label, numName, denName) in enumerate(curves):
+        results.append({"directory": dirName, "variable": var, "selection": sel, "numerator": label,
+                        "num": numName, "den": denName,
+                        "params": dict(zip(PARAMETERS, fit["params"][i].tolist())),
+                        "errors": dict(zip(PARAMETERS, np.sqrt(np.maximum(np.diag(fit["cov"][i]), 0.)).tolist())),
+                        "cov": fit["cov"][i].tolist(),
+                        "points": {f"{level:g}": [points[i, j], errors[i, j]] for j, level in enumerate(args.levels)},
+                        "nll": float(fit["nll"][i]),
+                        "deviance": float(fit["deviance"][i]),
+                        "ndf": int(fit["nbins"][i]) - 3,
+                        "converged": bool(fit["converged"][i]),
+                        })
+        if args.verbose:
+            r = results[-1]
+            print("%-24s %-40s plateau %.3f +- %.3f  %s  chi2/ndf %.1f/%d" % (dirName, numName, r["params"]["plateau"], r["errors"]["plateau"],
+                  "  ".join(f"x{float(level) * 100:g} {p:7.1f} +- {e:5.1f}" for level, (p, e) in r["points"].items()), r["deviance"], r["ndf"]))
+
+    with open(args.output, "w") as fout:
+        json.dump({"model": args.model, "levels": args.levels, "rfile": args.rfile, "curves": results}, fout, indent=1)
+    print(f"Wrote the fit results to {args.output}")
+
+    if args.plateauCuts:
+        cuts = plateauCuts(results, f"{args.plateauLevel:g}", args.plateauLevel, PLATEAU_CUTS)
+        with open(args.plateauCuts, "w") as fout:
+            json.dump(cuts, fout, indent=1)
+        print(f"Wrote the plateau cuts {cuts['hadTrigAnalyzerNanoAOD']} to {args.plateauCuts}, use them with --plateau-cuts {args.plateauCuts}")
+
+if __name__ == "__main__":
+
+    VERBOSE       = False
+    TRGROOTFILE   = "histos_AllTrigNanoAOD.root"
+    MODEL         = "erf"
+    LEVELS        = [0.5, 0.95, 0.99]
+    PLATEAULEVEL  = 0.99
+    OUTPUT        = "turnons.json"
+
+    parser = ArgumentParser(description="Fit the trigger turn-on curves and derive the plateau cuts")
+    parser.add_argument("-v", "--verbose", dest="verbose", default=VERBOSE, action="store_true", help="Print the fit result of every curve [default: %s]" % (VERBOSE))
+    parser.add_argument("--rfile", dest="rfile", type=str, action="store", default=TRGROOTFILE, help="ROOT file containing the denominators and numerators, with the had, MET and/or PF HT directories [default: %s]" % (TRGROOTFILE))
+    parser.add_argument("--model", dest="model", type=str, action="store", choices=MODELS, default=MODEL, help="Shape of the turn-on, plateau times a normal CDF (erf) or a logistic function (sigmoid) [default: %s]" % (MODEL))
+    parser.add_argument("--levels", dest="levels", type=float, nargs="+", default=LEVELS, help="Fractions of the plateau at which the turn-on points are given [default: %s]" % (LEVELS))
+    parser.add_argument("--plateau-level", dest="plateauLevel", type=float, action="store", default=PLATEAULEVEL, help="Fraction of the plateau at which the AK8 jet plateau cuts are placed, one of --levels [default: %s]" % (PLATEAULEVEL))
+    parser.add_argument("--plateau-cuts", dest="plateauCuts", type=str, action="store", default=None, help="Write the derived AK8 jet plateau cuts to this JSON file, for --plateau-cuts of getEffsAK8.py and getEffsAll.py [default: not written]")
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=OUTPUT, help="Output JSON file of the fit results [default: %s]" % (OUTPUT))
+
+    args = parser.parse_args()
+    if args.plateauLevel not in args.levels:
+        args.levels.append(args.plateauLevel)
+    main(args)
@@ -5,24 +5,57 @@ ROOT.PyConfig.IgnoreCommandLineOptions = True
 from importlib import import_module
 
 import array
-from helpers.utils import deltaPhi, deltaR
+import numpy as np
+import awkward as ak
+from argparse import ArgumentParser
+from helpers.utils import deltaPhi, deltaR, deltaRArray
+from helpers.selections import looseGlobalMuon
+from helpers.driver import addDriverArgs, checkDriverArgs, jobArgs, dispatchJobs, jobInputs, runEventLoop
+from helpers.triggers import TriggerBits
+from helpers.columnar import asDouble, runColumnar
+from helpers.histograms import Axis, HistBook, EfficiencySpec
+from helpers.runstore import storePath, writeBookStore
+from helpers.lumimask import LumiMask, LumiFilter
+from helpers.turnon import readPlateauCuts
+from helpers.profiling import StageTimer, NullTimer
+from helpers.sketch import SketchBook, sketchPath, readBinning
 
 #importing tools from nanoAOD processing set up to store the ratio histograms in a root file
-from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection, Object
 from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
 
 class TrigHadAnalysis(Module):
-    def __init__(self):
+    def __init__(self, hltBitsCache=None, runPartials=None, bootstrap=0, plateauCuts=None, profile=False, sparse=False, sketch=False, binning=None):
         self.writeHistFile=True
+        self.runPartials=runPartials
+        self.bootstrap=bootstrap
+        # Book the sparse pt x mSD x eta x PV histograms of the denominator and numerators
+        self.sparse=sparse
+        # Sketches of the observables for deriveBinning.py, and bin edges replacing the default ones
+        self.sketch=sketch
+        self.binEdges=binning or {}
+        # Lower cuts on the leading AK8 jet that define the plateau selections, e.g. from fitEffs.py
+        self.plateauCuts=dict(plateau_cuts, **(plateauCuts or {}))
         self.reference_paths=reference_paths
         self.signal_paths=signal_paths
+        self.trigBits=TriggerBits(reference_paths, signal_paths, cacheDir=hltBitsCache)
+        # Stage timers and cut flow of analyze(), a no-op NullTimer unless profiling
+        self.timer=StageTimer("TrigHadAnalysis", ["all", "referenceTrigger", "muon", "nonOverlappingJet", "plateauMSD", "plateauPt", "plateauMSDPt"]) if profile else NullTimer()
         
+    def requiredBranches(self):
+        # Branches read in analyze() and analyzeChunk(), used to prune the input branches
+        branches  = self.trigBits.branches()
+        branches += looseGlobalMuon.branches() + ["Muon_phi", "nFatJet"]
+        branches += [f"FatJet_{v}" for v in ["pt", "eta", "phi", "msoftdrop", "muonIdx3SJ"]]
+        branches += ["run", "luminosityBlock"] if self.runPartials or self.bootstrap else []
+        branches += ["event"] if self.bootstrap else []
+        branches += ["PV_npvsGood"] if self.sparse else []
+        return branches
+
     def beginJob(self,histFile=None,histDirName=None):
         Module.beginJob(self,histFile,histDirName)
-
-        self.h_passreftrig = ROOT.TH1F("h_passreftrig" , "; passed ref trigger", 2, 0. , 2.)
-        self.h_dR_AK8_mu = ROOT.TH1F("h_dR_AK8_mu", "; #Delta R(AK8, #mu);Efficiency", 50, 0, 5.0)
+        if self.timer:
+            self.timer.beginJob(histFile, histDirName)
 
         self.labels = {}
         self.labels["pt"] = ';AK8 jet p_{T} [GeV];Efficiency'
@@ -33,77 +66,90 @@ class TrigHadAnalysis(Module):
         self.binning["pt"] = [200, 250, 300, 350, 400, 425, 450, 475, 500, 550, 600, 650, 700, 800, 900, 1000]
         self.binning["mSD"] = [0, 10, 20, 30, 35, 40, 50, 60, 70, 80, 90, 100, 125, 150, 175, 200, 225, 250, 300, 400]
         self.binning["eta"] = [-2.4, -2.2, -2.0, -1.8, -1.6, -1.4, -1.2, -1.0, -0.8, -0.6, -0.4, -0.2, 0.0, 0.2, 0.4, 0.6, 0.8, 1.0, 1.2, 1.4, 1.6, 1.8, 2.0, 2.2, 2.4]
+        self.binning.update(self.binEdges)
         
         self.variables = ["pt", "mSD", "eta"]
         self.nanoVars = {"pt": "pt",
                          "mSD": "msoftdrop",
                          "eta": "eta",
                          "phi": "phi"}
-        
+
+        # Plateau selections on the leading AK8 jet and numerators, bit i of the masks in analyze() is entry i
+        self.selections = ["", "plateauMSD", "plateauPt", "plateauMSDPt"]
+        self.numerators = ["", "passTrgOR"] + [f"pass_HLT_{path}" for path in self.signal_paths]
+
+        axes = {var: Axis(self.binning[var]) for var in self.variables}
+
+        self.book = HistBook(split=self.runPartials, bootstrap=self.bootstrap)
+        self.book.book("h_passreftrig", "; passed ref trigger", Axis(nbins=2, low=0., high=2.))
+        self.book.book("h_dR_AK8_mu", "; #Delta R(AK8, #mu);Efficiency", Axis(nbins=50, low=0, high=5.0))
+        self.book.book('h_AK8_mSD_vs_pt', ';p_{T} [GeV];m_{SD} [GeV];Efficiency', axes["pt"], axes["mSD"])
+        self.book.book('h_AK8_mSD_vs_pt_passTrgOR', ';p_{T} [GeV];m_{SD} [GeV];Efficiency', axes["pt"], axes["mSD"])
+
+        # h_AK8_{var}[_passTrgOR|_pass_HLT_{path}][_{plateau selection}]
+        self.effs = EfficiencySpec("h_AK8", [(var, self.labels[var], axes[var]) for var in self.variables], self.selections, self.numerators)
+        self.effs.book(self.book)
+
+        # h_AK8_sparse[_passTrgOR|_pass_HLT_{path}], projected to any of their axes afterwards with projectSparse.py
+        if self.sparse:
+            self.sparseNames = [self.effs.name("sparse", num) for num in self.numerators]
+            for name in self.sparseNames:
+                self.book.bookSparse(name, ";p_{T} [GeV];m_{SD} [GeV];#eta;PV", [axes[var] for var in self.variables] + [Axis(self.binning["pv"]) if "pv" in self.binning else Axis(nbins=50, low=0, high=100)], self.variables + ["pv"])
+        self.store = (storePath(histFile.GetName(), histDirName), histDirName) if self.runPartials and histFile else None
+        self.sketches = SketchBook(self.variables) if self.sketch else None
+        self.sketchStore = (sketchPath(histFile.GetName(), histDirName), histDirName) if self.sketch and histFile else None
+
+    def endJob(self):
+        if self.store:
+            writeBookStore(*self.store, self.book)
+        if self.sketchStore:
+            self.sketches.write(*self.sketchStore)
+        # Convert the count arrays to histograms and write them
         self.hList = {}
+        for h in self.book.toROOT():
+            self.hList[h.GetName()] = h
+            self.addObject(h)
+        if self.timer:
+            self.addObject(self.timer.cutflowHist())
+            self.timer.report()
+        Module.endJob(self)
 
-        self.hList['h_AK8_mSD_vs_pt']= ROOT.TH2F('h_AK8_mSD_vs_pt', ';p_{T} [GeV];m_{SD} [GeV];Efficiency', len(self.binning["pt"])-1,  array.array("d", self.binning["pt"]), len(self.binning["mSD"])-1, array.array("d", self.binning["mSD"]))
-        self.hList['h_AK8_mSD_vs_pt_passTrgOR'] = ROOT.TH2F('h_AK8_mSD_vs_pt_passTrgOR', ';p_{T} [GeV];m_{SD} [GeV];Efficiency', len(self.binning["pt"])-1, array.array("d", self.binning["pt"]), len(self.binning["mSD"])-1, array.array("d", self.binning["mSD"]))
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.trigBits.beginFile(inputFile.GetName(), inputTree)
 
-        for var in self.variables:
-            self.hList[f'h_AK8_{var}'] = ROOT.TH1F(f'h_AK8_{var}', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            self.hList[f'h_AK8_{var}_plateauMSD'] = ROOT.TH1F(f'h_AK8_{var}_plateauMSD', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            self.hList[f'h_AK8_{var}_plateauPt'] = ROOT.TH1F(f'h_AK8_{var}_plateauPt', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            self.hList[f'h_AK8_{var}_plateauMSDPt'] = ROOT.TH1F(f'h_AK8_{var}_plateauMSDPt', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            
-            self.hList[f'h_AK8_{var}_passTrgOR'] = ROOT.TH1F(f'h_AK8_{var}_passTrgOR', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            self.hList[f'h_AK8_{var}_passTrgOR_plateauMSD'] = ROOT.TH1F(f'h_AK8_{var}_passTrgOR_plateauMSD', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            self.hList[f'h_AK8_{var}_passTrgOR_plateauPt'] = ROOT.TH1F(f'h_AK8_{var}_passTrgOR_plateauPt', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-            self.hList[f'h_AK8_{var}_passTrgOR_plateauMSDPt'] = ROOT.TH1F(f'h_AK8_{var}_passTrgOR_plateauMSDPt', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
+    def analyze(self, event):
+        timer = self.timer
+        timer.passed(0)
+
+        with timer.stage("collections"):
+            muons = Collection(event, "Muon")
+            fatjets = Collection(event, "FatJet")
+            hlt = Object(event, "HLT")
             
-            for path in self.signal_paths:
-                self.hList[f'h_AK8_{var}_pass_HLT_{path}'] = ROOT.TH1F(f'h_AK8_{var}_pass_HLT_{path}', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-                self.hList[f'h_AK8_{var}_pass_HLT_{path}_plateauMSD']=ROOT.TH1F(f'h_AK8_{var}_pass_HLT_{path}_plateauMSD', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-                self.hList[f'h_AK8_{var}_pass_HLT_{path}_plateauPt']=ROOT.TH1F(f'h_AK8_{var}_pass_HLT_{path}_plateauPt', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-                self.hList[f'h_AK8_{var}_pass_HLT_{path}_plateauMSDPt']=ROOT.TH1F(f'h_AK8_{var}_pass_HLT_{path}_plateauMSDPt', self.labels[var], len(self.binning[var])-1, array.array("d", self.binning[var]))
-                
-        self.addObject(self.h_passreftrig)
-        self.addObject(self.h_dR_AK8_mu)
-        for h in self.hList:
-            self.addObject(self.hList[h])
+            if self.runPartials or self.bootstrap:
+                self.book.setEvent(event.run, event.luminosityBlock, event.event)
 
-    def analyze(self, event):
+        with timer.stage("triggerBits"):
+            # Decisions of all reference and signal paths, packed once per event
+            trigBits = self.trigBits.eventBits(event, hlt)
 
-        muons = Collection(event, "Muon")
-        fatjets = Collection(event, "FatJet")
-        hlt = Object(event, "HLT")
-        
-        # Check if event passes the reference trigger(s)
-        refAccept=False
-        for path in self.reference_paths:
-            bit = getattr(hlt, path)
-            if bit:
-                refAccept = True
+            # Check if event passes the reference trigger(s)
+            refAccept = bool(trigBits & self.trigBits.referenceMask)
 
         # Save the bit of reference trigger and skim event
-        self.h_passreftrig.Fill(refAccept)
+        with timer.stage("fills"):
+            self.book.fill("h_passreftrig", refAccept)
         if not refAccept:
             return False
+        timer.passed(1)
 
         # Add any offline selection here:
-        selected_muon = []
-        for mu in muons:
-            if not mu.isGlobal:
-                continue
-            if mu.pt < 26:
-                continue
-            if abs(mu.eta) > 2.5:
-                continue
-            if abs(mu.dz) > 0.10:
-                continue
-            if abs(mu.dxy) > 0.05:
-                continue
-            if not abs(mu.looseId):
-                continue
-            selected_muon.append(mu)
+        with timer.stage("muonSelection"):
+            selected_muon = looseGlobalMuon.select(event, muons)
         
         if len(selected_muon) == 0:
             return False
+        timer.passed(2)
 
         #print("\n")
         #print("Selected muons: ", len(selected_muon))
@@ -111,69 +157,138 @@ class TrigHadAnalysis(Module):
         #    print("muon ", muIdx, "   pt=", muon.pt, "   eta=", muon.eta, "   phi=", muon.phi)
         #print("Selected fatjets : ", len(fatjets))
 
-        non_overlap_fatjets = []
-        for fIdx, fatjet in enumerate(fatjets):
-            # skip if fatjet overlaps with a muon
-            if (fatjet.muonIdx3SJ != -1):
-                dR = deltaR(fatjet.eta, fatjet.phi, muons[fatjet.muonIdx3SJ].eta, muons[fatjet.muonIdx3SJ].phi)
-                self.h_dR_AK8_mu.Fill(dR)
-            else:
-                non_overlap_fatjets.append(fatjet)
+        with timer.stage("overlapRemoval"):
+            non_overlap_fatjets = []
+            for fIdx, fatjet in enumerate(fatjets):
+                # skip if fatjet overlaps with a muon
+                if (fatjet.muonIdx3SJ != -1):
+                    dR = deltaR(fatjet.eta, fatjet.phi, muons[fatjet.muonIdx3SJ].eta, muons[fatjet.muonIdx3SJ].phi)
+                    self.book.fill("h_dR_AK8_mu", dR)
+                else:
+                    non_overlap_fatjets.append(fatjet)
 
         if len(non_overlap_fatjets) == 0:
             return False
-        sorted_fatjets = sorted(non_overlap_fatjets, key=lambda x: x.pt, reverse=True)
+        timer.passed(3)
+        with timer.stage("sorting"):
+            sorted_fatjets = sorted(non_overlap_fatjets, key=lambda x: x.pt, reverse=True)
+
+        with timer.stage("fills"):
+            leading = sorted_fatjets[0]
+            self.book.fill('h_AK8_mSD_vs_pt', leading.pt, leading.msoftdrop)
 
-        # Fill numerator
-        for var in self.variables:
-            self.hList[f'h_AK8_{var}'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-        self.hList['h_AK8_mSD_vs_pt'].Fill(sorted_fatjets[0].pt, sorted_fatjets[0].msoftdrop)
+            # Denominator and the numerators of the OR and of every signal path
+            numBits = 1 | (self.trigBits.signalBits(trigBits) << 2)
+            if numBits > 1:
+                numBits |= 2
+                self.book.fill('h_AK8_mSD_vs_pt_passTrgOR', leading.pt, leading.msoftdrop)
 
-        signalOR = False
-        for path in self.signal_paths:
-            if getattr(hlt, path) == 1:
-                signalOR = True
+            # Require the AK8 jet to be on the plateau of the soft-drop mass, of the pT, or of both legs:
+            plateauMSD = leading.msoftdrop > self.plateauCuts["mSD"]
+            plateauPt = leading.pt > self.plateauCuts["pt"]
+            selBits = 1 | (plateauMSD << 1) | (plateauPt << 2) | ((plateauMSD and plateauPt) << 3)
+
+            self.effs.record([getattr(leading, self.nanoVars[var]) for var in self.variables], selBits, numBits)
+            if self.sparse:
+                values = [getattr(leading, self.nanoVars[var]) for var in self.variables] + [Object(event, "PV").npvsGood]
+                for i, name in enumerate(self.sparseNames):
+                    if numBits >> i & 1:
+                        self.book.fillSparse(name, *values)
+            if self.sketches:
                 for var in self.variables:
-                    self.hList[f'h_AK8_{var}_pass_HLT_{path}'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-        
-        if signalOR:
-            self.hList['h_AK8_mSD_vs_pt_passTrgOR'].Fill(sorted_fatjets[0].pt, sorted_fatjets[0].msoftdrop)
-            for var in self.variables:
-                self.hList[f'h_AK8_{var}_passTrgOR'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
+                    self.sketches.fill(var, getattr(leading, self.nanoVars[var]), numBits & 2)
+        if timer:
+            for i in range(1, 4):
+                if selBits >> i & 1:
+                    timer.passed(3 + i)
 
-        # Require the AK8 jet to be on the plateau of the soft-drop mass:
-        if sorted_fatjets[0].msoftdrop > 50:
-            for var in self.variables:
-                self.hList[f'h_AK8_{var}_plateauMSD'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                if signalOR:
-                    self.hList[f'h_AK8_{var}_passTrgOR_plateauMSD'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                for path in self.signal_paths:
-                    if getattr(hlt, path) == 1:
-                        self.hList[f'h_AK8_{var}_pass_HLT_{path}_plateauMSD'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-
-        # Requre the AK8 jet to be on the plateau of the pT:
-        if sorted_fatjets[0].pt > 480:
-            for var in self.variables:
-                self.hList[f'h_AK8_{var}_plateauPt'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                if signalOR:
-                    self.hList[f'h_AK8_{var}_passTrgOR_plateauPt'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                for path in self.signal_paths:
-                    if getattr(hlt, path) == 1:
-                        self.hList[f'h_AK8_{var}_pass_HLT_{path}_plateauPt'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                
-        # Require the AK8 jet to be on the plateau of both legs:
-        if sorted_fatjets[0].pt > 480 and sorted_fatjets[0].msoftdrop > 50:
+        return True
+
+    def analyzeChunk(self, events):
+        '''
+        Columnar version of the preselection and analyze() for a chunk of events.
+        Every cut is written as the negation of the corresponding "continue"
+        in analyze() and evaluated in double precision, so that the filled
+        histograms are identical bin-for-bin to the per-event loop.
+        '''
+        timer = self.timer
+
+        with timer.stage("triggerBits"):
+            # Reference trigger(s) and the FatJet part of the preselection string
+            trigBits = self.trigBits.fromArrays(events)
+            refAccept = (trigBits & self.trigBits.referenceMask) != 0
+            fj_pt  = asDouble(events.FatJet_pt)
+            fj_eta = asDouble(events.FatJet_eta)
+            presel = refAccept & ak.to_numpy(ak.sum((fj_pt > 200) & (abs(fj_eta) < 2.5), axis=1) > 0)
+
+            # Run keys and bootstrap ids of the events, looked up through their position in the chunk
+            if self.runPartials or self.bootstrap:
+                self.book.setChunk(ak.to_numpy(events.run), ak.to_numpy(events.luminosityBlock), ak.to_numpy(events.event))
+            index = np.arange(len(events))
+
+            events, trigBits, index = events[presel], trigBits[presel], index[presel]
+        with timer.stage("fills"):
+            self.book.fillArray("h_passreftrig", refAccept[presel], index=index)
+        # The preselection string is applied by the event loop before analyze()
+        timer.passed(0, len(events))
+        timer.passed(1, int(refAccept[presel].sum()))
+
+        # Offline muon selection
+        with timer.stage("muonSelection"):
+            mu_sel = looseGlobalMuon.arrayMask(events)
+            hasMuon = ak.to_numpy(ak.any(mu_sel, axis=1))
+            events, trigBits, index = events[hasMuon], trigBits[hasMuon], index[hasMuon]
+        timer.passed(2, len(events))
+
+        # Overlap removal with the muon matched to the AK8 subjets
+        with timer.stage("overlapRemoval"):
+            fj_eta = asDouble(events.FatJet_eta)
+            fj_phi = asDouble(events.FatJet_phi)
+            muIdx  = events.FatJet_muonIdx3SJ
+            overlap = muIdx != -1
+            matched = muIdx[overlap]
+            dR = deltaRArray(ak.to_numpy(ak.flatten(fj_eta[overlap])), ak.to_numpy(ak.flatten(fj_phi[overlap])),
+                             ak.to_numpy(ak.flatten(asDouble(events.Muon_eta)[matched])), ak.to_numpy(ak.flatten(asDouble(events.Muon_phi)[matched])))
+            self.book.fillArray("h_dR_AK8_mu", dR, index=np.repeat(index, ak.to_numpy(ak.sum(overlap, axis=1))))
+
+            clean = ~overlap
+            hasJet = ak.to_numpy(ak.num(events.FatJet_pt[clean]) > 0)
+            events, clean, trigBits, index = events[hasJet], clean[hasJet], trigBits[hasJet], index[hasJet]
+        timer.passed(3, len(events))
+
+        # Leading non-overlapping AK8 jet (argmax keeps the first of equal pTs, as the stable sort does)
+        with timer.stage("sorting"):
+            lead = ak.argmax(events.FatJet_pt[clean], axis=1, keepdims=True)
+            leading = {}
             for var in self.variables:
-                self.hList[f'h_AK8_{var}_plateauMSDPt'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                if signalOR:
-                    self.hList[f'h_AK8_{var}_passTrgOR_plateauMSDPt'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
-                for path in self.signal_paths:
-                    if getattr(hlt, path) == 1:
-                        self.hList[f'h_AK8_{var}_pass_HLT_{path}_plateauMSDPt'].Fill(getattr(sorted_fatjets[0], self.nanoVars[var]))
+                leading[var] = ak.to_numpy(ak.flatten(asDouble(events[f"FatJet_{self.nanoVars[var]}"][clean][lead])))
 
-        return True
+        with timer.stage("fills"):
+            fired = [(trigBits & self.trigBits.bit[path]) != 0 for path in self.signal_paths]
+            signalOR = (trigBits & self.trigBits.signalMask) != 0
+
+            self.book.fillArray('h_AK8_mSD_vs_pt', leading["pt"], leading["mSD"], index=index)
+            self.book.fillArray('h_AK8_mSD_vs_pt_passTrgOR', leading["pt"][signalOR], leading["mSD"][signalOR], index=index[signalOR])
+
+            plateauMSD = leading["mSD"] > self.plateauCuts["mSD"]
+            plateauPt = leading["pt"] > self.plateauCuts["pt"]
+            selMasks = [np.ones(len(events), dtype=bool), plateauMSD, plateauPt, plateauMSD & plateauPt]
+            numMasks = [np.ones(len(events), dtype=bool), signalOR] + fired
+            self.effs.recordArrays([leading[var] for var in self.variables], selMasks, numMasks, index=index)
+            if self.sparse:
+                values = [leading[var] for var in self.variables] + [ak.to_numpy(events.PV_npvsGood).astype(np.float64)]
+                for name, mask in zip(self.sparseNames, numMasks):
+                    self.book.fillSparseArrays(name, *[x[mask] for x in values])
+            if self.sketches:
+                for var in self.variables:
+                    self.sketches.fillArray(var, leading[var], signalOR)
+        if timer:
+            for i in range(1, 4):
+                timer.passed(3 + i, int(selMasks[i].sum()))
 
-preselection="(HLT_Mu50 == 1 || HLT_IsoMu24 == 1) && (Sum$(FatJet_pt > 200 && abs(FatJet_eta)<2.5) > 0)"
+reference_cut="(HLT_Mu50 == 1 || HLT_IsoMu24 == 1)"
+module_cut="(Sum$(FatJet_pt > 200 && abs(FatJet_eta)<2.5) > 0)"
+preselection=f"{reference_cut} && {module_cut}"
 files=[
     "/eos/cms/store/group/dpg_trigger/comm_trigger/TriggerStudiesGroup/STEAM/hlt_tutorial/Muon2023C/03db0efb-09c4-4f94-b341-52e2e0947da5.root",
     "/eos/cms/store/group/dpg_trigger/comm_trigger/TriggerStudiesGroup/STEAM/hlt_tutorial/Muon2023C/0b30c7f6-0508-4a5e-9018-c9c95cd0b3bf.root",
@@ -281,5 +396,35 @@ signal_paths    = ["AK8PFJet420_MassSD30",
                    "PFHT1050",
                    ]
 
-p=PostProcessor(".",files,cut=preselection,branchsel=None,modules=[TrigHadAnalysis()],noOut=True,histFileName="histos_HadTrigNanoAOD.root",histDirName="hadTrigAnalyzerNanoAOD")
-p.run()
+# Default plateau cuts in GeV, overridden with --plateau-cuts
+plateau_cuts    = {"mSD": 50., "pt": 480.}
+
+if __name__ == "__main__":
+
+    HISTFILE = "histos_HadTrigNanoAOD.root"
+    HISTDIR  = "hadTrigAnalyzerNanoAOD"
+    STEPSIZE = 100000
+
+    parser = ArgumentParser(description="Fill the numerators and denominators of the AK8 jet trigger efficiencies")
+    addDriverArgs(parser, files, HISTFILE, stepSize=STEPSIZE)
+    parser.add_argument("--plateau-cuts", dest="plateauCuts", type=str, action="store", default=None, help="JSON file of the plateau cuts on the leading AK8 jet, as written by fitEffs.py [default: %s]" % (plateau_cuts))
+    parser.add_argument("--sparse", dest="sparse", default=False, action="store_true", help="Also fill sparse p_T x m_SD x eta x PV histograms of the denominator and every numerator, written as THnSparseD and projected with projectSparse.py [default: %s]" % (False))
+    args = parser.parse_args()
+    checkDriverArgs(parser, args)
+
+    histArgs  = ["--plateau-cuts", args.plateauCuts] if args.plateauCuts else []
+    histArgs += ["--sparse"] if args.sparse else []
+    histArgs, extraArgs = jobArgs(args, histArgs, ["--columnar", "--step-size", str(args.stepSize)] if args.columnar else [])
+    if not dispatchJobs(__file__, args, histArgs, extraArgs):
+        plateauCuts = readPlateauCuts(args.plateauCuts, HISTDIR) if args.plateauCuts else None
+        binning = readBinning(args.binning, HISTDIR) if args.binning else None
+        module = TrigHadAnalysis(hltBitsCache=args.hltBitsCache, runPartials=args.runPartials, bootstrap=args.bootstrap, plateauCuts=plateauCuts, profile=args.profile,
+                                 sparse=args.sparse, sketch=args.sketch, binning=binning)
+        modules = ([LumiFilter(args.lumiMask)] if args.lumiMask else []) + [module]
+        inputs = jobInputs(modules, args, preselection)
+        if args.columnar:
+            runColumnar(module, inputs, histFileName=args.output, histDirName=HISTDIR, stepSize=args.stepSize,
+                        lumiMask=LumiMask(args.lumiMask) if args.lumiMask else None, memory=int(args.memory * 1024**2) if args.memory else None,
+                        entryRange=args.entryRange)
+        else:
+            runEventLoop(modules, inputs, args, preselection, HISTDIR)
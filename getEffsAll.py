@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+import os, sys
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+from argparse import ArgumentParser
+
+from helpers.driver import addDriverArgs, checkDriverArgs, jobArgs, dispatchJobs, jobInputs, runEventLoop
+from helpers.combined import combine
+from helpers.lumimask import LumiFilter
+from helpers.turnon import readPlateauCuts
+from helpers.engine import EfficiencyEngine, loadSpec
+from helpers.sketch import readBinning
+
+import getEffsMET
+import getEffsPFHT
+import getEffsAK8
+
+# All three analyses share the reference trigger selection, which is applied once
+# as the PostProcessor preselection. The rest of each analysis' preselection is
+# evaluated per module on the events passing it.
+preselection = getEffsAK8.reference_cut
+files = getEffsAK8.files
+
+def getAnalyses(hltBitsCache=None, runPartials=None, bootstrap=0, plateauCuts=None, profile=False, sparse=False, sketch=False, binningFile=None):
+    binning = {d: readBinning(binningFile, d) if binningFile else None for d in ["metTrigAnalyzerNanoAOD", "pfhtTrigAnalyzerNanoAOD", "hadTrigAnalyzerNanoAOD"]}
+    return combine([(getEffsMET.TrigMETAnalysis(hltBitsCache, runPartials, bootstrap, profile, sketch, binning["metTrigAnalyzerNanoAOD"]), "metTrigAnalyzerNanoAOD", getEffsMET.module_cut),
+                    (getEffsPFHT.TrigPFHTAnalysis(hltBitsCache, runPartials, bootstrap, profile, sketch, binning["pfhtTrigAnalyzerNanoAOD"]), "pfhtTrigAnalyzerNanoAOD", getEffsPFHT.module_cut),
+                    (getEffsAK8.TrigHadAnalysis(hltBitsCache, runPartials, bootstrap, plateauCuts, profile, sparse, sketch, binning["hadTrigAnalyzerNanoAOD"]), "hadTrigAnalyzerNanoAOD", getEffsAK8.module_cut),
+                    ])
+
+if __name__ == "__main__":
+
+    HISTFILE = "histos_AllTrigNanoAOD.root"
+
+    parser = ArgumentParser(description="Fill the MET, PF HT and AK8 jet trigger efficiency histograms in a single pass over the input files")
+    addDriverArgs(parser, files, HISTFILE, combined=True)
+    parser.add_argument("--plateau-cuts", dest="plateauCuts", type=str, action="store", default=None, help="JSON file of the plateau cuts of the AK8 jet analysis, as written by fitEffs.py [default: %s]" % (getEffsAK8.plateau_cuts))
+    parser.add_argument("--sparse", dest="sparse", default=False, action="store_true", help="Also fill sparse p_T x m_SD x eta x PV histograms of the AK8 jet denominator and numerators, written as THnSparseD and projected with projectSparse.py [default: %s]" % (False))
+    parser.add_argument("--config", dest="config", type=str, action="store", default=None, help="YAML or TOML spec of the analyses (e.g. configs/efficiencies.yaml), run by the configurable efficiency engine instead of the MET, PF HT and AK8 modules [default: the modules]")
+    args = parser.parse_args()
+    checkDriverArgs(parser, args)
+    if args.sparse and args.config:
+        parser.error("--sparse fills the histograms of the AK8 jet module, it cannot be used with --config")
+
+    histArgs  = ["--plateau-cuts", args.plateauCuts] if args.plateauCuts else []
+    histArgs += ["--config", args.config] if args.config else []
+    histArgs += ["--sparse"] if args.sparse else []
+
+    # A spec brings its own preselection and, optionally, input files
+    spec = loadSpec(args.config) if args.config else None
+    if spec:
+        preselection = spec.get("preselection", preselection)
+        if spec.get("files") and args.inputs is files:
+            args.inputs = spec["files"]
+
+    histArgs, extraArgs = jobArgs(args, histArgs)
+    if not dispatchJobs(__file__, args, histArgs, extraArgs):
+        plateauCuts = readPlateauCuts(args.plateauCuts, "hadTrigAnalyzerNanoAOD") if args.plateauCuts else None
+        if spec:
+            binning = {name: readBinning(args.binning, name) for name in spec["analyses"]} if args.binning else None
+            analyses = [EfficiencyEngine(spec, args.hltBitsCache, args.runPartials, args.bootstrap, {"hadTrigAnalyzerNanoAOD": plateauCuts} if plateauCuts else None, args.profile, args.sketch, binning)]
+        else:
+            analyses = getAnalyses(args.hltBitsCache, args.runPartials, args.bootstrap, plateauCuts, args.profile, args.sparse, args.sketch, args.binning)
+        modules = ([LumiFilter(args.lumiMask)] if args.lumiMask else []) + analyses
+        runEventLoop(modules, jobInputs(modules, args, preselection), args, preselection, "allTrigAnalyzerNanoAOD")
@@ -5,126 +5,171 @@ ROOT.PyConfig.IgnoreCommandLineOptions = True
 from importlib import import_module
 
 import array
+from argparse import ArgumentParser
 from helpers.utils import deltaPhi, deltaR
+from helpers.selections import tightIsoMuon
+from helpers.driver import addDriverArgs, checkDriverArgs, jobArgs, dispatchJobs, jobInputs, runEventLoop
+from helpers.triggers import TriggerBits
+from helpers.histograms import Axis, HistBook
+from helpers.runstore import storePath, writeBookStore
+from helpers.sketch import SketchBook, sketchPath, readBinning
+from helpers.lumimask import LumiFilter
+from helpers.profiling import StageTimer, NullTimer
 
 #importing tools from nanoAOD processing set up to store the ratio histograms in a root file
-from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection, Object
 from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
 
 class TrigMETAnalysis(Module):
-    def __init__(self):
+    def __init__(self, hltBitsCache=None, runPartials=None, bootstrap=0, profile=False, sketch=False, binning=None):
         self.writeHistFile=True
+        self.runPartials=runPartials
+        self.bootstrap=bootstrap
+        # Sketches of the observables for deriveBinning.py, and bin edges replacing the default ones
+        self.sketch=sketch
+        self.binEdges=binning or {}
         self.reference_paths=reference_paths
         self.signal_paths=signal_paths
+        self.trigBits=TriggerBits(reference_paths, signal_paths, cacheDir=hltBitsCache)
+        # Stage timers and cut flow of analyze(), a no-op NullTimer unless profiling
+        self.timer=StageTimer("TrigMETAnalysis", ["all", "referenceTrigger", "metFilters", "muon", "signalTrigger"]) if profile else NullTimer()
         
+    def requiredBranches(self):
+        # Branches read in analyze(), used to prune the input branches
+        branches  = self.trigBits.branches()
+        branches += [f"Flag_{flag}" for flag in ["goodVertices", "globalSuperTightHalo2016Filter", "HBHENoiseFilter",
+                                                 "HBHENoiseIsoFilter", "EcalDeadCellTriggerPrimitiveFilter", "BadPFMuonFilter",
+                                                 "BadPFMuonDzFilter", "eeBadScFilter", "ecalBadCalibFilter"]]
+        branches += ["MET_pt", "PV_npvsGood", "nJet"]
+        branches += tightIsoMuon.branches()
+        branches += ["run", "luminosityBlock"] if self.runPartials or self.bootstrap else []
+        branches += ["event"] if self.bootstrap else []
+        return branches
+
     def beginJob(self,histFile=None,histDirName=None):
         Module.beginJob(self,histFile,histDirName)
+        if self.timer:
+            self.timer.beginJob(histFile, histDirName)
 
         self.bins = {}
         self.bins["met_pt"] = [100, 120, 140, 160, 180, 200, 220, 240, 260, 280, 300, 350, 400, 450, 500, 600]
-        
-        self.h_passreftrig = ROOT.TH1F("h_passreftrig" , "; passed ref trigger", 2, 0. , 2.)
-
-        self.h_met_pt_vs_pv_all = ROOT.TH2F("h_met_pt_vs_pv_all", ";p_{T}^{miss} [GeV];PV;Efficiency", len(self.bins["met_pt"])-1, array.array("d", self.bins["met_pt"]), 50, 0, 100)
-        self.h_met_pt_vs_pv_passed = ROOT.TH2F("h_met_pt_vs_pv_passed", ";p_{T}^{miss} [GeV];PV;Efficiency", len(self.bins["met_pt"])-1, array.array("d", self.bins["met_pt"]), 50, 0, 100)
-
-        self.h_met_pt_all = ROOT.TH1F("h_met_pt_all", "; p_{T}^{miss} [GeV]", len(self.bins["met_pt"])-1, array.array("d", self.bins["met_pt"]))
-        self.h_pv_all = ROOT.TH1F("h_pv_all", ";primary vertices;Efficiency", 50, 0, 100)
+        self.bins.update(self.binEdges)
+        metAxis = Axis(self.bins["met_pt"])
+        pvAxis = Axis(self.bins["pv"]) if "pv" in self.bins else Axis(nbins=50, low=0, high=100)
 
-        self.h_met_pt_passed = ROOT.TH1F("h_met_pt_passed", "; p_{T}^{miss} [GeV];Efficiency", len(self.bins["met_pt"])-1, array.array("d", self.bins["met_pt"]))
-        self.h_pv_passed = ROOT.TH1F("h_pv_passed", "; primary vertices;Efficiency", 50, 0, 100)
+        self.book = HistBook(split=self.runPartials, bootstrap=self.bootstrap)
+        self.book.book("h_passreftrig", "; passed ref trigger", Axis(nbins=2, low=0., high=2.))
+        self.book.book("h_met_pt_all", "; p_{T}^{miss} [GeV]", metAxis)
+        self.book.book("h_pv_all", ";primary vertices;Efficiency", pvAxis)
+        self.book.book("h_met_pt_passed", "; p_{T}^{miss} [GeV];Efficiency", metAxis)
+        self.book.book("h_pv_passed", "; primary vertices;Efficiency", pvAxis)
+        self.book.book("h_met_pt_vs_pv_all", ";p_{T}^{miss} [GeV];PV;Efficiency", metAxis, pvAxis)
+        self.book.book("h_met_pt_vs_pv_passed", ";p_{T}^{miss} [GeV];PV;Efficiency", metAxis, pvAxis)
+        for path in self.signal_paths:
+            self.book.book(f'h_met_pt_passtrig_HLT_{path}', ";p_{T}^{miss} [GeV]", metAxis)
+            self.book.book(f'h_pv_passtrig_HLT_{path}', ";primary vertices;Efficiency", pvAxis)
+        self.store = (storePath(histFile.GetName(), histDirName), histDirName) if self.runPartials and histFile else None
+        self.sketches = SketchBook(["met_pt", "pv"]) if self.sketch else None
+        self.sketchStore = (sketchPath(histFile.GetName(), histDirName), histDirName) if self.sketch and histFile else None
 
+    def endJob(self):
+        if self.store:
+            writeBookStore(*self.store, self.book)
+        if self.sketchStore:
+            self.sketches.write(*self.sketchStore)
+        # Convert the count arrays to histograms and write them
         self.hList = {}
-        for path in self.signal_paths:
-            self.hList[f'h_met_pt_passtrig_HLT_{path}'] = ROOT.TH1F(f'h_met_pt_passtrig_HLT_{path}', ";p_{T}^{miss} [GeV]", len(self.bins["met_pt"])-1, array.array("d", self.bins["met_pt"]))
-            self.hList[f'h_pv_passtrig_HLT_{path}'] = ROOT.TH1F(f'h_pv_passtrig_HLT_{path}', ";primary vertices;Efficiency", 50, 0, 100)
-
-        self.addObject(self.h_passreftrig)
-        self.addObject(self.h_met_pt_all)
-        self.addObject(self.h_pv_all)
-        self.addObject(self.h_met_pt_passed)
-        self.addObject(self.h_pv_passed)
-        self.addObject(self.h_met_pt_vs_pv_all)
-        self.addObject(self.h_met_pt_vs_pv_passed)
-        for h in self.hList:
-            self.addObject(self.hList[h])
+        for h in self.book.toROOT():
+            self.hList[h.GetName()] = h
+            self.addObject(h)
+        if self.timer:
+            self.addObject(self.timer.cutflowHist())
+            self.timer.report()
+        Module.endJob(self)
+
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.trigBits.beginFile(inputFile.GetName(), inputTree)
 
     def analyze(self, event):
+        timer = self.timer
+        timer.passed(0)
 
-        met = Object(event, "MET")
-        hlt = Object(event, "HLT")
-        pv = Object(event, "PV")
-        muons = Collection(event, "Muon")
-        jets  = Collection(event, "Jet")
+        with timer.stage("collections"):
+            met = Object(event, "MET")
+            hlt = Object(event, "HLT")
+            pv = Object(event, "PV")
+            muons = Collection(event, "Muon")
+            jets  = Collection(event, "Jet")
 
-        # Check if event passes the reference trigger(s)
-        refAccept=False
-        for path in self.reference_paths:
-            bit = getattr(hlt, path)
-            if bit:
-                refAccept = True
+            if self.runPartials or self.bootstrap:
+                self.book.setEvent(event.run, event.luminosityBlock, event.event)
+
+        with timer.stage("triggerBits"):
+            # Decisions of all reference and signal paths, packed once per event
+            trigBits = self.trigBits.eventBits(event, hlt)
+
+            # Check if event passes the reference trigger(s)
+            refAccept = bool(trigBits & self.trigBits.referenceMask)
 
         # Save the bit of reference trigger and skim event
-        self.h_passreftrig.Fill(refAccept)
+        with timer.stage("fills"):
+            self.book.fill("h_passreftrig", refAccept)
         if not refAccept:
             return False
+        timer.passed(1)
         
         # Require events to satisfy noise filters:
-        met_filters = bool(
-            event.Flag_goodVertices and
-            event.Flag_globalSuperTightHalo2016Filter and
-            event.Flag_HBHENoiseFilter and
-            event.Flag_HBHENoiseIsoFilter and
-            event.Flag_EcalDeadCellTriggerPrimitiveFilter and
-            event.Flag_BadPFMuonFilter and
-            event.Flag_BadPFMuonDzFilter and
-            event.Flag_eeBadScFilter and
-            event.Flag_ecalBadCalibFilter
-        )
+        with timer.stage("metFilters"):
+            met_filters = bool(
+                event.Flag_goodVertices and
+                event.Flag_globalSuperTightHalo2016Filter and
+                event.Flag_HBHENoiseFilter and
+                event.Flag_HBHENoiseIsoFilter and
+                event.Flag_EcalDeadCellTriggerPrimitiveFilter and
+                event.Flag_BadPFMuonFilter and
+                event.Flag_BadPFMuonDzFilter and
+                event.Flag_eeBadScFilter and
+                event.Flag_ecalBadCalibFilter
+            )
         if not met_filters:
             return False
+        timer.passed(2)
         
         # Add any offline selection here:
-        selected_muon = []
-        for mu in muons:
-            if mu.pt < 26:
-                continue
-            if abs(mu.eta) > 2.5:
-                continue
-            if abs(mu.dz) > 0.10:
-                continue
-            if abs(mu.dxy) > 0.05:
-                continue
-            if not abs(mu.tightId):
-                continue
-            if mu.pfRelIso03_all > 0.15:
-                continue
-            selected_muon.append(mu)
+        with timer.stage("muonSelection"):
+            selected_muon = tightIsoMuon.select(event, muons)
 
         if len(selected_muon) != 1:
             return False
+        timer.passed(3)
 
-        self.h_met_pt_all.Fill(met.pt)
-        self.h_pv_all.Fill(pv.npvsGood)
-        self.h_met_pt_vs_pv_all.Fill(met.pt, pv.npvsGood)
-        
-        # Check if event passes the signal trigger(s)
-        signalOR = False
-        for path in self.signal_paths:
-            if getattr(hlt, path) == 1:
-                signalOR = True
-                self.hList[f'h_met_pt_passtrig_HLT_{path}'].Fill(met.pt)
-                self.hList[f'h_pv_passtrig_HLT_{path}'].Fill(pv.npvsGood)
-                
+        with timer.stage("fills"):
+            self.book.fill("h_met_pt_all", met.pt)
+            self.book.fill("h_pv_all", pv.npvsGood)
+            self.book.fill("h_met_pt_vs_pv_all", met.pt, pv.npvsGood)
+            
+            # Check if event passes the signal trigger(s)
+            signalOR = bool(trigBits & self.trigBits.signalMask)
+            for path in self.signal_paths:
+                if trigBits & self.trigBits.bit[path]:
+                    self.book.fill(f'h_met_pt_passtrig_HLT_{path}', met.pt)
+                    self.book.fill(f'h_pv_passtrig_HLT_{path}', pv.npvsGood)
+                    
+            if signalOR:
+                self.book.fill("h_met_pt_passed", met.pt)
+                self.book.fill("h_pv_passed", pv.npvsGood)
+                self.book.fill("h_met_pt_vs_pv_passed", met.pt, pv.npvsGood)
+            if self.sketches:
+                self.sketches.fill("met_pt", met.pt, signalOR)
+                self.sketches.fill("pv", pv.npvsGood, signalOR)
         if signalOR:
-            self.h_met_pt_passed.Fill(met.pt)
-            self.h_pv_passed.Fill(pv.npvsGood)
-            self.h_met_pt_vs_pv_passed.Fill(met.pt, pv.npvsGood)
+            timer.passed(4)
         
         return True
 
-preselection="(HLT_Mu50 == 1 || HLT_IsoMu24 == 1) && (Sum$(Muon_pt > 26 && abs(Muon_eta) < 2.5 && Muon_pfRelIso03_all < 0.15 && Muon_tightId) == 1) && (Sum$(Electron_pt > 15 && abs(Electron_eta) < 2.5 && Electron_pfRelIso03_all < 0.15) == 0)"
+reference_cut="(HLT_Mu50 == 1 || HLT_IsoMu24 == 1)"
+module_cut="(Sum$(Muon_pt > 26 && abs(Muon_eta) < 2.5 && Muon_pfRelIso03_all < 0.15 && Muon_tightId) == 1) && (Sum$(Electron_pt > 15 && abs(Electron_eta) < 2.5 && Electron_pfRelIso03_all < 0.15) == 0)"
+preselection=f"{reference_cut} && {module_cut}"
 files=[
     "/eos/cms/store/group/dpg_trigger/comm_trigger/TriggerStudiesGroup/STEAM/hlt_tutorial/Muon2023C/03db0efb-09c4-4f94-b341-52e2e0947da5.root",
     "/eos/cms/store/group/dpg_trigger/comm_trigger/TriggerStudiesGroup/STEAM/hlt_tutorial/Muon2023C/0b30c7f6-0508-4a5e-9018-c9c95cd0b3bf.root",
@@ -229,5 +274,19 @@ signal_paths    = ["PFMET120_PFMHT120_IDTight",
                    "PFMETNoMu120_PFMHTNoMu120_IDTight_FilterHF",
                    ]
 
-p=PostProcessor(".",files,cut=preselection,branchsel=None,modules=[TrigMETAnalysis()],noOut=True,histFileName="histos_METTrigNanoAOD.root",histDirName="metTrigAnalyzerNanoAOD")
-p.run()
+if __name__ == "__main__":
+
+    HISTFILE = "histos_METTrigNanoAOD.root"
+    HISTDIR  = "metTrigAnalyzerNanoAOD"
+
+    parser = ArgumentParser(description="Fill the numerators and denominators of the MET trigger efficiencies")
+    addDriverArgs(parser, files, HISTFILE)
+    args = parser.parse_args()
+    checkDriverArgs(parser, args)
+
+    histArgs, extraArgs = jobArgs(args)
+    if not dispatchJobs(__file__, args, histArgs, extraArgs):
+        binning = readBinning(args.binning, HISTDIR) if args.binning else None
+        module = TrigMETAnalysis(hltBitsCache=args.hltBitsCache, runPartials=args.runPartials, bootstrap=args.bootstrap, profile=args.profile, sketch=args.sketch, binning=binning)
+        modules = ([LumiFilter(args.lumiMask)] if args.lumiMask else []) + [module]
+        runEventLoop(modules, jobInputs(modules, args, preselection), args, preselection, HISTDIR)
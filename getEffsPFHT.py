@@ -5,118 +5,157 @@ ROOT.PyConfig.IgnoreCommandLineOptions = True
 from importlib import import_module
 
 import array
+from argparse import ArgumentParser
 from helpers.utils import deltaPhi, deltaR
+from helpers.selections import tightIsoMuon, pfJetHT
+from helpers.driver import addDriverArgs, checkDriverArgs, jobArgs, dispatchJobs, jobInputs, runEventLoop
+from helpers.triggers import TriggerBits
+from helpers.histograms import Axis, HistBook
+from helpers.runstore import storePath, writeBookStore
+from helpers.sketch import SketchBook, sketchPath, readBinning
+from helpers.lumimask import LumiFilter
+from helpers.profiling import StageTimer, NullTimer
 
 #importing tools from nanoAOD processing set up to store the ratio histograms in a root file
-from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
 from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection, Object
 from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
 
 class TrigPFHTAnalysis(Module):
-    def __init__(self):
+    def __init__(self, hltBitsCache=None, runPartials=None, bootstrap=0, profile=False, sketch=False, binning=None):
         self.writeHistFile=True
+        self.runPartials=runPartials
+        self.bootstrap=bootstrap
+        # Sketches of the observables for deriveBinning.py, and bin edges replacing the default ones
+        self.sketch=sketch
+        self.binEdges=binning or {}
         self.reference_paths=reference_paths
         self.signal_paths=signal_paths
+        self.trigBits=TriggerBits(reference_paths, signal_paths, cacheDir=hltBitsCache)
+        # Stage timers and cut flow of analyze(), a no-op NullTimer unless profiling
+        self.timer=StageTimer("TrigPFHTAnalysis", ["all", "referenceTrigger", "muon", "passedL1", "passedHLT"]) if profile else NullTimer()
         
+    def requiredBranches(self):
+        # Branches read in analyze(), used to prune the input branches
+        branches  = self.trigBits.branches()
+        branches += ["L1_HTT280er", "PV_npvsGood", "nElectron", "Muon_phi"]
+        branches += tightIsoMuon.branches() + pfJetHT.branches()
+        branches += ["run", "luminosityBlock"] if self.runPartials or self.bootstrap else []
+        branches += ["event"] if self.bootstrap else []
+        return branches
+
     def beginJob(self,histFile=None,histDirName=None):
         Module.beginJob(self,histFile,histDirName)
-
-        self.h_passreftrig = ROOT.TH1F("h_passreftrig" , "; passed ref trigger", 2, 0. , 2.)
+        if self.timer:
+            self.timer.beginJob(histFile, histDirName)
 
         self.bins = {}
         self.bins["pfht"] = [200, 220, 240, 260, 280, 300, 350, 400, 450, 500, 600, 700, 800, 900, 1000, 1050, 1100, 1200, 1250, 1300, 1400, 1500]
-        
-        self.h_pfht_vs_pv_all    = ROOT.TH2F("h_pfht_vs_pv_all", ";PF H_{T} [GeV];PV;Efficiency", len(self.bins["pfht"])-1, array.array("d", self.bins["pfht"]), 50, 0, 100)
-        self.h_pfht_vs_pv_passed = ROOT.TH2F("h_pfht_vs_pv_passed", ";PF H_{T} [GeV];PV;Efficiency", len(self.bins["pfht"])-1, array.array("d", self.bins["pfht"]), 50, 0, 100)
-                
-        self.h_pv_all = ROOT.TH1F("h_pv_all", ";primary vertices;Efficiency", 50, 0, 100)
-        self.h_pv_passedL1 = ROOT.TH1F("h_pv_passedL1", ";primary vertices;Efficiency", 50, 0, 100)
-        self.h_pv_passedHLT = ROOT.TH1F("h_pv_passedHLT", ";primary vertices;Efficiency", 50, 0, 100)
-        
-        self.h_pfht_all = ROOT.TH1F("h_pfht_all", ";PF H_{T} [GeV];Efficiency", len(self.bins["pfht"])-1, array.array("d", self.bins["pfht"]))
-        self.h_pfht_passedL1 = ROOT.TH1F("h_pfht_passedL1", ";PF H_{T} [GeV];Efficiency", len(self.bins["pfht"])-1, array.array("d", self.bins["pfht"]))
-        self.h_pfht_passedHLT = ROOT.TH1F("h_pfht_passedHLT", ";PF H_{T} [GeV];Efficiency", len(self.bins["pfht"])-1, array.array("d", self.bins["pfht"]))
-        
-        self.addObject(self.h_passreftrig)
-        self.addObject(self.h_pfht_all)
-        self.addObject(self.h_pfht_passedL1)
-        self.addObject(self.h_pfht_passedHLT)
-        
-        self.addObject(self.h_pv_all)
-        self.addObject(self.h_pv_passedL1)
-        self.addObject(self.h_pv_passedHLT)
+        self.bins.update(self.binEdges)
+        htAxis = Axis(self.bins["pfht"])
+        pvAxis = Axis(self.bins["pv"]) if "pv" in self.bins else Axis(nbins=50, low=0, high=100)
+
+        self.book = HistBook(split=self.runPartials, bootstrap=self.bootstrap)
+        self.book.book("h_passreftrig", "; passed ref trigger", Axis(nbins=2, low=0., high=2.))
+        self.book.book("h_pfht_all", ";PF H_{T} [GeV];Efficiency", htAxis)
+        self.book.book("h_pfht_passedL1", ";PF H_{T} [GeV];Efficiency", htAxis)
+        self.book.book("h_pfht_passedHLT", ";PF H_{T} [GeV];Efficiency", htAxis)
+        self.book.book("h_pv_all", ";primary vertices;Efficiency", pvAxis)
+        self.book.book("h_pv_passedL1", ";primary vertices;Efficiency", pvAxis)
+        self.book.book("h_pv_passedHLT", ";primary vertices;Efficiency", pvAxis)
+        self.book.book("h_pfht_vs_pv_all", ";PF H_{T} [GeV];PV;Efficiency", htAxis, pvAxis)
+        self.book.book("h_pfht_vs_pv_passed", ";PF H_{T} [GeV];PV;Efficiency", htAxis, pvAxis)
+        self.store = (storePath(histFile.GetName(), histDirName), histDirName) if self.runPartials and histFile else None
+        self.sketches = SketchBook(["pfht", "pv"]) if self.sketch else None
+        self.sketchStore = (sketchPath(histFile.GetName(), histDirName), histDirName) if self.sketch and histFile else None
+
+    def endJob(self):
+        if self.store:
+            writeBookStore(*self.store, self.book)
+        if self.sketchStore:
+            self.sketches.write(*self.sketchStore)
+        # Convert the count arrays to histograms and write them
+        self.hList = {}
+        for h in self.book.toROOT():
+            self.hList[h.GetName()] = h
+            self.addObject(h)
+        if self.timer:
+            self.addObject(self.timer.cutflowHist())
+            self.timer.report()
+        Module.endJob(self)
 
-        self.addObject(self.h_pfht_vs_pv_all)
-        self.addObject(self.h_pfht_vs_pv_passed)
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.trigBits.beginFile(inputFile.GetName(), inputTree)
 
     def analyze(self, event):
+        timer = self.timer
+        timer.passed(0)
 
-        hlt = Object(event, "HLT")
-        l1 = Object(event, "L1")
-        pv = Object(event, "PV")
-        
-        electrons = Collection(event, "Electron")
-        muons = Collection(event, "Muon")
-        jets  = Collection(event, "Jet")
+        with timer.stage("collections"):
+            hlt = Object(event, "HLT")
+            l1 = Object(event, "L1")
+            pv = Object(event, "PV")
+            
+            electrons = Collection(event, "Electron")
+            muons = Collection(event, "Muon")
+
+            if self.runPartials or self.bootstrap:
+                self.book.setEvent(event.run, event.luminosityBlock, event.event)
+
+        with timer.stage("triggerBits"):
+            # Decisions of all reference and signal paths, packed once per event
+            trigBits = self.trigBits.eventBits(event, hlt)
 
-        # Check if event passes the reference trigger(s)
-        refAccept=False
-        for path in self.reference_paths:
-            bit = getattr(hlt, path)
-            if bit:
-                refAccept = True
+            # Check if event passes the reference trigger(s)
+            refAccept = bool(trigBits & self.trigBits.referenceMask)
 
         # Save the bit of reference trigger and skim event
-        self.h_passreftrig.Fill(refAccept)
+        with timer.stage("fills"):
+            self.book.fill("h_passreftrig", refAccept)
         if not refAccept:
             return False
+        timer.passed(1)
 
         # Add any offline selection here:
-        selected_muon = []
-        for mu in muons:
-            if mu.pt < 26:
-                continue
-            if abs(mu.eta) > 2.5:
-                continue
-            if abs(mu.dz) > 0.10:
-                continue
-            if abs(mu.dxy) > 0.05:
-                continue
-            if not abs(mu.tightId):
-                continue
-            if mu.pfRelIso03_all > 0.15:
-                continue
-            selected_muon.append(mu)
+        with timer.stage("muonSelection"):
+            selected_muon = tightIsoMuon.select(event, muons)
 
         if len(selected_muon) != 1:
             return False
+        timer.passed(2)
 
-        event_pfht = 0.0
-        for jet in jets:
-            if not (jet.pt >= 30.0 and abs(jet.eta) < 2.5 and (jet.jetId & 4)):
-                continue
-            dR = deltaR(jet.eta, jet.phi, selected_muon[0].eta, selected_muon[0].phi)
-            if dR < 0.4:
-                continue
-            event_pfht += jet.pt
+        # HT of the jets with pT >= 30 GeV, |eta| < 2.5 and tight ID that are not within 0.4 of the muon
+        with timer.stage("jetHT"):
+            event_pfht = pfJetHT.compute(event, selected_muon[0])
 
-        self.h_pfht_all.Fill(event_pfht)
-        self.h_pfht_vs_pv_all.Fill(event_pfht, pv.npvsGood)
+        passedL1 = l1.HTT280er == 1
+        passedHLT = bool(trigBits & self.trigBits.bit["PFHT1050"])
+        with timer.stage("fills"):
+            self.book.fill("h_pfht_all", event_pfht)
+            self.book.fill("h_pfht_vs_pv_all", event_pfht, pv.npvsGood)
 
-        self.h_pv_all.Fill(pv.npvsGood)
+            self.book.fill("h_pv_all", pv.npvsGood)
+                    
+            if passedL1:
+                self.book.fill("h_pfht_passedL1", event_pfht)
+                self.book.fill("h_pv_passedL1", pv.npvsGood)
                 
-        if l1.HTT280er == 1:
-            self.h_pfht_passedL1.Fill(event_pfht)
-            self.h_pv_passedL1.Fill(pv.npvsGood)
-            
-        if hlt.PFHT1050 == 1:
-            self.h_pfht_passedHLT.Fill(event_pfht)
-            self.h_pv_passedHLT.Fill(pv.npvsGood)
-            self.h_pfht_vs_pv_passed.Fill(event_pfht, pv.npvsGood)
+            if passedHLT:
+                self.book.fill("h_pfht_passedHLT", event_pfht)
+                self.book.fill("h_pv_passedHLT", pv.npvsGood)
+                self.book.fill("h_pfht_vs_pv_passed", event_pfht, pv.npvsGood)
+            if self.sketches:
+                self.sketches.fill("pfht", event_pfht, passedHLT)
+                self.sketches.fill("pv", pv.npvsGood, passedHLT)
+        if passedL1:
+            timer.passed(3)
+        if passedHLT:
+            timer.passed(4)
             
         return True
 
-preselection="(HLT_Mu50 == 1 || HLT_IsoMu24 == 1)"
+reference_cut="(HLT_Mu50 == 1 || HLT_IsoMu24 == 1)"
+module_cut=None
+preselection=reference_cut
 files=[
     "/eos/cms/store/group/dpg_trigger/comm_trigger/TriggerStudiesGroup/STEAM/hlt_tutorial/Muon2023C/03db0efb-09c4-4f94-b341-52e2e0947da5.root",
     "/eos/cms/store/group/dpg_trigger/comm_trigger/TriggerStudiesGroup/STEAM/hlt_tutorial/Muon2023C/0b30c7f6-0508-4a5e-9018-c9c95cd0b3bf.root",
@@ -218,5 +257,19 @@ files=[
 reference_paths = ["Mu50", "IsoMu24"]
 signal_paths    = ["PFHT1050"]
 
-p=PostProcessor(".",files,cut=preselection,branchsel=None,modules=[TrigPFHTAnalysis()],noOut=True,histFileName="histos_PFHTTrigNanoAOD.root",histDirName="pfhtTrigAnalyzerNanoAOD")
-p.run()
+if __name__ == "__main__":
+
+    HISTFILE = "histos_PFHTTrigNanoAOD.root"
+    HISTDIR  = "pfhtTrigAnalyzerNanoAOD"
+
+    parser = ArgumentParser(description="Fill the numerators and denominators of the PF HT trigger efficiencies")
+    addDriverArgs(parser, files, HISTFILE)
+    args = parser.parse_args()
+    checkDriverArgs(parser, args)
+
+    histArgs, extraArgs = jobArgs(args)
+    if not dispatchJobs(__file__, args, histArgs, extraArgs):
+        binning = readBinning(args.binning, HISTDIR) if args.binning else None
+        module = TrigPFHTAnalysis(hltBitsCache=args.hltBitsCache, runPartials=args.runPartials, bootstrap=args.bootstrap, profile=args.profile, sketch=args.sketch, binning=binning)
+        modules = ([LumiFilter(args.lumiMask)] if args.lumiMask else []) + [module]
+        runEventLoop(modules, jobInputs(modules, args, preselection), args, preselection, HISTDIR)
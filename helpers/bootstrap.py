@@ -0,0 +1,118 @@
+import math
+import numpy as np
+
+from helpers.utils import importROOT
+
+# Poisson bootstrap of the histograms: every event enters each of N replicas
+# of every histogram with a weight drawn from a Poisson distribution of mean 1.
+# The weights of an event are a hash of its run, lumi block and event number,
+# so the same event gets the same weights in all histograms (keeping the
+# correlation between e.g. the OR and the single-path numerators), in the
+# per-event and the columnar loop, and in every parallel job. The replicas
+# are kept as (replicas x bins) count arrays, so their size does not depend
+# on the number of events, and are written as TH2D next to each histogram.
+
+SUFFIX = "_bootstrap"
+
+# Cumulative Poisson(1) probabilities, and the weight for each 16-bit uniform
+# number: every 64-bit hash gives the weights of four replicas by table lookup
+POISSON_CDF = np.cumsum([math.exp(-1.) / math.factorial(k) for k in range(16)])
+POISSON_TABLE = np.searchsorted(POISSON_CDF, (np.arange(2**16) + 0.5) / 2**16, side="right").astype(np.uint8)
+
+def splitmix64(x):
+    '''
+    SplitMix64 finalizer of a uint64 array, a cheap hash with good mixing.
+    '''
+    z = np.asarray(x, dtype=np.uint64) + np.uint64(0x9E3779B97F4A7C15)
+    z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return z ^ (z >> np.uint64(31))
+
+class Bootstrap:
+    def __init__(self, nReplicas, seed=0, maxCells=2**21):
+        if not 0 < nReplicas < 65536:
+            raise ValueError(f"Cannot make {nReplicas} bootstrap replicas")
+        self.nReplicas = nReplicas
+        self.seed = seed
+        # Events per block of weights, so that a block of hashes takes maxCells * 8 bytes
+        self.blockSize = max(1, maxCells // nReplicas)
+        nHashes = (nReplicas + 3) // 4
+        self._offsets = splitmix64(np.arange(nHashes, dtype=np.uint64) + np.uint64(seed) * np.uint64(nHashes))
+
+    def eventIds(self, run, lumi, event):
+        '''
+        Hash of run, lumi block and event number that seeds the weights of an event.
+        '''
+        key = (np.asarray(run, dtype=np.uint64) << np.uint64(32)) | np.asarray(lumi, dtype=np.uint64)
+        return splitmix64(splitmix64(key ^ np.uint64(self.seed)) ^ np.asarray(event, dtype=np.uint64))
+
+    def eventId(self, run, lumi, event):
+        return int(self.eventIds(np.array([run]), np.array([lumi]), np.array([event]))[0])
+
+    def weights(self, ids):
+        '''
+        Poisson weights of the events in all replicas, (events x replicas) uint8.
+        '''
+        hashes = splitmix64(np.asarray(ids, dtype=np.uint64)[:, None] ^ self._offsets[None, :])
+        return POISSON_TABLE[hashes.view(np.uint16)[:, :self.nReplicas]]
+
+    def blocks(self, n):
+        for start in range(0, n, self.blockSize):
+            yield slice(start, min(start + self.blockSize, n))
+
+def replicaName(name):
+    return f"{name}{SUFFIX}"
+
+def replicasToROOT(name, replicas):
+    '''
+    TH2D with the global bin number of the histogram on x and the replica on y.
+    '''
+    ROOT = importROOT()
+    nReplicas, nCells = replicas.shape
+    h = ROOT.TH2D(replicaName(name), f"{name} bootstrap replicas;bin;replica", nCells, 0, nCells, nReplicas, 0, nReplicas)
+    content = np.zeros((nReplicas + 2, nCells + 2))
+    content[1:-1, 1:-1] = replicas
+    h.SetContent(content.ravel())
+    h.SetEntries(float(replicas.sum()))
+    return h
+
+def readReplicas(fdir, name):
+    '''
+    Replica counts (replicas x bins) of a histogram in a directory, None if it has no replicas.
+    '''
+    h = fdir.Get(replicaName(name))
+    if not h:
+        return None
+    content = np.fromiter((h.GetBinContent(i) for i in range(h.GetNcells())), dtype=np.float64, count=h.GetNcells())
+    return content.reshape(h.GetNbinsY() + 2, h.GetNbinsX() + 2)[1:-1, 1:-1]
+
+def efficiencyQuantiles(numReplicas, denReplicas, quantiles=(0.16, 0.84)):
+    '''
+    Quantiles of the replica efficiencies per bin, (quantiles x bins). Bins
+    without denominator in a replica are ignored, NaN if they are empty in all.
+    '''
+    with np.errstate(invalid="ignore", divide="ignore"):
+        eff = np.where(denReplicas > 0, numReplicas / denReplicas, np.nan)
+    out = np.full((len(quantiles), eff.shape[1]), np.nan)
+    filled = np.any(denReplicas > 0, axis=0)
+    if filled.any():
+        out[:, filled] = np.nanquantile(eff[:, filled], quantiles, axis=0)
+    return out
+
+def bandGraph(num, den, numReplicas, denReplicas, quantiles=(0.16, 0.84)):
+    '''
+    TGraphAsymmErrors around the efficiency num/den of a TH1 with the given
+    replica quantiles as errors, to draw as a band with option "2".
+    '''
+    ROOT = importROOT()
+    lo, hi = efficiencyQuantiles(numReplicas, denReplicas, quantiles)
+    g = ROOT.TGraphAsymmErrors()
+    axis = den.GetXaxis()
+    for i in range(1, den.GetNbinsX() + 1):
+        if den.GetBinContent(i) <= 0 or np.isnan(lo[i]):
+            continue
+        eff = num.GetBinContent(i) / den.GetBinContent(i)
+        n = g.GetN()
+        g.SetPoint(n, axis.GetBinCenter(i), eff)
+        g.SetPointError(n, 0.5 * axis.GetBinWidth(i), 0.5 * axis.GetBinWidth(i), max(eff - lo[i], 0.), max(hi[i] - eff, 0.))
+    return g
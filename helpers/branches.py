@@ -0,0 +1,49 @@
+import os
+import re
+import tempfile
+
+# Identifiers in a TTreeFormula that are not branches: functions like abs(...)
+# and the special Sum$/Max$/Length$ operators.
+_IDENTIFIER = re.compile(r"\b([A-Za-z_]\w*)\b(?!\s*[\($])")
+
+def branchesFromCut(cut):
+    '''
+    Return the branch names used in a TTreeFormula cut string, in order of appearance.
+    '''
+    if not cut:
+        return []
+    names = []
+    for name in _IDENTIFIER.findall(cut):
+        if name not in names:
+            names.append(name)
+    return names
+
+def requiredBranches(modules, cut=None):
+    '''
+    Union of the branches declared by the modules through requiredBranches()
+    and of the branches used in the preselection cut.
+    '''
+    branches = []
+    for m in modules:
+        for b in m.requiredBranches():
+            if b not in branches:
+                branches.append(b)
+    for b in branchesFromCut(cut):
+        if b not in branches:
+            branches.append(b)
+    return branches
+
+def writeBranchSelection(modules, cut=None, fname=None):
+    '''
+    Write a keep/drop file in the format expected by the branchsel argument
+    of PostProcessor, enabling only the branches read by the modules and the
+    preselection. Returns the name of the file.
+    '''
+    if fname is None:
+        fd, fname = tempfile.mkstemp(prefix="keep_and_drop_", suffix=".txt")
+        os.close(fd)
+    with open(fname, "w") as f:
+        f.write("drop *\n")
+        for b in requiredBranches(modules, cut):
+            f.write(f"keep {b}\n")
+    return fname
@@ -0,0 +1,246 @@
+import os, sys
+import time
+import resource
+
+# Processing of the inputs in entry ranges ("chunks") ending on the cluster
+# boundaries of the tree, with the peak memory of every chunk measured by
+# resetting the high-water mark of the process (Linux) before it.
+#
+# What a memory budget bounds depends on the mode. The event loop reads one
+# entry at a time through TTreeReader, so its memory does not grow with the
+# chunk size; what grows with the number of active branches are the TTree
+# read cache and the basket buffers, which the budget caps (runChunked). The
+# chunks there only set where the memory is reported. The columnar mode reads
+# every chunk into new arrays, so its memory grows with the number of entries
+# per chunk, and the budget sizes the chunks (ChunkSizer): the first from the
+# uncompressed size of the branches read, every following one from the memory
+# per entry measured on the chunks before. The arrays of a chunk are released
+# before the next one is read, they are not reused: the bound on the memory is
+# that of the cache and baskets (event loop) or of one chunk of arrays
+# (columnar), not a preallocated set of buffers.
+
+MB = 1024**2
+
+# Entries per chunk of the event loop without --chunk-size
+STEPSIZE = 100000
+
+# Memory of the arrays built from the branches relative to their uncompressed
+# size, for the first chunk before anything is measured
+OVERHEAD = 4.
+
+def rss():
+    '''
+    Current resident memory in bytes.
+    '''
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class PeakMemory:
+    '''
+    Peak resident memory since the last reset(). Without /proc/self/clear_refs
+    it falls back to the peak of the whole process.
+    '''
+    def __init__(self):
+        self.resettable = os.path.exists("/proc/self/clear_refs")
+
+    def reset(self):
+        if self.resettable:
+            try:
+                with open("/proc/self/clear_refs", "w") as f:
+                    f.write("5")
+            except OSError:
+                self.resettable = False
+
+    def peak(self):
+        if self.resettable:
+            with open("/proc/self/status") as f:
+                for line in f:
+                    if line.startswith("VmHWM:"):
+                        return int(line.split()[1]) * 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class ChunkSizer:
+    '''
+    Number of entries of the next chunk, fixed (stepSize) or adapted to a memory budget in bytes.
+    '''
+    def __init__(self, stepSize=None, memory=None, minEntries=1000):
+        if not stepSize and not memory:
+            raise ValueError("A chunk needs a number of entries or a memory budget")
+        self.stepSize = stepSize
+        self.memory = memory
+        self.minEntries = minEntries
+        self.bytesPerEntry = None
+
+    def start(self, bytesPerEntry):
+        # Estimate of a new input, replaced by the measurement once a chunk has run
+        if self.bytesPerEntry is None:
+            self.bytesPerEntry = OVERHEAD * max(bytesPerEntry, 1.)
+
+    def entries(self, baseline):
+        if not self.memory:
+            return self.stepSize
+        n = int(max(self.memory - baseline, 0) / self.bytesPerEntry)
+        n = max(n, self.minEntries)
+        return min(n, self.stepSize) if self.stepSize else n
+
+    def measured(self, entries, baseline, peak):
+        if self.memory and entries > 0 and peak > baseline:
+            self.bytesPerEntry = (peak - baseline) / entries
+
+def entryRanges(nEntries, clusterStarts, size):
+    '''
+    Split [0, nEntries) into ranges of about size() entries ending on cluster
+    boundaries. size is called before every range, so that it can adapt.
+    '''
+    starts = sorted(set(clusterStarts) | {nEntries})
+    first = 0
+    while first < nEntries:
+        target = first + size()
+        # Last cluster boundary not beyond the target, or the next one if the first cluster is larger
+        last = max([s for s in starts if first < s <= target], default=None)
+        if last is None:
+            last = min(s for s in starts if s > first)
+        yield first, last
+        first = last
+
+def clusterStarts(tree, elist=None):
+    '''
+    First entries of the clusters of the tree, counted in the entries of the
+    entry list if given (the event loop runs over these).
+    '''
+    nEntries = tree.GetEntries()
+    starts, it = [], tree.GetClusterIterator(0)
+    start = it()
+    while start < nEntries:
+        starts.append(start)
+        start = it()
+    if not elist:
+        return starts
+    # Number of selected entries before each cluster, by bisection of the sorted list
+    n = elist.GetN()
+    selected = []
+    for start in starts:
+        lo, hi = 0, n
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if elist.GetEntry(mid) < start:
+                lo = mid + 1
+            else:
+                hi = mid
+        selected.append(lo)
+    return sorted(set(selected))
+
+class ChunkReport:
+    '''
+    Entries and peak memory of every chunk, printed as they finish.
+    '''
+    def __init__(self, verbose=True):
+        self.verbose = verbose
+        self.chunks = []
+        self.peakMemory = PeakMemory()
+
+    def begin(self):
+        self.peakMemory.reset()
+        self.t0 = time.time()
+        return rss()
+
+    def end(self, fname, first, last, baseline):
+        peak = self.peakMemory.peak()
+        self.chunks.append({"file": fname, "first": first, "last": last, "baseline": baseline, "peak": peak, "time": time.time() - self.t0})
+        if self.verbose:
+            print("Chunk %5d: entries %9d-%-9d of %s, %.1f sec., peak memory %.0f MB" % (len(self.chunks), first, last, os.path.basename(fname), time.time() - self.t0, peak / MB))
+        return peak
+
+    def summary(self):
+        if not self.chunks:
+            return "No chunks processed"
+        peaks = [c["peak"] for c in self.chunks]
+        return "Processed %d chunks, peak memory per chunk %.0f-%.0f MB" % (len(self.chunks), min(peaks) / MB, max(peaks) / MB)
+
+class FileScope:
+    '''
+    Module as seen by eventLoop, which calls beginFile and endFile around
+    every chunk: they are only passed on for the first and the last chunk of
+    a file, so that the per-file state of the module (HLT bits, formulas) is
+    built once per file. Everything else goes to the module.
+    '''
+    def __init__(self, module):
+        self.module = module
+        self.firstChunk = self.lastChunk = True
+
+    def beginFile(self, *args):
+        if self.firstChunk:
+            self.module.beginFile(*args)
+
+    def endFile(self, *args):
+        if self.lastChunk:
+            self.module.endFile(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.module, name)
+
+def runChunked(modules, files, cut, branchsel, histFileName, histDirName, stepSize=None, memory=None, entryRange=None, treeName="Events"):
+    '''
+    Counterpart of PostProcessor(...).run() with noOut=True that runs the
+    event loop of the modules over ranges of stepSize preselected entries,
+    only those in entryRange = (first, last) of each file if given, and
+    reports the peak memory of each. With a memory budget in bytes the TTree
+    read cache gets at most a quarter of it and the basket buffers kept in memory
+    at most another quarter.
+    '''
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import eventLoop
+    from PhysicsTools.NanoAODTools.postprocessing.framework.preskimming import preSkim
+    from PhysicsTools.NanoAODTools.postprocessing.framework.branchselection import BranchSelection
+    from PhysicsTools.NanoAODTools.postprocessing.framework.treeReaderArrayTools import InputTree
+
+    selection = BranchSelection(branchsel) if branchsel else None
+    histFile = ROOT.TFile.Open(histFileName, "RECREATE")
+    for m in modules:
+        m.beginJob(histFile=histFile, histDirName=histDirName)
+
+    scoped = [FileScope(m) for m in modules]
+    stepSize = stepSize or STEPSIZE
+    report = ChunkReport()
+    t0 = time.time()
+    nEntries = 0
+    for fname in files:
+        inFile = ROOT.TFile.Open(fname)
+        tree = inFile.Get(treeName)
+        if selection:
+            selection.selectBranches(tree)
+        if memory:
+            tree.SetCacheSize(min(int(memory) // 4, 100 * MB))
+            tree.SetMaxVirtualSize(int(memory) // 4)
+        first, last = entryRange or (0, tree.GetEntries())
+        last = min(last, tree.GetEntries())
+        elist, jsonFilter = preSkim(tree, None, cut, maxEntries=last - first, firstEntry=first)
+        nEntries += last - first
+
+        if elist:
+            nSelected, offset, clusters = elist.GetN(), 0, clusterStarts(tree, elist)
+        else:
+            # Without a preselection the event loop counts the entries of the tree
+            nSelected, offset = last - first, first
+            clusters = [c - first for c in clusterStarts(tree) if first <= c < last]
+
+        inTree = InputTree(tree, elist)
+        # eventLoop calls beginFile and endFile itself, once per chunk here
+        ranges = list(entryRanges(nSelected, clusters, lambda: stepSize)) or [(0, 0)]
+        for i, (begin, end) in enumerate(ranges):
+            for m in scoped:
+                m.firstChunk, m.lastChunk = i == 0, i == len(ranges) - 1
+            baseline = report.begin()
+            eventLoop(scoped, inFile, None, inTree, None, eventRange=range(offset + begin, offset + end), progress=False)
+            report.end(fname, offset + begin, offset + end, baseline)
+        inFile.Close()
+
+    for m in modules:
+        m.endJob()
+    print(report.summary())
+    print("Total time %.1f sec. to process %i events. Rate = %.1f Hz." % ((time.time() - t0), nEntries, nEntries / max(time.time() - t0, 1e-9)))
+    return report
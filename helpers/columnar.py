@@ -0,0 +1,102 @@
+import time
+import numpy as np
+import awkward as ak
+import uproot
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from helpers.chunked import ChunkSizer, ChunkReport, entryRanges, rss
+
+def fillN(h, x, y=None):
+    '''
+    Fill a TH1 (or TH2 if y is given) from flat arrays with unit weights.
+    This is equivalent to calling h.Fill() once per entry.
+    '''
+    x = np.ascontiguousarray(x, dtype=np.float64)
+    n = len(x)
+    if n == 0:
+        return
+    w = np.ones(n, dtype=np.float64)
+    if y is None:
+        h.FillN(n, x, w)
+    else:
+        h.FillN(n, x, np.ascontiguousarray(y, dtype=np.float64), w)
+
+def asDouble(array):
+    '''
+    Convert a (jagged) branch to double precision so that cuts compare the
+    same way as the per-event Python code and TTreeFormula do.
+    '''
+    return ak.values_astype(array, np.float64)
+
+def iterateChunks(files, branches, treeName="Events", stepSize=100000, entryRange=None):
+    '''
+    Yield the requested branches of all input files in chunks of jagged arrays.
+    The files are opened one at a time, so files can also be any iterable
+    producing paths (e.g. a Prefetcher). With entryRange = (first, last) only
+    these entries of each file are read.
+    '''
+    for fname in files:
+        if entryRange:
+            with uproot.open(fname) as f:
+                for arrays in f[treeName].iterate(branches, step_size=stepSize, entry_start=entryRange[0], entry_stop=entryRange[1], library="ak"):
+                    yield arrays
+            continue
+        for arrays in uproot.iterate({fname: treeName}, expressions=branches, step_size=stepSize, library="ak"):
+            yield arrays
+
+def iterateBounded(files, branches, sizer, report, treeName="Events", entryRange=None):
+    '''
+    Like iterateChunks, with the number of entries of every chunk set by a
+    ChunkSizer and the chunks ending on cluster boundaries. The report is
+    started before a chunk is read and ended once the consumer asks for the
+    next one, so that its peak memory covers the analysis of the chunk.
+    '''
+    for fname in files:
+        with uproot.open(fname) as f:
+            tree = f[treeName]
+            sizer.start(sum(tree[b].uncompressed_bytes for b in branches) / max(tree.num_entries, 1))
+            start, stop = entryRange or (0, tree.num_entries)
+            stop = min(stop, tree.num_entries)
+            clusters = [c - start for c in tree.common_entry_offsets(filter_name=branches) if start <= c < stop]
+            for first, last in entryRanges(stop - start, clusters, lambda: sizer.entries(rss())):
+                baseline = report.begin()
+                yield tree.arrays(branches, entry_start=start + first, entry_stop=start + last, library="ak")
+                sizer.measured(last - first, baseline, report.end(fname, start + first, start + last, baseline))
+
+def runColumnar(module, files, histFileName, histDirName, treeName="Events", stepSize=100000, lumiMask=None, memory=None, entryRange=None):
+    '''
+    Columnar counterpart of PostProcessor(...).run() with noOut=True:
+    book the histograms of the module, hand it the events chunk by chunk
+    through module.analyzeChunk() and write the histograms at the end.
+    With a LumiMask only the events of its lumi blocks are analyzed. With a
+    memory budget in bytes the chunks are sized to it instead of stepSize.
+    entryRange = (first, last) restricts each file to these entries.
+    '''
+    histFile = ROOT.TFile.Open(histFileName, "RECREATE")
+    module.beginJob(histFile=histFile, histDirName=histDirName)
+
+    branches = module.requiredBranches()
+    if lumiMask is not None:
+        branches += [b for b in ["run", "luminosityBlock"] if b not in branches]
+
+    t0 = time.time()
+    nEntries = 0
+    report = ChunkReport() if memory else None
+    if memory:
+        chunks = iterateBounded(files, branches, ChunkSizer(memory=memory), report, treeName, entryRange)
+    else:
+        chunks = iterateChunks(files, branches, treeName, stepSize, entryRange)
+    for arrays in chunks:
+        nEntries += len(arrays)
+        if lumiMask is not None:
+            arrays = arrays[lumiMask.containsArray(ak.to_numpy(arrays.run), ak.to_numpy(arrays.luminosityBlock))]
+        module.analyzeChunk(arrays)
+        # Release the chunk before the next one is read
+        del arrays
+
+    module.endJob()
+    if report:
+        print(report.summary())
+    print("Processed %d entries from %d files in columnar mode" % (nEntries, len(files)))
+    print("Total time %.1f sec. to process %i events. Rate = %.1f Hz." % ((time.time() - t0), nEntries, nEntries / max(time.time() - t0, 1e-9)))
@@ -0,0 +1,59 @@
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
+from helpers.branches import requiredBranches
+
+class SubAnalysis(Module):
+    '''
+    Wrap an analysis module so that several of them can share one PostProcessor
+    pass: the wrapped module writes its histograms into its own directory and
+    only sees the events passing its own cut string, evaluated with a
+    TTreeFormula on top of the common preselection. The wrapper always returns
+    True from analyze() so that a rejected event still reaches the other modules.
+    '''
+    def __init__(self, module, histDirName, cut=None):
+        self.writeHistFile = True
+        self.module = module
+        self.histDirName = histDirName
+        self.cut = cut
+        self.formula = None
+        self.closeHistFile = True
+
+    def requiredBranches(self):
+        return requiredBranches([self.module], self.cut)
+
+    def beginJob(self, histFile=None, histDirName=None):
+        self.module.beginJob(histFile, self.histDirName)
+
+    def endJob(self):
+        # Module.endJob() closes the histogram file, which must only happen for the last module
+        if not self.closeHistFile:
+            self.module.histFile = None
+        self.module.endJob()
+
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        if self.cut:
+            self.formula = ROOT.TTreeFormula(f"cut_{self.histDirName}", self.cut, inputTree)
+        self.module.beginFile(inputFile, outputFile, inputTree, wrappedOutputTree)
+
+    def endFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.module.endFile(inputFile, outputFile, inputTree, wrappedOutputTree)
+        self.formula = None
+
+    def analyze(self, event):
+        if self.formula is not None:
+            self.formula.GetNdata()
+            if not self.formula.EvalInstance():
+                return True
+        self.module.analyze(event)
+        return True
+
+def combine(analyses):
+    '''
+    Build the SubAnalysis wrappers for a list of (module, histDirName, cut) tuples.
+    '''
+    wrapped = [SubAnalysis(module, histDirName, cut) for module, histDirName, cut in analyses]
+    for w in wrapped[:-1]:
+        w.closeHistFile = False
+    return wrapped
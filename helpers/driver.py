@@ -0,0 +1,141 @@
+import os
+
+from helpers.parallel import runParallel, runSplit
+from helpers.incremental import runIncremental
+from helpers.branches import writeBranchSelection, requiredBranches
+from helpers.skimcache import SkimCache
+from helpers.prefetch import Prefetcher
+from helpers.chunked import runChunked
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.postprocessor import PostProcessor
+
+# Command line and job plumbing shared by the getEffs drivers. addDriverArgs
+# declares the options common to all of them and checkDriverArgs rejects their
+# invalid combinations. jobArgs turns the parsed options back into the
+# arguments of the driver jobs: histArgs are the options that change the
+# histograms, hashed by the incremental runs, extraArgs all the forwarded ones.
+# dispatchJobs starts the jobs of -j, --split or --incremental; a single job reads
+# its inputs through jobInputs (skim cache, prefetching) and fills the
+# histograms with runEventLoop.
+
+def addDriverArgs(parser, files, histFile, combined=False, stepSize=None):
+    '''
+    Add the common options of the drivers to parser. combined is set for the
+    driver running several analyses at once, stepSize (the default number of
+    entries per chunk) for the ones with a columnar mode.
+    '''
+    modules = "modules" if combined else "module"
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, action="store", default=1, help="Number of parallel jobs, each processing its own chunk of files [default: %s]" % (1))
+    parser.add_argument("--files-per-job", dest="filesPerJob", type=int, action="store", default=1, help="Number of input files per parallel job [default: %s]" % (1))
+    parser.add_argument("--retries", dest="retries", type=int, action="store", default=1, help="Number of times a failed job is retried before giving up [default: %s]" % (1))
+    parser.add_argument("--split", dest="split", default=False, action="store_true", help="Split the input files into balanced entry ranges ending on cluster boundaries, taken by the parallel jobs from a shared queue, instead of one job per chunk of files [default: %s]" % (False))
+    parser.add_argument("--tasks-per-job", dest="tasksPerJob", type=int, action="store", default=4, help="Number of entry range tasks per parallel job with --split [default: %s]" % (4))
+    parser.add_argument("--entry-range", dest="entryRange", type=int, nargs=2, default=None, metavar=("FIRST", "LAST"), help="Only process the entries [FIRST, LAST) of the input file, as done by the tasks of --split [default: all entries]")
+    if stepSize is not None:
+        parser.add_argument("--columnar", dest="columnar", default=False, action="store_true", help="Read the branches in chunks of jagged arrays and fill the histograms with vectorized masks instead of the per-event loop [default: %s]" % (False))
+        parser.add_argument("--step-size", dest="stepSize", type=int, action="store", default=stepSize, help="Number of entries per chunk in columnar mode [default: %s]" % (stepSize))
+    parser.add_argument("--input", dest="inputs", nargs="+", default=files, help="Input NanoAOD files [default: the Muon2023C files listed in %s]" % ("getEffsAK8.py" if combined else "this script"))
+    parser.add_argument("--all-branches", dest="allBranches", default=False, action="store_true", help="Read all branches instead of only those declared by the %s [default: %s]" % (modules, False))
+    parser.add_argument("--skim-cache", dest="skimCache", type=str, action="store", default=None, help="Directory of a local cache of preselected, branch-pruned copies of the inputs, reused by later runs [default: no cache]")
+    parser.add_argument("--skim-cache-size", dest="skimCacheSize", type=float, action="store", default=50., help="Size limit of the skim cache in GB, least recently used skims are removed beyond it [default: %s]" % (50.))
+    parser.add_argument("--hlt-bits-cache", dest="hltBitsCache", type=str, action="store", default=None, help="Directory where the packed HLT decisions of each input file are stored and reused by later runs [default: no cache]")
+    parser.add_argument("--prefetch", dest="prefetch", type=int, action="store", default=0, help="Number of input files copied ahead to local scratch space in background threads while the current file is processed, 0 to read the inputs in place [default: %s]" % (0))
+    parser.add_argument("--scratch", dest="scratch", type=str, action="store", default=None, help="Scratch directory for the prefetched files [default: a temporary directory]")
+    parser.add_argument("--scratch-size", dest="scratchSize", type=float, action="store", default=20., help="Disk budget of the prefetched files in GB [default: %s]" % (20.))
+    parser.add_argument("--run-partials", dest="runPartials", type=str, action="store", choices=["run", "lumi"], default=None, help="Also keep the histograms per run or per lumi block in a store next to the output, from which python3 -m helpers.runstore rebuilds them for any run range or lumi mask [default: off]")
+    parser.add_argument("--lumi-mask", dest="lumiMask", type=str, action="store", default=None, help="Golden JSON file, only events in its lumi blocks are processed [default: all events]")
+    parser.add_argument("--bootstrap", dest="bootstrap", type=int, action="store", default=0, help="Number of Poisson bootstrap replicas kept of every histogram and written as {name}_bootstrap, 0 for none [default: %s]" % (0))
+    parser.add_argument("--sketch", dest="sketch", default=False, action="store_true", help="First pass for adaptive binnings: stream the observables of the denominators and numerators into exact counts on fine grids, written next to the output and merged across parallel jobs, see deriveBinning.py [default: %s]" % (False))
+    parser.add_argument("--binning", dest="binning", type=str, action="store", default=None, help="JSON file of the bin edges per %s, as written by deriveBinning.py, replacing the default binnings [default: the binnings %s]" % (("directory and observable", "of the modules") if combined else ("observable", "in this script")))
+    parser.add_argument("--chunk-size", dest="chunkSize", type=int, action="store", default=None, help="Run the event loop over chunks of this many preselected entries, ending on cluster boundaries, and report the peak memory of every chunk [default: one pass per file]")
+    if stepSize is not None:
+        parser.add_argument("--memory", dest="memory", type=float, action="store", default=None, help="Memory budget in MB: the event loop runs in chunks (see --chunk-size) with the TTree read cache and basket buffers capped at half of it, the chunks of the columnar mode are sized so that the peak resident memory stays within it, overriding --step-size [default: no budget]")
+    else:
+        parser.add_argument("--memory", dest="memory", type=float, action="store", default=None, help="Memory budget in MB of the input buffers: the event loop runs in chunks (see --chunk-size) with the TTree read cache and basket buffers capped at half of it [default: no budget]")
+    parser.add_argument("--profile", dest="profile", default=False, action="store_true", help="Time the stages of analyze(), print a table of them and write them in folded stack format for flame graphs at the end of the job, and write the cut flow as h_cutflow [default: %s]" % (False))
+    parser.add_argument("--incremental", dest="ledger", type=str, action="store", default=None, help="Ledger directory of incremental runs: only inputs that are new or changed since the last run are processed and added to the output, removed inputs are subtracted [default: off]")
+    parser.add_argument("--verify-checksums", dest="verifyChecksums", default=False, action="store_true", help="With --incremental, read the inputs without an EOS checksum in full to compute theirs, so that a file that was touched or copied but not changed is not reprocessed [default: %s]" % (False))
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=histFile, help="Output histogram file%s [default: %s]" % (", with one directory per analysis" if combined else "", histFile))
+
+def checkDriverArgs(parser, args):
+    '''
+    Exit through parser.error on the invalid combinations of the common options.
+    '''
+    if args.entryRange and len(args.inputs) != 1:
+        parser.error("--entry-range needs a single input file")
+    if args.split and (args.jobs < 2 or args.ledger):
+        parser.error("--split spreads the entry ranges over parallel jobs, use it with -j 2 or more and without --incremental")
+    if args.skimCache and (args.entryRange or args.split):
+        parser.error("The entries of the skims differ from those of the inputs, --entry-range and --split cannot be used with --skim-cache")
+    if args.sketch and args.ledger:
+        parser.error("The sketches are merged by -j and --split, --sketch cannot be used with --incremental")
+
+def jobArgs(args, histArgs=None, extraArgs=None):
+    '''
+    Arguments of the driver jobs, from the common options and the
+    driver-specific ones in histArgs (changing the histograms) and extraArgs.
+    Returns (histArgs, extraArgs), where extraArgs include the histArgs.
+    '''
+    hist  = ["--lumi-mask", args.lumiMask] if args.lumiMask else []
+    hist += ["--run-partials", args.runPartials] if args.runPartials else []
+    hist += ["--bootstrap", str(args.bootstrap)] if args.bootstrap else []
+    hist += ["--profile"] if args.profile else []
+    hist += histArgs or []
+    hist += ["--sketch"] if args.sketch else []
+    hist += ["--binning", args.binning] if args.binning else []
+
+    extra  = hist + (extraArgs or [])
+    extra += ["--all-branches"] if args.allBranches else []
+    extra += ["--skim-cache", args.skimCache, "--skim-cache-size", str(args.skimCacheSize)] if args.skimCache else []
+    extra += ["--hlt-bits-cache", args.hltBitsCache] if args.hltBitsCache else []
+    extra += ["--prefetch", str(args.prefetch), "--scratch-size", str(args.scratchSize)] + (["--scratch", args.scratch] if args.scratch else []) if args.prefetch else []
+    extra += ["--chunk-size", str(args.chunkSize)] if args.chunkSize else []
+    extra += ["--memory", str(args.memory)] if args.memory else []
+    return hist, extra
+
+def dispatchJobs(script, args, histArgs, extraArgs):
+    '''
+    Run the driver script in the jobs of --incremental, --split or -j.
+    Returns False if none of them is asked for and the event loop is to run
+    in this process.
+    '''
+    if args.ledger:
+        runIncremental(script, args.inputs, args.output, args.ledger, jobs=args.jobs, retries=args.retries, extraArgs=extraArgs, options=histArgs, verify=args.verifyChecksums)
+    elif args.split:
+        runSplit(script, args.inputs, args.output, jobs=args.jobs, tasksPerJob=args.tasksPerJob, retries=args.retries, extraArgs=extraArgs)
+    elif args.jobs > 1:
+        runParallel(script, args.inputs, args.output, jobs=args.jobs, filesPerJob=args.filesPerJob, retries=args.retries, extraArgs=extraArgs)
+    else:
+        return False
+    return True
+
+def jobInputs(modules, args, preselection):
+    '''
+    Input files of the event loop: the skims of the skim cache, the prefetched
+    copies or the inputs themselves.
+    '''
+    inputs = args.inputs
+    if args.skimCache:
+        cache = SkimCache(args.skimCache, int(args.skimCacheSize * 1024**3))
+        inputs = cache.skim(inputs, preselection, None if args.allBranches else requiredBranches(modules, preselection))
+    if args.prefetch > 0 and not args.skimCache:
+        # The skims of the skim cache are local already
+        inputs = Prefetcher(inputs, args.scratch, depth=args.prefetch, maxBytes=int(args.scratchSize * 1024**3))
+    return inputs
+
+def runEventLoop(modules, inputs, args, preselection, histDirName):
+    '''
+    Run the modules over the inputs, in chunks with --chunk-size or --memory,
+    and write their histograms in histDirName of the output file.
+    '''
+    branchsel = None if args.allBranches else writeBranchSelection(modules, preselection)
+    if args.chunkSize or args.memory:
+        runChunked(modules, inputs, preselection, branchsel, args.output, histDirName, stepSize=args.chunkSize, memory=int(args.memory * 1024**2) if args.memory else None, entryRange=args.entryRange)
+        if branchsel:
+            os.remove(branchsel)
+    else:
+        p=PostProcessor(".",inputs,cut=preselection,branchsel=branchsel,modules=modules,noOut=True,histFileName=args.output,histDirName=histDirName,
+                        firstEntry=args.entryRange[0] if args.entryRange else 0,maxEntries=args.entryRange[1] - args.entryRange[0] if args.entryRange else None)
+        if branchsel:
+            os.remove(branchsel)
+        p.run()
@@ -0,0 +1,92 @@
+import os, sys
+import json
+import numpy as np
+import pyarrow as pa
+
+# Columnar table of the efficiencies: one row per bin of every numerator and
+# denominator pair, with the counts, the efficiency and its Clopper-Pearson
+# interval, in an Arrow IPC file. Every (analysis, variable, selection, path)
+# is its own record batch, and the schema metadata maps the keys to the batch
+# numbers, so that a reader memory-maps the file and reads the bins of one
+# path without touching the others or needing ROOT:
+#
+#   table = EfficiencyTable("effs.arrow")
+#   bins = table.get("hadTrigAnalyzerNanoAOD", "pt", "plateauMSD", "HLT_AK8PFJet500")
+#   bins.column("eff").to_numpy()
+
+SCHEMA = pa.schema([("analysis", pa.string()),
+                    ("variable", pa.string()),
+                    ("selection", pa.string()),
+                    ("path", pa.string()),
+                    ("bin", pa.int32()),
+                    ("xlow", pa.float64()),
+                    ("xhigh", pa.float64()),
+                    ("ylow", pa.float64()),
+                    ("yhigh", pa.float64()),
+                    ("num", pa.float64()),
+                    ("den", pa.float64()),
+                    ("eff", pa.float64()),
+                    ("effLow", pa.float64()),
+                    ("effHigh", pa.float64()),
+                    ("bootstrapLow", pa.float64()),
+                    ("bootstrapHigh", pa.float64()),
+                    ])
+
+def tableKey(analysis, variable, selection, path):
+    return "/".join([analysis, variable, selection, path])
+
+def writeTable(output, groups, metadata=None):
+    '''
+    Write the groups, ((analysis, variable, selection, path), {column: array})
+    with the columns of SCHEMA after the key, as one record batch each. The
+    file is written uncompressed so that it can be memory-mapped.
+    '''
+    index = {}
+    batches = []
+    for key, columns in sorted(groups, key=lambda group: group[0]):
+        n = len(columns["bin"])
+        arrays = [pa.array([k] * n, type=pa.string()) for k in key]
+        arrays += [pa.array(np.asarray(columns[field.name]), type=field.type) for field in list(SCHEMA)[4:]]
+        index[tableKey(*key)] = len(batches)
+        batches.append(pa.record_batch(arrays, schema=SCHEMA))
+    meta = {"index": json.dumps(index)}
+    meta.update({k: json.dumps(v) for k, v in (metadata or {}).items()})
+    tmp = f"{output}.{os.getpid()}.tmp"
+    with pa.OSFile(tmp, "wb") as sink:
+        with pa.ipc.new_file(sink, SCHEMA.with_metadata(meta)) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+    os.replace(tmp, output)
+    return len(batches)
+
+class EfficiencyTable:
+    '''
+    Memory-mapped reader of a table written by writeTable.
+    '''
+    def __init__(self, path):
+        self.path = path
+        self.reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+        meta = self.reader.schema.metadata or {}
+        self.index = json.loads(meta[b"index"])
+        self.metadata = {k.decode(): json.loads(v) for k, v in meta.items() if k != b"index"}
+
+    def keys(self):
+        '''
+        (analysis, variable, selection, path) of all efficiencies in the table.
+        '''
+        return [tuple(key.split("/")) for key in self.index]
+
+    def get(self, analysis, variable, selection="", path="OR"):
+        '''
+        Record batch with the bins of one efficiency, read without copying.
+        '''
+        key = tableKey(analysis, variable, selection, path)
+        if key not in self.index:
+            raise KeyError(f"No efficiency {key} in {self.path}")
+        return self.reader.get_batch(self.index[key])
+
+    def read(self):
+        '''
+        The whole table.
+        '''
+        return self.reader.read_all()
@@ -0,0 +1,451 @@
+import os, sys
+import re
+import json
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from helpers import selections
+from helpers.selections import OPS
+from helpers.utils import deltaR
+from helpers.triggers import TriggerBits
+from helpers.histograms import Axis, HistBook, EfficiencySpec
+from helpers.runstore import storePath, writeBookStore
+from helpers.profiling import StageTimer, NullTimer
+from helpers.sketch import GRIDS, SketchBook, sketchPath
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.datamodel import Collection, Object
+from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
+
+# Configurable reference-trigger efficiency measurements. A spec (YAML or TOML,
+# see configs/efficiencies.yaml) declares named observables and a list of
+# analyses, each with its reference and signal paths, offline selection,
+# binned variables, numerators and plateau selections. All analyses of a spec
+# run as one module in one pass over the events: the spec is compiled into a
+# plan in which the decisions of all paths are packed once per event, every
+# observable (identical definitions under different names included) is
+# computed at most once per event and only when an analysis needs it, and
+# every distinct cut string is one TTreeFormula.
+
+def loadSpec(path):
+    '''
+    Spec dict from a .yaml/.yml or .toml file.
+    '''
+    if path.endswith(".toml"):
+        import tomllib
+        with open(path, "rb") as f:
+            return tomllib.load(f)
+    import yaml
+    with open(path) as f:
+        return yaml.safe_load(f)
+
+class Observable:
+    '''
+    Base of the observable kinds, keyed by kind and parameters so that equal
+    definitions share one instance. Subclasses implement branches() and
+    compute(event, values), where values(name) gives other observables.
+    '''
+    kinds = {}
+    inputs = []
+
+    def __init_subclass__(cls, kind=None, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls.kind = kind
+        Observable.kinds[kind] = cls
+
+    def __init__(self, **params):
+        self.params = params
+        self.key = json.dumps([type(self).kind, params], sort_keys=True)
+        for name, value in params.items():
+            setattr(self, name, value)
+
+    def branches(self):
+        return []
+
+class BranchObservable(Observable, kind="branch"):
+    def branches(self):
+        return [self.branch]
+
+    def compute(self, event, values):
+        return getattr(event, self.branch)
+
+class AllObservable(Observable, kind="all"):
+    '''
+    True if all flag branches are set, e.g. the MET noise filters.
+    '''
+    def branches(self):
+        return list(self.flags)
+
+    def compute(self, event, values):
+        return all(getattr(event, b) for b in self.flags)
+
+class SelectedObservable(Observable, kind="selected"):
+    '''
+    Indices of the objects passing a selection of helpers.selections.
+    '''
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.objectSelection = getattr(selections, self.selection)
+        self.collection = self.objectSelection.collection
+
+    def branches(self):
+        return self.objectSelection.branches()
+
+    def compute(self, event, values):
+        return self.objectSelection.indices(event)
+
+class CountObservable(Observable, kind="count"):
+    inputs = ["of"]
+
+    def compute(self, event, values):
+        return len(values(self.of))
+
+class CleanedHTObservable(Observable, kind="cleanedHT"):
+    '''
+    CleanedHT of helpers.selections with respect to the first object of a selected observable.
+    '''
+    inputs = ["ref"]
+
+    def __init__(self, **params):
+        super().__init__(**params)
+        self.cleanedHT = getattr(selections, self.ht)
+
+    def branches(self):
+        return self.cleanedHT.branches()
+
+    def compute(self, event, values):
+        ref = values(self.ref)
+        if not ref:
+            return 0.
+        return self.cleanedHT.compute(event, values.collection(values.observables[self.ref].collection)[ref[0]])
+
+class MatchedDeltaRObservable(Observable, kind="matchedDeltaR"):
+    '''
+    Delta R of every object with a match index (e.g. FatJet_muonIdx3SJ) to the matched object.
+    '''
+    def branches(self):
+        return [f"n{self.collection}"] + [f"{self.collection}_{var}" for var in ["eta", "phi", self.match]] + [f"{self.to}_{var}" for var in ["eta", "phi"]]
+
+    def compute(self, event, values):
+        targets = values.collection(self.to)
+        dR = []
+        for obj in values.collection(self.collection):
+            idx = getattr(obj, self.match)
+            if idx != -1:
+                dR.append(deltaR(obj.eta, obj.phi, targets[idx].eta, targets[idx].phi))
+        return dR
+
+class LeadingObservable(Observable, kind="leading"):
+    '''
+    Index of the highest-pT object without a match index (the first of equal
+    pTs), -1 if there is none.
+    '''
+    def branches(self):
+        return [f"n{self.collection}", f"{self.collection}_pt", f"{self.collection}_{self.veto}"]
+
+    def compute(self, event, values):
+        leading, leadingPt = -1, None
+        for i, obj in enumerate(values.collection(self.collection)):
+            if getattr(obj, self.veto) != -1:
+                continue
+            if leadingPt is None or obj.pt > leadingPt:
+                leading, leadingPt = i, obj.pt
+        return leading
+
+class AttributeObservable(Observable, kind="attribute"):
+    '''
+    A branch of the object at the index given by another observable.
+    '''
+    inputs = ["of"]
+
+    def branches(self):
+        return [f"{self.collection}_{self.branch}"]
+
+    def compute(self, event, values):
+        return getattr(values.collection(self.collection)[values(self.of)], self.branch)
+
+class EventValues:
+    '''
+    Observables of the current event, each computed on first use.
+    '''
+    def __init__(self, observables):
+        self.observables = observables
+        self.reset(None)
+
+    def reset(self, event):
+        self.event = event
+        self.cache = {}
+        self.collections = {}
+
+    def __call__(self, name):
+        obs = self.observables[name]
+        if obs.key not in self.cache:
+            self.cache[obs.key] = obs.compute(self.event, self)
+        return self.cache[obs.key]
+
+    def collection(self, name):
+        if name not in self.collections:
+            self.collections[name] = Collection(self.event, name)
+        return self.collections[name]
+
+_CONDITION = re.compile(r"^\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(\S+)\s*$")
+
+def condition(text, parameters):
+    '''
+    (observable, test) of a condition "name", "name op value" or "name op {parameter}".
+    '''
+    text = text.format(**parameters)
+    match = _CONDITION.match(text)
+    if not match:
+        name = text.strip()
+        return name, bool
+    name, op, value = match.groups()
+    value = float(value)
+    return name, lambda x: OPS[op](x, value)
+
+def axis(d):
+    return Axis(d) if isinstance(d, list) else Axis(nbins=d["nbins"], low=d["low"], high=d["high"])
+
+class Analysis:
+    '''
+    One analysis of a spec, writing its histograms into the directory of its name.
+    '''
+    def __init__(self, name, spec, engine, parameters=None, binning=None):
+        self.name = name
+        self.cut = spec.get("cut")
+        self.reference_paths = spec.get("reference_paths", engine.spec.get("reference_paths", []))
+        self.signal_paths = spec.get("signal_paths", [])
+        self.parameters = dict(spec.get("parameters", {}), **(parameters or {}))
+        self.prefix = spec.get("prefix", "h")
+        # Events passing each condition of the selection, a StageTimer when profiling
+        self.cutflow = NullTimer()
+
+        # Offline selection: conditions in order, and {"fill": histogram} steps filling a histogram on the way
+        self.steps = []
+        for step in spec.get("selection", []):
+            if isinstance(step, dict):
+                self.steps.append(("fill", step["fill"]))
+            else:
+                self.steps.append(("cut", condition(step, self.parameters)))
+
+        # Numerators, bit i of the numerator mask for entry i
+        self.numerators = []
+        for label, test in spec["numerators"].items():
+            if isinstance(test, dict) and test.get("paths") == "each":
+                self.numerators += [(label.format(path=path), ("paths", [path])) for path in self.signal_paths]
+            elif isinstance(test, dict) and "paths" in test:
+                self.numerators.append((label, ("paths", self.signal_paths if test["paths"] == "signal" else test["paths"])))
+            elif isinstance(test, dict):
+                self.numerators.append((label, ("cut", condition(test["require"], self.parameters))))
+            else:
+                self.numerators.append((label, ("all", None)))
+        self.labels = [label for label, test in self.numerators]
+
+        # Plateau selections, the first one always passed
+        self.selections = [("", [])] + [(sel, [condition(c, self.parameters) for c in conds]) for sel, conds in spec.get("plateaus", {}).items()]
+        # Bin edges by variable name, e.g. from deriveBinning.py, replace those of the spec
+        binning = binning or {}
+        self.variables = [(var, d["observable"], d.get("title", ""), axis(binning.get(var, d["bins"]))) for var, d in spec["variables"].items()]
+        self.hists = [(name, d["observable"], d.get("title", ""), axis(d["bins"])) for name, d in spec.get("hists", {}).items()]
+        self.hists2D = []
+        for var, d in spec.get("hists2D", {}).items():
+            nums = d["numerators"] if isinstance(d["numerators"], dict) else {label: label for label in d["numerators"]}
+            self.hists2D.append((var, d["x"], d["y"], d.get("title", ""), [(label, self.labels.index(num)) for label, num in nums.items()]))
+
+    def observables(self):
+        names = [step[0] for kind, step in self.steps if kind == "cut"]
+        names += [test[0] for label, (kind, test) in self.numerators if kind == "cut"]
+        names += [name for sel, conds in self.selections for name, test in conds]
+        names += [obs for var, obs, title, ax in self.variables] + [obs for name, obs, title, ax in self.hists]
+        return names
+
+    def setBits(self, bits):
+        self.referenceMask = sum(bits.bit[p] for p in self.reference_paths)
+        self.pathMasks = [sum(bits.bit[p] for p in paths) if kind == "paths" else 0 for label, (kind, paths) in self.numerators]
+        self.signalMask = sum(bits.bit[p] for p in self.signal_paths)
+
+    def beginJob(self, histFile, runPartials, bootstrap, sketch=False):
+        self.book = HistBook(split=runPartials, bootstrap=bootstrap)
+        self.book.book("h_passreftrig", "; passed ref trigger", Axis(nbins=2, low=0., high=2.))
+        for name, obs, title, ax in self.hists:
+            self.book.book(name, title, ax)
+        for var, x, y, title, nums in self.hists2D:
+            xaxis = [ax for v, obs, t, ax in self.variables if v == x][0]
+            yaxis = [ax for v, obs, t, ax in self.variables if v == y][0]
+            for label, i in nums:
+                self.book.book("_".join(part for part in [self.prefix, var, label] if part), title, xaxis, yaxis)
+        # {prefix}_{variable}[_{numerator}][_{plateau selection}]
+        self.effs = EfficiencySpec(self.prefix, [(var, title, ax) for var, obs, title, ax in self.variables],
+                                   [sel for sel, conds in self.selections], self.labels)
+        self.effs.book(self.book)
+        self.store = storePath(histFile.GetName(), self.name) if runPartials and histFile else None
+        # Grid counts of the variables that have a grid, with the signal OR as passing
+        self.sketches = SketchBook([var for var, obs, title, ax in self.variables if var in GRIDS]) if sketch else None
+        self.sketchStore = sketchPath(histFile.GetName(), self.name) if sketch and histFile else None
+
+    def analyze(self, event, values, trigBits):
+        if self.book.split or self.book.bootstrap:
+            self.book.setEvent(event.run, event.luminosityBlock, event.event)
+
+        self.cutflow.passed(0)
+        refAccept = bool(trigBits & self.referenceMask)
+        self.book.fill("h_passreftrig", refAccept)
+        if not refAccept:
+            return False
+
+        cutflow = self.cutflow
+        cutflow.passed(1)
+        i = 2
+        for kind, step in self.steps:
+            if kind == "fill":
+                obs = [o for name, o, title, ax in self.hists if name == step][0]
+                x = values(obs)
+                for xi in (x if isinstance(x, list) else [x]):
+                    self.book.fill(step, xi)
+                continue
+            if not step[1](values(step[0])):
+                return False
+            cutflow.passed(i)
+            i += 1
+
+        numBits = 0
+        for i, (label, (kind, test)) in enumerate(self.numerators):
+            if kind == "all" or (kind == "paths" and trigBits & self.pathMasks[i]) or (kind == "cut" and test[1](values(test[0]))):
+                numBits |= 1 << i
+        selBits = 0
+        for i, (sel, conds) in enumerate(self.selections):
+            if all(test(values(name)) for name, test in conds):
+                selBits |= 1 << i
+
+        row = {var: values(obs) for var, obs, title, ax in self.variables}
+        self.effs.record([row[var] for var, obs, title, ax in self.variables], selBits, numBits)
+        if self.sketches:
+            for var in self.sketches.grids:
+                self.sketches.fill(var, row[var], trigBits & self.signalMask)
+        for var, x, y, title, nums in self.hists2D:
+            for label, i in nums:
+                if numBits >> i & 1:
+                    self.book.fill("_".join(part for part in [self.prefix, var, label] if part), row[x], row[y])
+        return True
+
+class EfficiencyEngine(Module):
+    '''
+    All analyses of a spec as one module. parameters overrides the parameters
+    of the analyses by name, e.g. the plateau cuts written by fitEffs.py, and
+    binning the bin edges of their variables, as written by deriveBinning.py.
+    With sketch the variables are also counted on the grids of
+    helpers/sketch.py.
+    '''
+    def __init__(self, spec, hltBitsCache=None, runPartials=None, bootstrap=0, parameters=None, profile=False, sketch=False, binning=None):
+        self.writeHistFile=True
+        self.spec = spec
+        self.runPartials = runPartials
+        self.bootstrap = bootstrap
+        self.sketch = sketch
+        parameters = parameters or {}
+        binning = binning or {}
+
+        self.observables = {}
+        shared = {}
+        for name, d in spec.get("observables", {}).items():
+            d = dict(d)
+            kind = d.pop("kind")
+            if kind not in Observable.kinds:
+                raise ValueError(f"Unknown kind {kind} of observable {name}, choose from {sorted(k for k in Observable.kinds if k)}")
+            obs = Observable.kinds[kind](**d)
+            # One instance per distinct definition, so that it is computed once per event whatever its name
+            self.observables[name] = shared.setdefault(obs.key, obs)
+        self.analyses = [Analysis(name, d, self, parameters.get(name), binning.get(name)) for name, d in spec["analyses"].items()]
+
+        # Plan: the observables each analysis needs (checked here rather than in the event loop),
+        # and one bit mask for the paths of all analyses
+        for a in self.analyses:
+            for name in a.observables():
+                self._check(name, a.name)
+        reference = [p for a in self.analyses for p in a.reference_paths]
+        signal = [p for a in self.analyses for p in a.signal_paths]
+        self.trigBits = TriggerBits(list(dict.fromkeys(reference)), list(dict.fromkeys(signal)), cacheDir=hltBitsCache)
+        for a in self.analyses:
+            a.setBits(self.trigBits)
+        self.values = EventValues(self.observables)
+        self.cuts = list(dict.fromkeys(a.cut for a in self.analyses if a.cut))
+        self.formulas = {}
+
+        # Stage timers (trigger bits, cut strings, each analysis) and cut flows of the analyses, no-op NullTimers unless profiling
+        self.timer = StageTimer("EfficiencyEngine") if profile else NullTimer()
+        if profile:
+            for name, d in spec["analyses"].items():
+                a = [a for a in self.analyses if a.name == name][0]
+                a.cutflow = StageTimer(name, ["all", "referenceTrigger"] + [step for step in d.get("selection", []) if not isinstance(step, dict)])
+
+    def _check(self, name, analysis):
+        if name not in self.observables:
+            raise ValueError(f"Analysis {analysis} uses the undefined observable {name}")
+        for param in self.observables[name].inputs:
+            self._check(getattr(self.observables[name], param), analysis)
+
+    def preselection(self):
+        return self.spec.get("preselection")
+
+    def requiredBranches(self):
+        from helpers.branches import branchesFromCut
+        branches = self.trigBits.branches()
+        for obs in self.observables.values():
+            branches += obs.branches()
+        for cut in self.cuts:
+            branches += branchesFromCut(cut)
+        branches += ["run", "luminosityBlock"] if self.runPartials or self.bootstrap else []
+        branches += ["event"] if self.bootstrap else []
+        return list(dict.fromkeys(branches))
+
+    def beginJob(self, histFile=None, histDirName=None):
+        self.histFile = histFile
+        for a in self.analyses:
+            a.beginJob(histFile, self.runPartials, self.bootstrap, self.sketch)
+        if self.timer:
+            self.timer.beginJob(histFile, "engine")
+
+    def endJob(self):
+        for a in self.analyses:
+            if a.store:
+                writeBookStore(a.store, a.name, a.book)
+            if a.sketchStore:
+                a.sketches.write(a.sketchStore, a.name)
+            hists = a.book.toROOT()
+            if a.cutflow:
+                hists.append(a.cutflow.cutflowHist())
+                print(a.cutflow.table())
+            if self.histFile:
+                prevdir = ROOT.gDirectory
+                self.histFile.mkdir(a.name).cd()
+                for h in hists:
+                    h.Write()
+                prevdir.cd()
+        if self.timer:
+            self.timer.report()
+        if self.histFile:
+            self.histFile.Close()
+
+    def beginFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.trigBits.beginFile(inputFile.GetName(), inputTree)
+        self.formulas = {cut: ROOT.TTreeFormula(f"cut_{i}", cut, inputTree) for i, cut in enumerate(self.cuts)}
+
+    def endFile(self, inputFile, outputFile, inputTree, wrappedOutputTree):
+        self.formulas = {}
+
+    def analyze(self, event):
+        timer = self.timer
+        with timer.stage("triggerBits"):
+            self.values.reset(event)
+            trigBits = self.trigBits.eventBits(event, Object(event, "HLT"))
+        with timer.stage("cuts"):
+            passed = {}
+            for cut, formula in self.formulas.items():
+                formula.GetNdata()
+                passed[cut] = bool(formula.EvalInstance())
+        accepted = False
+        for a in self.analyses:
+            if a.cut and not passed.get(a.cut, True):
+                continue
+            with timer.stage(a.name):
+                accepted |= a.analyze(event, self.values, trigBits)
+        return accepted
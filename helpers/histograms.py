@@ -0,0 +1,585 @@
+import array
+import numpy as np
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from helpers.bootstrap import Bootstrap, replicasToROOT
+
+# Histograms kept as NumPy count arrays during the event loop and converted to
+# TH1F/TH2F objects only at the end of the job. Values are buffered and binned
+# in batches with the same bin finding as TAxis::FindBin, so the resulting
+# histograms are the same as those filled with one TH1::Fill call per entry.
+
+class Axis:
+    def __init__(self, edges=None, nbins=None, low=None, high=None):
+        if edges is not None:
+            self.edges = np.asarray(edges, dtype=np.float64)
+            self.variable = True
+        else:
+            self.edges = np.linspace(low, high, nbins + 1)
+            self.variable = False
+        self.nbins = len(self.edges) - 1
+        self.low, self.high = float(self.edges[0]), float(self.edges[-1])
+
+    def rootArgs(self):
+        if self.variable:
+            return [self.nbins, array.array("d", self.edges)]
+        return [self.nbins, self.low, self.high]
+
+    def index(self, x):
+        '''
+        Bin numbers as given by TAxis::FindBin: 0 for underflow, nbins+1 for overflow (and NaN).
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        if self.variable:
+            return np.searchsorted(self.edges, x, side="right")
+        idx = np.zeros(len(x), dtype=np.int64)
+        inRange = (x >= self.low) & (x < self.high)
+        idx[inRange] = 1 + (self.nbins * (x[inRange] - self.low) / (self.high - self.low)).astype(np.int64)
+        idx[~(x < self.high)] = self.nbins + 1
+        return idx
+
+def eventKeys(run, lumi=None):
+    '''
+    Keys of the per-run (lumi=None) or per-lumi-block partial histograms: run << 32 | lumi.
+    '''
+    keys = np.asarray(run, dtype=np.int64) << 32
+    return keys if lumi is None else keys | np.asarray(lumi, dtype=np.int64)
+
+class RunPartials:
+    '''
+    Sparse bin counts, entries and statistics of one histogram per key
+    (run, or run and lumi block), accumulated next to the global ones.
+    Added entries are collected and only summed up per cell and key once
+    more than maxPending of them are waiting, or when the sums are needed.
+    '''
+    def __init__(self, nstats, maxPending=1000000):
+        self.nstats = nstats
+        self.maxPending = maxPending
+        self._cells = np.zeros((0, 2), dtype=np.int64)    # (key, bin) of the non-empty cells
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._keys = np.zeros(0, dtype=np.int64)
+        self._entries = np.zeros(0, dtype=np.int64)
+        self._stats = np.zeros((0, nstats))
+        self._pending = []
+        self._nPending = 0
+
+    def add(self, keys, bins, inRange, statRows):
+        self.merge(np.stack([keys, bins], axis=1), np.ones(len(keys), dtype=np.int64),
+                   keys, np.ones(len(keys), dtype=np.int64), np.where(inRange[:, None], statRows, 0.))
+
+    def merge(self, cells, counts, keys, entries, stats, scale=1):
+        self._pending.append((cells, scale * counts, keys, scale * entries, scale * stats))
+        self._nPending += len(cells)
+        if self._nPending > self.maxPending:
+            self._consolidate()
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        cells, counts, keys, entries, stats = [np.concatenate([current] + [p[i] for p in self._pending])
+                                               for i, current in enumerate([self._cells, self._counts, self._keys, self._entries, self._stats])]
+        self._pending, self._nPending = [], 0
+
+        # Sum up equal cells and keys, dropping those that cancelled out
+        self._cells, inv = np.unique(cells, axis=0, return_inverse=True)
+        self._counts = np.bincount(inv.ravel(), weights=counts, minlength=len(self._cells)).astype(np.int64)
+        nonzero = self._counts != 0
+        self._cells, self._counts = self._cells[nonzero], self._counts[nonzero]
+
+        self._keys, inv = np.unique(keys, return_inverse=True)
+        inv = inv.ravel()
+        self._entries = np.bincount(inv, weights=entries, minlength=len(self._keys)).astype(np.int64)
+        self._stats = np.stack([np.bincount(inv, weights=stats[:, i], minlength=len(self._keys)) for i in range(self.nstats)], axis=1)
+        nonzero = self._entries != 0
+        self._keys, self._entries, self._stats = self._keys[nonzero], self._entries[nonzero], self._stats[nonzero]
+
+    def cells(self):
+        '''
+        (key, bin) pairs of the non-empty cells and their counts.
+        '''
+        self._consolidate()
+        return self._cells, self._counts
+
+    def keyStats(self):
+        '''
+        Keys with entries, and their numbers of entries and statistics.
+        '''
+        self._consolidate()
+        return self._keys, self._entries, self._stats
+
+class Hist:
+    '''
+    Bin counts, number of entries and statistics of one TH1F or TH2F, and
+    optionally the same per run or lumi block (see RunPartials) and the
+    counts of bootstrap replicas (replicas x bins, see helpers/bootstrap.py).
+    '''
+    def __init__(self, name, title, xaxis, yaxis=None):
+        self.name = name
+        self.title = title
+        self.xaxis = xaxis
+        self.yaxis = yaxis
+        nbins = (xaxis.nbins + 2) * (yaxis.nbins + 2 if yaxis else 1)
+        self.counts = np.zeros(nbins, dtype=np.int64)
+        self.entries = 0
+        # sumw, sumw2, sumwx, sumwx2 (, sumwy, sumwy2, sumwxy) of the in-range entries as in TH1::GetStats
+        self.stats = np.zeros(7 if yaxis else 4)
+        self.partials = None
+        self.replicas = None
+
+    def addIndexed(self, ix, x, iy=None, y=None, keys=None, weights=None):
+        if len(ix) == 0:
+            return
+        self.entries += len(ix)
+        if self.yaxis is None:
+            bins = ix
+            inRange = (ix >= 1) & (ix <= self.xaxis.nbins)
+            rows = [np.ones(len(x)), np.ones(len(x)), x, x * x]
+        else:
+            bins = ix + (self.xaxis.nbins + 2) * iy
+            inRange = (ix >= 1) & (ix <= self.xaxis.nbins) & (iy >= 1) & (iy <= self.yaxis.nbins)
+            rows = [np.ones(len(x)), np.ones(len(x)), x, x * x, y, y * y, x * y]
+        self.counts += np.bincount(bins, minlength=len(self.counts))
+        self.stats += [row[inRange].sum() for row in rows]
+        if self.partials is not None and keys is not None:
+            self.partials.add(keys, bins, inRange, np.stack(rows, axis=1))
+        if self.replicas is not None and weights is not None:
+            self._addReplicas(bins, weights)
+
+    def _addReplicas(self, bins, weights):
+        # Sum the weight rows of equal bins, then add them to the replica columns of those bins
+        order = np.argsort(bins, kind="stable")
+        bins = bins[order]
+        starts = np.flatnonzero(np.r_[True, bins[1:] != bins[:-1]])
+        self.replicas[:, bins[starts]] += np.add.reduceat(weights[order], starts, axis=0, dtype=np.int64).T
+
+    def fill(self, x, y=None, keys=None, weights=None):
+        x = np.asarray(x, dtype=np.float64)
+        if y is None:
+            self.addIndexed(self.xaxis.index(x), x, keys=keys, weights=weights)
+        else:
+            y = np.asarray(y, dtype=np.float64)
+            self.addIndexed(self.xaxis.index(x), x, self.yaxis.index(y), y, keys=keys, weights=weights)
+
+    def toROOT(self):
+        if self.yaxis is None:
+            h = ROOT.TH1F(self.name, self.title, *self.xaxis.rootArgs())
+        else:
+            h = ROOT.TH2F(self.name, self.title, *(self.xaxis.rootArgs() + self.yaxis.rootArgs()))
+        for i in np.nonzero(self.counts)[0]:
+            h.SetBinContent(int(i), float(self.counts[i]))
+        h.SetEntries(self.entries)
+        h.PutStats(array.array("d", self.stats))
+        return h
+
+class SparseHist:
+    '''
+    Counts of an N-dimensional histogram kept for the occupied bins only, as
+    sorted global bin numbers (under- and overflow bins on every axis, first
+    axis fastest, as in TH2) and their counts, so that the memory grows with
+    the number of occupied bins instead of the product of the axes. Filled
+    bins are collected and summed up once more than maxPending of them are
+    waiting, or when the counts are needed (see RunPartials). Written as a
+    THnSparseD; project(), select() and rebin() make lower-dimensional or
+    coarser histograms from it afterwards, and toHist() the TH1F or TH2F.
+    '''
+    def __init__(self, name, title, axes, names=None, maxPending=1000000):
+        self.name = name
+        self.title = title
+        self.axes = list(axes)
+        self.names = list(names) if names else [f"x{i}" for i in range(len(self.axes))]
+        self.shape = np.array([axis.nbins + 2 for axis in self.axes], dtype=np.int64)
+        if np.prod(self.shape.astype(np.float64)) >= 2.**62:
+            raise ValueError(f"Too many bins in {name} for 64-bit bin numbers")
+        self.strides = np.cumprod(np.r_[1, self.shape[:-1]]).astype(np.int64)
+        self.entries = 0
+        self.maxPending = maxPending
+        self._bins = np.zeros(0, dtype=np.int64)
+        self._counts = np.zeros(0, dtype=np.int64)
+        self._pending = []
+        self._nPending = 0
+
+    def fill(self, *values):
+        '''
+        Fill the entries given by one array of values per axis.
+        '''
+        if len(values) != len(self.axes):
+            raise ValueError(f"{self.name} has {len(self.axes)} axes, got {len(values)} arrays")
+        bins = np.zeros(len(values[0]), dtype=np.int64)
+        for axis, stride, x in zip(self.axes, self.strides, values):
+            bins += stride * axis.index(x)
+        self.entries += len(bins)
+        self.addBins(bins, np.ones(len(bins), dtype=np.int64))
+
+    def addBins(self, bins, counts):
+        self._pending.append((bins, counts))
+        self._nPending += len(bins)
+        if self._nPending > self.maxPending:
+            self._consolidate()
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        bins = np.concatenate([self._bins] + [p[0] for p in self._pending])
+        counts = np.concatenate([self._counts] + [p[1] for p in self._pending])
+        self._pending, self._nPending = [], 0
+        self._bins, inv = np.unique(bins, return_inverse=True)
+        self._counts = np.bincount(inv.ravel(), weights=counts, minlength=len(self._bins)).astype(np.int64)
+        nonzero = self._counts != 0
+        self._bins, self._counts = self._bins[nonzero], self._counts[nonzero]
+
+    def cells(self):
+        '''
+        Global bin numbers of the occupied bins and their counts.
+        '''
+        self._consolidate()
+        return self._bins, self._counts
+
+    def binIndices(self):
+        '''
+        Bin numbers on every axis (bins x axes) of the occupied bins, and their counts.
+        '''
+        bins, counts = self.cells()
+        return (bins[:, None] // self.strides) % self.shape, counts
+
+    def _derived(self, axes, names, indices, counts):
+        # The entries of the kept bins, which is all of them for project() and rebin()
+        h = SparseHist(self.name, self.title, axes, names, self.maxPending)
+        h.entries = int(counts.sum())
+        h.addBins(indices @ h.strides, counts)
+        return h
+
+    def project(self, *names):
+        '''
+        Histogram of the given axes, summed over all bins (including under-
+        and overflow) of the others.
+        '''
+        keep = [self.names.index(name) for name in names]
+        indices, counts = self.binIndices()
+        return self._derived([self.axes[i] for i in keep], names, indices[:, keep], counts)
+
+    def select(self, name, low, high):
+        '''
+        Histogram of the bins of an axis with their centre in [low, high).
+        '''
+        i = self.names.index(name)
+        edges = self.axes[i].edges
+        centres = np.r_[-np.inf, 0.5 * (edges[1:] + edges[:-1]), np.inf]
+        indices, counts = self.binIndices()
+        inside = (centres[indices[:, i]] >= low) & (centres[indices[:, i]] < high)
+        return self._derived(self.axes, self.names, indices[inside], counts[inside])
+
+    def rebin(self, name, edges):
+        '''
+        Histogram with the bins of an axis merged to the given edges, a
+        subset of its edges, or every edges-th edge for an integer.
+        '''
+        i = self.names.index(name)
+        old = self.axes[i].edges
+        if np.isscalar(edges):
+            edges = np.r_[old[::int(edges)], old[-1]] if (len(old) - 1) % int(edges) else old[::int(edges)]
+        edges = np.asarray(edges, dtype=np.float64)
+        if not np.all(np.isclose(edges[:, None], old[None, :], rtol=1e-9, atol=1e-12).any(axis=1)):
+            raise ValueError(f"The edges {list(edges)} are not a subset of those of {name}, {list(old)}")
+        axis = Axis(edges)
+        # Old bin number to new one: the bin of the old centre, under- and overflow bins stay such
+        centres = np.r_[-np.inf, 0.5 * (old[1:] + old[:-1]), np.inf]
+        mapping = axis.index(centres)
+        indices, counts = self.binIndices()
+        indices[:, i] = mapping[indices[:, i]]
+        axes = list(self.axes)
+        axes[i] = axis
+        return self._derived(axes, self.names, indices, counts)
+
+    def toHist(self, name=None):
+        '''
+        The Hist (TH1F or TH2F) of a histogram with one or two axes. The
+        values of the entries are not kept, so the statistics are computed
+        from the bin centres, as TH1::ResetStats does for projections.
+        '''
+        if len(self.axes) > 2:
+            raise ValueError(f"{self.name} has {len(self.axes)} axes, project it to one or two first")
+        h = Hist(name or self.name, self.title, *self.axes)
+        bins, counts = self.cells()
+        h.counts[bins] = counts
+        h.entries = self.entries
+        indices, counts = self.binIndices()
+        inRange = np.all((indices >= 1) & (indices <= self.shape - 2), axis=1)
+        indices, w = indices[inRange], counts[inRange].astype(np.float64)
+        centres = [0.5 * (axis.edges[1:] + axis.edges[:-1]) for axis in self.axes]
+        x = centres[0][indices[:, 0] - 1]
+        rows = [w, w, w * x, w * x * x]
+        if len(self.axes) == 2:
+            y = centres[1][indices[:, 1] - 1]
+            rows += [w * y, w * y * y, w * x * y]
+        h.stats = np.array([row.sum() for row in rows])
+        return h
+
+    def toROOT(self):
+        ndim = len(self.axes)
+        h = ROOT.THnSparseD(self.name, self.title, ndim, array.array("i", [axis.nbins for axis in self.axes]),
+                            array.array("d", [axis.low for axis in self.axes]), array.array("d", [axis.high for axis in self.axes]))
+        for i, (axis, name) in enumerate(zip(self.axes, self.names)):
+            if axis.variable:
+                h.SetBinEdges(i, array.array("d", axis.edges))
+            h.GetAxis(i).SetName(name)
+        indices, counts = self.binIndices()
+        for index, count in zip(indices, counts):
+            h.SetBinContent(array.array("i", index.tolist()), float(count))
+        h.SetEntries(self.entries)
+        return h
+
+    @classmethod
+    def fromROOT(cls, h, name=None):
+        '''
+        SparseHist of a THnSparse, e.g. read back from a histogram file.
+        '''
+        axes, names = [], []
+        for i in range(h.GetNdimensions()):
+            axis = h.GetAxis(i)
+            n = axis.GetNbins()
+            if axis.GetXbins().GetSize():
+                axes.append(Axis([axis.GetBinLowEdge(j) for j in range(1, n + 2)]))
+            else:
+                axes.append(Axis(nbins=n, low=axis.GetXmin(), high=axis.GetXmax()))
+            names.append(axis.GetName())
+        sparse = cls(name or h.GetName(), h.GetTitle(), axes, names)
+        coords = array.array("i", [0] * len(axes))
+        indices, counts = [], []
+        for i in range(h.GetNbins()):
+            counts.append(h.GetBinContent(i, coords))
+            indices.append(list(coords))
+        if indices:
+            sparse.addBins(np.array(indices, dtype=np.int64) @ sparse.strides, np.rint(counts).astype(np.int64))
+        sparse.entries = int(h.GetEntries())
+        return sparse
+
+class HistBook:
+    '''
+    Collection of histograms filled through buffers. fill() takes single
+    values and appends them to a buffer that is binned every bufferSize
+    entries, fillArray() takes arrays and bins them right away.
+
+    With split="run" or split="lumi" every histogram also keeps its counts
+    per run or per lumi block, and with bootstrap=N the counts of N Poisson
+    bootstrap replicas. Both need to know the event of every entry: the
+    per-event loop sets it with setEvent(), the columnar code sets the
+    events of a chunk with setChunk() and passes the positions in the chunk
+    of the filled entries to fillArray().
+    '''
+    def __init__(self, bufferSize=100000, split=None, bootstrap=0):
+        if split not in [None, "run", "lumi"]:
+            raise ValueError(f"Cannot split the histograms by {split}")
+        self.hists = {}
+        self.buffers = {}
+        self.specs = []
+        self.sparse = {}
+        self.sparseBuffers = {}
+        self.bufferSize = bufferSize
+        self.split = split
+        self.bootstrap = Bootstrap(bootstrap) if bootstrap else None
+        self.key = 0
+        self.eventId = 0
+        self.chunkKeys = None
+        self.chunkIds = None
+
+    def book(self, name, title, xaxis, yaxis=None):
+        h = self.hists[name] = Hist(name, title, xaxis, yaxis)
+        if self.split:
+            h.partials = RunPartials(7 if yaxis else 4)
+        if self.bootstrap:
+            h.replicas = np.zeros((self.bootstrap.nReplicas, len(h.counts)), dtype=np.int64)
+        self.buffers[name] = (array.array("d"), array.array("d") if yaxis else None, array.array("q"), array.array("Q"))
+        return h
+
+    def bookSparse(self, name, title, axes, names=None):
+        '''
+        Book a SparseHist, filled without run partials or bootstrap replicas.
+        '''
+        h = self.sparse[name] = SparseHist(name, title, axes, names)
+        self.sparseBuffers[name] = array.array("d")
+        return h
+
+    def setEvent(self, run, lumi, event=0):
+        self.key = (int(run) << 32) | (int(lumi) if self.split == "lumi" else 0)
+        if self.bootstrap:
+            self.eventId = self.bootstrap.eventId(run, lumi, event)
+
+    def setChunk(self, run, lumi, event):
+        '''
+        Columnar version of setEvent() for the events of a chunk.
+        '''
+        if self.split:
+            self.chunkKeys = self.eventKeys(run, lumi)
+        if self.bootstrap:
+            self.chunkIds = self.bootstrap.eventIds(run, lumi, event)
+
+    def eventKeys(self, run, lumi):
+        return eventKeys(run, lumi if self.split == "lumi" else None)
+
+    def chunkTags(self, index):
+        '''
+        Run keys and bootstrap ids of the chunk events at the given positions.
+        '''
+        keys = self.chunkKeys[index] if self.split and index is not None else None
+        ids = self.chunkIds[index] if self.bootstrap and index is not None else None
+        return keys, ids
+
+    def fill(self, name, x, y=None):
+        bx, by, bk, bi = self.buffers[name]
+        bx.append(x)
+        if by is not None:
+            by.append(y)
+        if self.split:
+            bk.append(self.key)
+        if self.bootstrap:
+            bi.append(self.eventId)
+        if len(bx) >= self.bufferSize:
+            self._flushBuffer(name)
+
+    def fillArray(self, name, x, y=None, index=None):
+        self._fill(name, np.asarray(x, dtype=np.float64), None if y is None else np.asarray(y, dtype=np.float64), *self.chunkTags(index))
+
+    def fillSparse(self, name, *values):
+        buffer = self.sparseBuffers[name]
+        buffer.extend(values)
+        if len(buffer) >= self.bufferSize * len(values):
+            self._flushSparse(name)
+
+    def fillSparseArrays(self, name, *values):
+        self.sparse[name].fill(*[np.asarray(x, dtype=np.float64) for x in values])
+
+    def _flushSparse(self, name):
+        buffer = self.sparseBuffers[name]
+        if len(buffer) == 0:
+            return
+        h = self.sparse[name]
+        h.fill(*np.frombuffer(buffer, dtype=np.float64).reshape(-1, len(h.axes)).T)
+        self.sparseBuffers[name] = array.array("d")
+
+    def _fill(self, name, x, y, keys, ids):
+        h = self.hists[name]
+        if ids is None:
+            h.fill(x, y, keys=keys)
+            return
+        # The weights of all replicas take events x replicas bytes, compute them in blocks
+        for block in self.bootstrap.blocks(len(x)):
+            h.fill(x[block], None if y is None else y[block], keys=None if keys is None else keys[block],
+                   weights=self.bootstrap.weights(ids[block]))
+
+    def _flushBuffer(self, name):
+        bx, by, bk, bi = self.buffers[name]
+        if len(bx) == 0:
+            return
+        self._fill(name, np.frombuffer(bx, dtype=np.float64), None if by is None else np.frombuffer(by, dtype=np.float64),
+                   np.frombuffer(bk, dtype=np.int64) if self.split else None,
+                   np.frombuffer(bi, dtype=np.uint64) if self.bootstrap else None)
+        self.buffers[name] = (array.array("d"), None if by is None else array.array("d"), array.array("q"), array.array("Q"))
+
+    def flush(self):
+        for name in self.buffers:
+            self._flushBuffer(name)
+        for name in self.sparseBuffers:
+            self._flushSparse(name)
+        for spec in self.specs:
+            spec.flush()
+
+    def toROOT(self):
+        '''
+        The histograms and sparse histograms, followed by the replicas of each
+        of the histograms if bootstrapping.
+        '''
+        self.flush()
+        hists = [h.toROOT() for h in self.hists.values()]
+        hists += [h.toROOT() for h in self.sparse.values()]
+        if self.bootstrap:
+            hists += [replicasToROOT(h.name, h.replicas) for h in self.hists.values()]
+        return hists
+
+class EfficiencySpec:
+    '''
+    Denominator and numerator histograms for every combination of variable,
+    selection and numerator, named {prefix}_{variable}[_{numerator}][_{selection}].
+    The empty selection and numerator names stand for "no selection" and the
+    denominator. For each event one row of values is recorded together with
+    bit masks of the passed selections and numerators (bit i for the i-th
+    entry of the lists); the rows are binned into all histograms in batches.
+    '''
+    def __init__(self, prefix, variables, selections, numerators, bufferSize=100000):
+        self.prefix = prefix
+        self.variables = variables     # list of (name, title, Axis)
+        self.selections = selections
+        self.numerators = numerators
+        self.bufferSize = bufferSize
+        self.hists = {}
+        self.histBook = None
+        self._reset()
+
+    def name(self, var, numerator="", selection=""):
+        return "_".join(part for part in [self.prefix, var, numerator, selection] if part)
+
+    def book(self, book):
+        for var, title, axis in self.variables:
+            for sel in self.selections:
+                for num in self.numerators:
+                    self.hists[(var, num, sel)] = book.book(self.name(var, num, sel), title, axis)
+        book.specs.append(self)
+        self.histBook = book
+
+    def _reset(self):
+        self._values = array.array("d")
+        self._selBits = array.array("q")
+        self._numBits = array.array("q")
+        self._keys = array.array("q")
+        self._ids = array.array("Q")
+
+    def record(self, values, selBits, numBits):
+        self._values.extend(values)
+        self._selBits.append(selBits)
+        self._numBits.append(numBits)
+        if self.histBook.split:
+            self._keys.append(self.histBook.key)
+        if self.histBook.bootstrap:
+            self._ids.append(self.histBook.eventId)
+        if len(self._selBits) >= self.bufferSize:
+            self.flush()
+
+    def recordArrays(self, values, selMasks, numMasks, index=None):
+        '''
+        Columnar version of record(): one array per variable, and one boolean
+        array per selection and per numerator, and the positions of the events
+        in the chunk given to HistBook.setChunk().
+        '''
+        self._fill([np.asarray(v, dtype=np.float64) for v in values], selMasks, numMasks, *self.histBook.chunkTags(index))
+
+    def flush(self):
+        if len(self._selBits) == 0:
+            return
+        values = np.frombuffer(self._values, dtype=np.float64).reshape(-1, len(self.variables))
+        selBits = np.frombuffer(self._selBits, dtype=np.int64)
+        numBits = np.frombuffer(self._numBits, dtype=np.int64)
+        self._fill([values[:, i] for i in range(len(self.variables))],
+                   [(selBits >> i) & 1 == 1 for i in range(len(self.selections))],
+                   [(numBits >> i) & 1 == 1 for i in range(len(self.numerators))],
+                   np.frombuffer(self._keys, dtype=np.int64) if self.histBook.split else None,
+                   np.frombuffer(self._ids, dtype=np.uint64) if self.histBook.bootstrap else None)
+        self._reset()
+
+    def _fill(self, values, selMasks, numMasks, keys=None, ids=None):
+        if ids is not None:
+            # One block of bootstrap weights for all histograms, so that they all see the same weights of an event
+            bootstrap = self.histBook.bootstrap
+            for block in bootstrap.blocks(len(ids)):
+                self._fillBlock([x[block] for x in values], [m[block] for m in selMasks], [m[block] for m in numMasks],
+                                None if keys is None else keys[block], bootstrap.weights(ids[block]))
+        else:
+            self._fillBlock(values, selMasks, numMasks, keys, None)
+
+    def _fillBlock(self, values, selMasks, numMasks, keys, weights):
+        indices = [axis.index(x) for (var, title, axis), x in zip(self.variables, values)]
+        for sel, selMask in zip(self.selections, selMasks):
+            for num, numMask in zip(self.numerators, numMasks):
+                mask = selMask & numMask
+                for (var, title, axis), x, idx in zip(self.variables, values, indices):
+                    self.hists[(var, num, sel)].addIndexed(idx[mask], x[mask], keys=None if keys is None else keys[mask],
+                                                           weights=None if weights is None else weights[mask])
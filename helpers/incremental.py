@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import shutil
+import hashlib
+import zlib
+from helpers.parallel import runJobs, mergeHistFiles, addHistFiles
+from helpers.runstore import mergeStoreFiles, moveStores, removeStores
+
+# Incremental processing: a ledger directory keeps, for every input file that
+# went into the output histogram file, its size, modification time and, where
+# it is cheap, checksum together with the histogram file of that input alone.
+# A rerun only processes inputs that are new or whose (size, mtime) changed,
+# adds their histograms to the existing output and subtracts the old
+# histograms of changed and removed inputs. Checksums come from the EOS
+# extended attribute; the files are only read in full to compute one if
+# requested (verify), so that a touched but unchanged file is not redone.
+# The per-run partials written next to the histogram files (see
+# helpers/runstore.py) are updated the same way.
+
+LEDGER = "ledger.json"
+
+def fileStamp(fname):
+    st = os.stat(fname)
+    return [st.st_size, int(st.st_mtime)]
+
+def fileChecksum(fname, compute=False, blockSize=16 * 1024**2):
+    '''
+    Adler-32 checksum of the file content, as used by EOS. On an EOS FUSE
+    mount the checksum stored by EOS is used. Elsewhere the file is only read
+    to compute it with compute=True, and None is returned otherwise.
+    '''
+    try:
+        return os.getxattr(fname, "eos.checksum").decode().strip()
+    except (OSError, AttributeError):
+        pass
+    if not compute:
+        return None
+    checksum = 1
+    with open(fname, "rb") as fin:
+        for block in iter(lambda: fin.read(blockSize), b""):
+            checksum = zlib.adler32(block, checksum)
+    return "%08x" % checksum
+
+def scriptConfig(script, options):
+    '''
+    Everything that changes the histograms of an input apart from its
+    content: the driver script and the options that affect the histograms,
+    with the content of the options that are files (e.g. a lumi mask).
+    A different config invalidates the ledger.
+    '''
+    with open(script, "rb") as fin:
+        digest = hashlib.sha1(fin.read()).hexdigest()
+    files = {}
+    for option in options:
+        if os.path.isfile(option):
+            with open(option, "rb") as fin:
+                files[option] = hashlib.sha1(fin.read()).hexdigest()
+    return {"script": os.path.basename(script), "sha1": digest, "options": options, "files": files}
+
+class Ledger:
+    def __init__(self, ledgerDir):
+        self.ledgerDir = ledgerDir
+        self.partsDir = os.path.join(ledgerDir, "parts")
+        os.makedirs(self.partsDir, exist_ok=True)
+        self.path = os.path.join(ledgerDir, LEDGER)
+        self.data = {"config": None, "output": None, "inputs": {}}
+        if os.path.exists(self.path):
+            with open(self.path) as fin:
+                self.data = json.load(fin)
+
+    @property
+    def inputs(self):
+        return self.data["inputs"]
+
+    def partFile(self, fname):
+        return os.path.join(self.partsDir, hashlib.sha1(os.path.abspath(fname).encode()).hexdigest() + ".root")
+
+    def reset(self, config):
+        for entry in self.inputs.values():
+            if os.path.exists(entry["part"]):
+                os.remove(entry["part"])
+            removeStores(entry["part"])
+        self.data = {"config": config, "output": None, "inputs": {}}
+
+    def save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as fout:
+            json.dump(self.data, fout, indent=1)
+        os.replace(tmp, self.path)
+
+def classify(ledger, files, checksums, verify=False):
+    '''
+    Split the inputs into (new, changed, unchanged, removed). A file whose
+    size or modification time differ from the ledger is changed, unless
+    its checksum is available (from EOS, or computed with verify) and the
+    same as in the ledger. Checksums are stored in the checksums dict.
+    '''
+    new, changed, unchanged = [], [], []
+    for fname in files:
+        entry = ledger.inputs.get(fname)
+        if entry is None:
+            new.append(fname)
+        elif fileStamp(fname) == entry["stamp"]:
+            unchanged.append(fname)
+        else:
+            checksums[fname] = fileChecksum(fname, verify)
+            if checksums[fname] is not None and checksums[fname] == entry["checksum"]:
+                entry["stamp"] = fileStamp(fname)
+                unchanged.append(fname)
+            else:
+                changed.append(fname)
+    current = set(files)
+    removed = [fname for fname in ledger.inputs if fname not in current]
+    return new, changed, unchanged, removed
+
+def runIncremental(script, files, histFileName, ledgerDir, jobs=1, retries=1, extraArgs=None, options=None, verify=False):
+    '''
+    Bring histFileName up to date with the input files, processing only the
+    inputs that are not yet in it (one driver job per file, with extraArgs)
+    and subtracting those that changed or are no longer in the list. options
+    lists the driver options that change the histograms; the ledger is reset
+    if they differ from the last run. With verify the checksums of inputs
+    without an EOS checksum are computed by reading the files.
+    '''
+    extraArgs, options = extraArgs or [], options or []
+    ledger = Ledger(ledgerDir)
+    config = scriptConfig(script, options)
+    if ledger.data["config"] != config:
+        if ledger.inputs:
+            print("Driver or options changed since the last run, reprocessing all inputs")
+        ledger.reset(config)
+    elif os.path.exists(histFileName) and ledger.data["output"] != fileStamp(histFileName):
+        # The output was modified or replaced outside of this ledger, rebuild it from the per-file histograms
+        print(f"{histFileName} does not match the ledger, rebuilding it from the per-input histograms")
+        ledger.data["output"] = None
+
+    checksums = {}
+    new, changed, unchanged, removed = classify(ledger, files, checksums, verify)
+    print(f"Incremental update of {histFileName}: {len(new)} new, {len(changed)} changed, {len(unchanged)} unchanged, {len(removed)} removed inputs")
+
+    # Process the new and changed inputs, one job and one histogram file per input
+    todo = new + changed
+    workDir = os.path.join(ledgerDir, f"work_{os.getpid()}")
+    os.makedirs(workDir, exist_ok=True)
+    outputs = [os.path.join(workDir, os.path.basename(ledger.partFile(fname))) for fname in todo]
+    t0 = time.time()
+    failed = runJobs(script, [[fname] for fname in todo], outputs, jobs, extraArgs, retries, workDir)
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(todo)} jobs failed, {histFileName} and the ledger were not updated")
+
+    # Update a copy of the output and swap it in, so that a failure leaves the previous version intact
+    subtract = [ledger.inputs[fname]["part"] for fname in changed + removed]
+    tmp = os.path.join(workDir, os.path.basename(histFileName))
+    if ledger.data["output"] is None or not os.path.exists(histFileName):
+        parts = [ledger.inputs[fname]["part"] for fname in unchanged] + outputs
+        if parts:
+            mergeHistFiles(tmp, parts)
+            mergeStoreFiles(tmp, parts)
+    else:
+        shutil.copy2(histFileName, tmp)
+        moveStores(histFileName, tmp, copy=True)
+        if outputs:
+            addHistFiles(tmp, outputs, 1.)
+        if subtract:
+            addHistFiles(tmp, subtract, -1.)
+        if outputs or subtract:
+            mergeStoreFiles(tmp, [tmp] + outputs + subtract, [1] * (1 + len(outputs)) + [-1] * len(subtract))
+
+    for fname in removed:
+        part = ledger.inputs.pop(fname)["part"]
+        os.remove(part)
+        removeStores(part)
+    for fname, output in zip(todo, outputs):
+        part = ledger.partFile(fname)
+        os.replace(output, part)
+        removeStores(part)
+        moveStores(output, part)
+        ledger.inputs[fname] = {"stamp": fileStamp(fname), "checksum": checksums.get(fname) or fileChecksum(fname, verify), "part": part, "added": time.time()}
+
+    if os.path.exists(tmp):
+        os.replace(tmp, histFileName)
+        removeStores(histFileName)
+        moveStores(tmp, histFileName)
+        ledger.data["output"] = fileStamp(histFileName)
+    elif os.path.exists(histFileName):
+        # All inputs were removed
+        os.remove(histFileName)
+        removeStores(histFileName)
+        ledger.data["output"] = None
+    ledger.save()
+    shutil.rmtree(workDir)
+    print(f"Processed {len(todo)} inputs in {time.time()-t0:.1f} s, {histFileName} now holds {len(ledger.inputs)} inputs")
+    return histFileName
@@ -0,0 +1,178 @@
+import os, sys
+import numpy as np
+
+# Efficiency lookup tables for applying the trigger efficiencies per event
+# downstream, e.g. from h_AK8_mSD_vs_pt_passTrgOR / h_AK8_mSD_vs_pt or
+# h_met_pt_vs_pv_passed / h_met_pt_vs_pv_all. An EfficiencyLookup keeps the
+# bin edges and the efficiencies as flat float64 arrays (x fastest) and finds
+# the bins of whole arrays of points at once: with the index arithmetic of
+# TAxis::FindFixBin for equal-width axes and a binary search otherwise. Points
+# outside the axes are clamped to the first or last bin. With interpolate the
+# efficiency is interpolated linearly (bilinearly in 2D) between the bin
+# centres, and constant beyond the outer centres. Empty (NaN) bins are left out
+# of the interpolation, with the weights of the other neighbours renormalised,
+# and points with a NaN coordinate give NaN. The tables are built from the
+# histograms, from the table of exportEffs.py (without ROOT) or from a .npz
+# file written by save(), and evaluated in chunks so that the temporary index
+# arrays stay in the cache:
+#
+#   lookup = EfficiencyLookup.fromHistograms(num, den)
+#   eff = lookup(pt, mSD)
+
+class EfficiencyLookup:
+    def __init__(self, xedges, eff, yedges=None, interpolate=False, empty=np.nan, chunkSize=65536):
+        self.xedges = np.ascontiguousarray(xedges, dtype=np.float64)
+        self.yedges = None if yedges is None else np.ascontiguousarray(yedges, dtype=np.float64)
+        self.nx = len(self.xedges) - 1
+        self.ny = 1 if self.yedges is None else len(self.yedges) - 1
+        eff = np.array(eff, dtype=np.float64).reshape(-1)
+        if len(eff) != self.nx * self.ny:
+            raise ValueError(f"Expected {self.nx * self.ny} efficiencies for {self.nx} x {self.ny} bins, got {len(eff)}")
+        # Bins without events
+        eff[np.isnan(eff)] = empty
+        self.eff = eff
+        self.interpolate = interpolate
+        self.chunkSize = chunkSize
+        self.xuniform = uniformAxis(self.xedges)
+        self.yuniform = None if self.yedges is None else uniformAxis(self.yedges)
+
+    @property
+    def dimension(self):
+        return 1 if self.yedges is None else 2
+
+    @classmethod
+    def fromHistograms(cls, num, den, **kwargs):
+        '''
+        Lookup of num/den, two TH1 or TH2 with the same binning.
+        '''
+        xedges = axisEdges(den.GetXaxis())
+        yedges = axisEdges(den.GetYaxis()) if den.GetDimension() > 1 else None
+        nx, ny = len(xedges) - 1, 1 if yedges is None else len(yedges) - 1
+        cells = [den.GetBin(ix, iy) if yedges is not None else ix for iy in range(1, ny + 1) for ix in range(1, nx + 1)]
+        k = np.array([num.GetBinContent(cell) for cell in cells])
+        n = np.array([den.GetBinContent(cell) for cell in cells])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            eff = np.where(n > 0, k / n, np.nan)
+        return cls(xedges, eff, yedges, **kwargs)
+
+    @classmethod
+    def fromTable(cls, table, analysis, variable, selection="", path="OR", column="eff", **kwargs):
+        '''
+        Lookup of one efficiency of a helpers.effstable.EfficiencyTable.
+        '''
+        bins = table.get(analysis, variable, selection, path)
+        xlow, xhigh = bins.column("xlow").to_numpy(), bins.column("xhigh").to_numpy()
+        ylow, yhigh = bins.column("ylow").to_numpy(), bins.column("yhigh").to_numpy()
+        xedges = np.append(np.unique(xlow), xhigh.max())
+        yedges = None if np.isnan(ylow).all() else np.append(np.unique(ylow), yhigh.max())
+        return cls(xedges, bins.column(column).to_numpy(), yedges, **kwargs)
+
+    def save(self, path):
+        arrays = {"xedges": self.xedges, "eff": self.eff}
+        if self.yedges is not None:
+            arrays["yedges"] = self.yedges
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        with np.load(path) as f:
+            return cls(f["xedges"], f["eff"], f["yedges"] if "yedges" in f else None, **kwargs)
+
+    def __call__(self, x, y=None, out=None):
+        return self.evaluate(x, y, out)
+
+    def evaluate(self, x, y=None, out=None):
+        '''
+        Efficiencies at the points (x) or (x, y), as a float64 array of their shape.
+        '''
+        x = np.asarray(x, dtype=np.float64)
+        if (y is None) != (self.yedges is None):
+            raise ValueError(f"The lookup table is {self.dimension}D")
+        if y is not None:
+            y = np.asarray(y, dtype=np.float64)
+            if y.shape != x.shape:
+                raise ValueError(f"x and y have different shapes, {x.shape} and {y.shape}")
+        if out is None:
+            out = np.empty(x.shape, dtype=np.float64)
+        xs, ys, outs = x.reshape(-1), None if y is None else y.reshape(-1), out.reshape(-1)
+        for start in range(0, len(xs), self.chunkSize):
+            chunk = slice(start, start + self.chunkSize)
+            if self.interpolate:
+                self.interpolateChunk(xs[chunk], None if ys is None else ys[chunk], outs[chunk])
+            else:
+                index = findBins(self.xedges, self.xuniform, xs[chunk])
+                if ys is not None:
+                    index += self.nx * findBins(self.yedges, self.yuniform, ys[chunk])
+                np.take(self.eff, index, out=outs[chunk])
+            # NaN coordinates give NaN
+            np.copyto(outs[chunk], xs[chunk], where=np.isnan(xs[chunk]))
+            if ys is not None:
+                np.copyto(outs[chunk], ys[chunk], where=np.isnan(ys[chunk]))
+        return out
+
+    def interpolateChunk(self, x, y, out):
+        ix, fx = centreWeights(self.xedges, x)
+        dx = int(self.nx > 1)
+        if y is None:
+            corners = [(ix, 1. - fx), (ix + dx, fx)]
+        else:
+            iy, fy = centreWeights(self.yedges, y)
+            low = iy * self.nx + ix
+            high = low + self.nx * (self.ny > 1)
+            corners = [(low, (1. - fx) * (1. - fy)), (low + dx, fx * (1. - fy)), (high, (1. - fx) * fy), (high + dx, fx * fy)]
+        # Empty neighbours (NaN) drop out, 0 * NaN would be NaN even at zero weight
+        total = np.zeros(len(x))
+        weights = np.zeros(len(x))
+        for index, w in corners:
+            eff = self.eff[index]
+            filled = np.isfinite(eff) & (w > 0)
+            total += np.where(filled, w * eff, 0.)
+            weights += np.where(filled, w, 0.)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out[:] = np.where(weights > 0, total / weights, np.nan)
+
+def axisEdges(axis):
+    n = axis.GetNbins()
+    return np.array([axis.GetBinLowEdge(i) for i in range(1, n + 2)])
+
+def uniformAxis(edges):
+    '''
+    (low edge, high edge) of an axis of equal-width bins, None otherwise.
+    '''
+    widths = np.diff(edges)
+    if np.allclose(widths, widths[0], rtol=1e-9, atol=0.):
+        return edges[0], edges[-1]
+    return None
+
+def findBins(edges, uniform, values):
+    '''
+    0-based bin numbers of the values, clamped to the first and last bin, the
+    first bin for NaN.
+    '''
+    n = len(edges) - 1
+    if uniform:
+        low, high = uniform
+        # As TAxis::FindFixBin, clamped before the conversion to integers
+        position = (values - low) * n
+        position /= high - low
+        np.fmax(position, 0., out=position)
+        np.fmin(position, n - 1, out=position)
+        return position.astype(np.intp)
+    index = np.searchsorted(edges, values, side="right") - 1
+    np.clip(index, 0, n - 1, out=index)
+    # NaN sorts last, take the first bin as the uniform case does
+    index[np.isnan(values)] = 0
+    return index
+
+def centreWeights(edges, values):
+    '''
+    Lower neighbouring bin (0-based) of the values between the bin centres, and
+    the weight of the upper one.
+    '''
+    n = len(edges) - 1
+    if n == 1:
+        return np.zeros(len(values), dtype=np.intp), np.zeros(len(values))
+    centres = 0.5 * (edges[1:] + edges[:-1])
+    position = np.nan_to_num(np.interp(values, centres, np.arange(n, dtype=np.float64)))
+    index = np.clip(position.astype(np.intp), 0, n - 2)
+    return index, position - index
@@ -0,0 +1,62 @@
+import json
+import bisect
+import numpy as np
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from PhysicsTools.NanoAODTools.postprocessing.framework.eventloop import Module
+from helpers.histograms import eventKeys
+
+class LumiMask:
+    '''
+    Certified lumi blocks of a golden JSON file, {"run": [[first, last], ...], ...},
+    kept as sorted, non-overlapping intervals of run << 32 | lumi keys, so that
+    a lookup is a binary search instead of dictionary and list scans.
+    '''
+    def __init__(self, lumis):
+        if isinstance(lumis, str):
+            with open(lumis) as fin:
+                lumis = json.load(fin)
+        intervals = sorted((int(run) << 32 | first, int(run) << 32 | last)
+                           for run, ranges in lumis.items() for first, last in ranges)
+        merged = []
+        for start, end in intervals:
+            if merged and start <= merged[-1][1] + 1:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        self.starts = np.array([start for start, end in merged], dtype=np.int64)
+        self.ends = np.array([end for start, end in merged], dtype=np.int64)
+        self._startList = self.starts.tolist()
+        self._last = (None, False)
+
+    def contains(self, run, lumi):
+        key = (int(run) << 32) | int(lumi)
+        # Consecutive events mostly come from the same lumi block
+        if key != self._last[0]:
+            i = bisect.bisect_right(self._startList, key) - 1
+            self._last = (key, i >= 0 and key <= self.ends[i])
+        return self._last[1]
+
+    def containsArray(self, run, lumi):
+        keys = eventKeys(run, lumi)
+        i = np.searchsorted(self.starts, keys, side="right") - 1
+        return (i >= 0) & (keys <= self.ends[np.maximum(i, 0)])
+
+    def runs(self):
+        return np.unique(self.starts >> 32)
+
+class LumiFilter(Module):
+    '''
+    Drop the events outside of the lumi mask; put it before the analysis
+    modules so that they never see those events.
+    '''
+    def __init__(self, lumiMask):
+        self.writeHistFile = False
+        self.lumiMask = lumiMask if isinstance(lumiMask, LumiMask) else LumiMask(lumiMask)
+
+    def requiredBranches(self):
+        return ["run", "luminosityBlock"]
+
+    def analyze(self, event):
+        return bool(self.lumiMask.contains(event.run, event.luminosityBlock))
@@ -0,0 +1,194 @@
+import os, sys
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from helpers.runstore import mergeStoreFiles
+from helpers.sketch import mergeSketchFiles
+from helpers.profiling import mergeFoldedFiles
+from helpers.chunked import clusterStarts, entryRanges
+
+def mergeHistFiles(output, inputs):
+    '''
+    Merge the histogram files in the given order into output, keeping the
+    directory layout. Histograms with the same name are added bin by bin.
+    '''
+    merger = ROOT.TFileMerger(False)
+    merger.SetPrintLevel(0)
+    if not merger.OutputFile(output, "RECREATE"):
+        raise RuntimeError(f"Cannot open {output} for writing")
+    for fname in inputs:
+        if not merger.AddFile(fname):
+            raise RuntimeError(f"Cannot add {fname} to the merge")
+    if not merger.Merge():
+        raise RuntimeError(f"Merging into {output} failed")
+
+def addHistFiles(output, inputs, scale=1.):
+    '''
+    Add the histograms of the input files, scaled by scale, to those with the
+    same path in output, in place. With scale=-1 the inputs are subtracted
+    again, which undoes an earlier merge of the same files.
+    '''
+    fout = ROOT.TFile.Open(output, "UPDATE")
+    if not fout or fout.IsZombie():
+        raise RuntimeError(f"Cannot open {output} for update")
+    for fname in inputs:
+        fin = ROOT.TFile.Open(fname)
+        if not fin or fin.IsZombie():
+            raise RuntimeError(f"Cannot open {fname}")
+        _addDirectory(fout, fin, scale)
+        fin.Close()
+    fout.Close()
+
+def _addDirectory(dout, din, scale):
+    for key in din.GetListOfKeys():
+        obj = key.ReadObj()
+        if obj.InheritsFrom("TDirectory"):
+            _addDirectory(dout.GetDirectory(key.GetName()) or dout.mkdir(key.GetName()), obj, scale)
+            continue
+        if not obj.InheritsFrom("TH1") and not obj.InheritsFrom("THnBase"):
+            continue
+        h = dout.Get(key.GetName())
+        if h:
+            h.Add(obj, scale)
+        elif scale > 0:
+            h = obj.Clone(key.GetName())
+            h.Scale(scale)
+        else:
+            raise RuntimeError(f"Cannot subtract {key.GetName()}, it is missing in {dout.GetPath()}")
+        dout.cd()
+        h.Write(key.GetName(), ROOT.TObject.kOverwrite)
+
+def chunkFiles(files, filesPerJob):
+    return [files[i:i+filesPerJob] for i in range(0, len(files), filesPerJob)]
+
+def _treeLayout(fname, treeName):
+    '''
+    Number of entries and cluster starts of the tree in one file.
+    '''
+    f = ROOT.TFile.Open(fname)
+    if not f or f.IsZombie():
+        raise RuntimeError(f"Cannot open {fname}")
+    tree = f.Get(treeName)
+    layout = (tree.GetEntries(), clusterStarts(tree))
+    f.Close()
+    return layout
+
+def planTasks(files, nTasks, treeName="Events", workers=1):
+    '''
+    Split the input files into about nTasks (file, first entry, last entry)
+    tasks of similar size. Files larger than the target size are split on
+    cluster boundaries, smaller files make one task each. The files are
+    opened by up to `workers` processes at a time, which hides the latency
+    of remote files.
+    '''
+    if workers > 1 and len(files) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(files))) as pool:
+            entries = dict(zip(files, pool.map(_treeLayout, files, [treeName] * len(files))))
+    else:
+        entries = {fname: _treeLayout(fname, treeName) for fname in files}
+    target = max(1, -(-sum(n for n, clusters in entries.values()) // max(nTasks, 1)))
+    tasks = []
+    for fname in files:
+        n, clusters = entries[fname]
+        tasks += [(fname, first, last) for first, last in entryRanges(n, clusters, lambda: target)]
+    return tasks
+
+def _runJob(script, chunk, output, extraArgs, retries, logDir):
+    '''
+    Run the driver script on one chunk of files in a fresh interpreter, so that
+    a crash in ROOT only takes down this job. Returns None on success or the
+    path of the log of the last failed attempt.
+    '''
+    cmd = [sys.executable, script, "--jobs", "1", "--output", output, "--input"] + chunk + extraArgs
+    for attempt in range(retries + 1):
+        log = os.path.join(logDir, os.path.basename(output).replace(".root", f".try{attempt}.log"))
+        with open(log, "w") as flog:
+            ret = subprocess.call(cmd, stdout=flog, stderr=subprocess.STDOUT)
+        if ret == 0 and os.path.exists(output):
+            return None
+        print(f"Job on {chunk} failed with exit code {ret} (attempt {attempt+1}/{retries+1}), see {log}")
+    return log
+
+def runJobs(script, chunks, outputs, jobs, extraArgs, retries, logDir, jobArgs=None):
+    '''
+    Run one driver job per chunk of files writing to the matching output,
+    using up to `jobs` jobs at a time, with the matching jobArgs added to the
+    arguments of each job if given. Returns the (chunk, log) pairs of the
+    jobs that still failed after the retries.
+    '''
+    script = os.path.abspath(script)
+    jobArgs = jobArgs or [[] for chunk in chunks]
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        results = list(pool.map(lambda job: _runJob(script, job[0], job[1], extraArgs + job[2], retries, logDir), zip(chunks, outputs, jobArgs)))
+
+    failed = [(chunk, log) for chunk, log in zip(chunks, results) if log is not None]
+    for chunk, log in failed:
+        print(f"FAILED: {', '.join(chunk)} (log: {log})")
+    return failed
+
+def runParallel(script, files, histFileName, jobs=4, filesPerJob=1, retries=1, extraArgs=None, workDir=None):
+    '''
+    Process the input files with one driver job per chunk of files, using up
+    to `jobs` jobs at a time, and merge the per-job histogram files into
+    histFileName. The merge follows the order of the input files, so the
+    result is the same as for a single serial job.
+    '''
+    extraArgs = extraArgs or []
+    ownDir = workDir is None
+    workDir = workDir or tempfile.mkdtemp(prefix="trigeff_", dir=".")
+    os.makedirs(workDir, exist_ok=True)
+
+    chunks = chunkFiles(files, filesPerJob)
+    outputs = [os.path.join(workDir, f"part_{i:04d}.root") for i in range(len(chunks))]
+    print(f"Processing {len(files)} files in {len(chunks)} jobs with {jobs} workers, job outputs in {workDir}")
+
+    failed = runJobs(script, chunks, outputs, jobs, extraArgs, retries, workDir)
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(chunks)} jobs failed, {histFileName} was not written")
+
+    mergeHistFiles(histFileName, outputs)
+    # Per-run partials written with --run-partials, sketches written with --sketch and stage times written with --profile, if any
+    mergeStoreFiles(histFileName, outputs)
+    mergeSketchFiles(histFileName, outputs)
+    mergeFoldedFiles(histFileName, outputs)
+    if ownDir:
+        shutil.rmtree(workDir)
+    print(f"Merged {len(outputs)} job outputs into {histFileName}")
+    return histFileName
+
+def runSplit(script, files, histFileName, jobs=4, tasksPerJob=4, retries=1, extraArgs=None, workDir=None):
+    '''
+    Like runParallel, but with the input files split into tasks of balanced
+    entry ranges (see planTasks), so that a large file does not set the wall
+    time. The workers take the tasks from a shared queue, largest first, and
+    the task outputs are merged in the order of the files and entries, so
+    the result does not depend on the order in which the tasks finish.
+    '''
+    extraArgs = extraArgs or []
+    ownDir = workDir is None
+    workDir = workDir or tempfile.mkdtemp(prefix="trigeff_", dir=".")
+    os.makedirs(workDir, exist_ok=True)
+
+    tasks = planTasks(files, jobs * tasksPerJob, workers=jobs)
+    outputs = [os.path.join(workDir, f"part_{i:04d}.root") for i in range(len(tasks))]
+    print(f"Processing {len(files)} files in {len(tasks)} tasks with {jobs} workers, task outputs in {workDir}")
+
+    # Longest tasks first, so that the short ones fill the tail
+    order = sorted(range(len(tasks)), key=lambda i: tasks[i][1] - tasks[i][2])
+    failed = runJobs(script, [[tasks[i][0]] for i in order], [outputs[i] for i in order], jobs, extraArgs, retries, workDir,
+                     jobArgs=[["--entry-range", str(tasks[i][1]), str(tasks[i][2])] for i in order])
+    if failed:
+        raise RuntimeError(f"{len(failed)} of {len(tasks)} tasks failed, {histFileName} was not written")
+
+    mergeHistFiles(histFileName, outputs)
+    mergeStoreFiles(histFileName, outputs)
+    mergeSketchFiles(histFileName, outputs)
+    mergeFoldedFiles(histFileName, outputs)
+    if ownDir:
+        shutil.rmtree(workDir)
+    print(f"Merged {len(outputs)} task outputs into {histFileName}")
+    return histFileName
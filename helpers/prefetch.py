@@ -0,0 +1,128 @@
+import os
+import time
+import shutil
+import tempfile
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Original name of every local copy that is currently being processed
+ORIGINS = {}
+
+def originOf(path):
+    '''
+    The input file a prefetched copy was made from, or the path itself.
+    '''
+    return ORIGINS.get(path, path)
+
+def copyInput(src, dst):
+    '''
+    Copy one input file to local disk, keeping its modification time. XRootD
+    URLs go through xrdcp, anything else (EOS FUSE mount, local directory) is
+    a plain file copy.
+    '''
+    if src.startswith("root://"):
+        subprocess.check_call(["xrdcp", "--silent", "--force", src, dst])
+    else:
+        shutil.copy2(src, dst)
+
+def inputSize(src):
+    # Size of remote files is not known in advance and counted as zero
+    return os.path.getsize(src) if os.path.exists(src) else 0
+
+class Prefetcher:
+    '''
+    Iterate over the input files, yielding local copies of them. While a
+    file is being processed the next `depth` files are copied to scratchDir
+    in background threads, as long as the copies fit into maxBytes (a single
+    file larger than the budget is still fetched on its own). Each Prefetcher,
+    i.e. each parallel job, has its own budget. A copy is deleted as soon as
+    the next file is requested. If a copy fails the original path is yielded
+    instead. Unlike PostProcessor(prefetch=True), which copies each file right
+    before opening it, the copies overlap with the processing.
+
+    The object can be passed as the list of input files to PostProcessor and
+    runColumnar(); the time spent waiting for copies and the time spent
+    processing the files are printed at the end and kept in self.stats.
+    '''
+    def __init__(self, files, scratchDir=None, depth=2, maxBytes=20 * 1024**3, copy=copyInput):
+        self.files = list(files)
+        self.scratchDir = scratchDir
+        self.depth = max(depth, 1)
+        self.maxBytes = maxBytes
+        self.copy = copy
+        self.stats = {"files": 0, "bytes": 0, "ioWait": 0., "compute": 0., "failed": []}
+
+    def __len__(self):
+        return len(self.files)
+
+    def _fetch(self, src, dst):
+        os.makedirs(os.path.dirname(dst), exist_ok=True)
+        try:
+            self.copy(src, dst)
+        except Exception:
+            shutil.rmtree(os.path.dirname(dst), ignore_errors=True)
+            raise
+
+    def _remove(self, dst):
+        shutil.rmtree(os.path.dirname(dst), ignore_errors=True)
+
+    def __iter__(self):
+        # A directory of its own, so that parallel jobs can share the scratch area
+        if self.scratchDir:
+            os.makedirs(self.scratchDir, exist_ok=True)
+        scratchDir = tempfile.mkdtemp(prefix="trigeff_prefetch_", dir=self.scratchDir)
+        pool = ThreadPoolExecutor(max_workers=self.depth)
+        pending = deque()
+        used = 0
+        nextIdx = 0
+        try:
+            while pending or nextIdx < len(self.files):
+                # Keep up to depth copies in flight within the disk budget
+                while nextIdx < len(self.files) and len(pending) < self.depth:
+                    src = self.files[nextIdx]
+                    size = inputSize(src)
+                    if pending and used + size > self.maxBytes:
+                        break
+                    dst = os.path.join(scratchDir, f"{nextIdx:05d}", os.path.basename(src))
+                    pending.append((src, dst, size, pool.submit(self._fetch, src, dst)))
+                    used += size
+                    nextIdx += 1
+
+                src, dst, size, future = pending.popleft()
+                t0 = time.time()
+                try:
+                    future.result()
+                    local = dst
+                except Exception as e:
+                    print(f"Prefetch of {src} failed ({e}), reading it remotely")
+                    self.stats["failed"].append(src)
+                    local = src
+                self.stats["ioWait"] += time.time() - t0
+
+                if local == dst:
+                    ORIGINS[dst] = src
+                t0 = time.time()
+                yield local
+                self.stats["compute"] += time.time() - t0
+
+                self.stats["files"] += 1
+                if local == dst:
+                    self.stats["bytes"] += os.path.getsize(dst)
+                    self._remove(dst)
+                    ORIGINS.pop(dst, None)
+                used -= size
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            for src, dst, size, future in pending:
+                self._remove(dst)
+            for dst in [dst for dst, src in ORIGINS.items() if dst.startswith(scratchDir)]:
+                ORIGINS.pop(dst)
+            shutil.rmtree(scratchDir, ignore_errors=True)
+            self.report()
+
+    def report(self):
+        s = self.stats
+        total = s["ioWait"] + s["compute"]
+        print("Prefetched %d files (%.1f MB): %.1f s waiting for input, %.1f s processing (%.0f%% of the wall time)"
+              % (s["files"], s["bytes"] / 1024**2, s["ioWait"], s["compute"], 100. * s["compute"] / total if total > 0 else 0.))
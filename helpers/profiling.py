@@ -0,0 +1,141 @@
+import os, sys
+import glob
+from contextlib import nullcontext
+from time import perf_counter_ns
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+# Instrumentation of the analyze() methods, switched on with --profile in the
+# drivers. A StageTimer keeps the cumulative time and number of calls of the
+# named stages of analyze(), each timed by a `with timer.stage(name):` block,
+# and the number of events passing every step of the selection (the cut flow).
+# The modules hold a NullTimer when profiling is off, whose stages are no-op
+# context managers. At endJob the cut flow is written as a labelled histogram
+# next to the other histograms, a table of the stages is printed and the stage
+# times are dumped in the folded stack format read by flamegraph.pl and
+# speedscope. The parallel drivers add up the dumps of their jobs.
+
+class Stage:
+    '''
+    Context manager charging the time spent in its block to one stage of a StageTimer.
+    '''
+    __slots__ = ("timer", "name", "t")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+        self.t = 0
+
+    def __enter__(self):
+        self.t = perf_counter_ns()
+
+    def __exit__(self, *exc):
+        self.timer.charge(self.name, perf_counter_ns() - self.t)
+        return False
+
+class StageTimer:
+    def __init__(self, name, cutflow=()):
+        self.name = name
+        self.times = {}
+        self.calls = {}
+        self.stages = {}
+        self.steps = list(cutflow)
+        self.counts = [0] * len(self.steps)
+        self.output = None
+
+    def beginJob(self, histFile=None, histDirName=None):
+        # The folded stacks go next to the histogram file, which may be closed by another module before endJob
+        if histFile:
+            self.output = f"{os.path.splitext(histFile.GetName())[0]}_{histDirName or self.name}.folded"
+
+    def stage(self, name):
+        '''
+        Context manager timing its block as the stage name.
+        '''
+        stage = self.stages.get(name)
+        if stage is None:
+            stage = self.stages[name] = Stage(self, name)
+        return stage
+
+    def charge(self, stage, t):
+        self.times[stage] = self.times.get(stage, 0) + t
+        self.calls[stage] = self.calls.get(stage, 0) + 1
+
+    def passed(self, step, n=1):
+        self.counts[step] += n
+
+    def cutflowHist(self, name="h_cutflow"):
+        n = len(self.steps)
+        h = ROOT.TH1D(name, ";;Events", n, 0., n)
+        for i, (step, count) in enumerate(zip(self.steps, self.counts)):
+            h.GetXaxis().SetBinLabel(i + 1, step)
+            h.SetBinContent(i + 1, count)
+        h.SetEntries(self.counts[0] if self.counts else 0)
+        return h
+
+    def table(self):
+        total = sum(self.times.values()) or 1
+        lines = [f"Profile of {self.name}:"]
+        if self.times:
+            lines.append("%-28s %10s %12s %10s %7s" % ("stage", "calls", "total [ms]", "mean [us]", "share"))
+        for stage, t in sorted(self.times.items(), key=lambda item: -item[1]):
+            lines.append("%-28s %10d %12.1f %10.2f %6.1f%%" % (stage, self.calls[stage], t / 1e6, t / 1e3 / self.calls[stage], 100. * t / total))
+        if self.steps:
+            lines += ["%-28s %10s %10s %10s" % ("cut flow", "events", "of all", "of prev.")]
+            for i, (step, count) in enumerate(zip(self.steps, self.counts)):
+                prev = self.counts[i - 1] if i else count
+                lines.append("%-28s %10d %9.1f%% %9.1f%%" % (step, count, 100. * count / self.counts[0] if self.counts[0] else 0., 100. * count / prev if prev else 0.))
+        return "\n".join(lines)
+
+    def folded(self):
+        '''
+        Stage times in microseconds as "name;analyze;stage time" lines.
+        '''
+        return [f"{self.name};analyze;{stage} {t // 1000}" for stage, t in self.times.items()]
+
+    def report(self):
+        '''
+        Print the table and write the folded stacks next to the histogram file.
+        '''
+        print(self.table())
+        if self.output:
+            with open(self.output, "w") as f:
+                f.write("\n".join(self.folded()) + "\n")
+            print(f"Wrote the stage times of {self.name} in folded stack format to {self.output}")
+
+class NullTimer:
+    '''
+    Stand-in for a StageTimer when profiling is off, false in a truth test.
+    '''
+    _stage = nullcontext()
+
+    def __bool__(self):
+        return False
+
+    def stage(self, name):
+        return self._stage
+
+    def passed(self, step, n=1):
+        pass
+
+def foldedFiles(histFileName):
+    return sorted(glob.glob(f"{os.path.splitext(histFileName)[0]}_*.folded"))
+
+def mergeFoldedFiles(histFileName, inputHistFiles):
+    '''
+    Add up the folded stacks written next to a list of histogram files, stack
+    by stack, into the files of the same directory next to histFileName.
+    '''
+    byDir = {}
+    for fname in inputHistFiles:
+        prefix = f"{os.path.splitext(fname)[0]}_"
+        for path in foldedFiles(fname):
+            times = byDir.setdefault(path[len(prefix):], {})
+            with open(path) as f:
+                for line in f:
+                    stack, _, t = line.strip().rpartition(" ")
+                    if stack:
+                        times[stack] = times.get(stack, 0) + int(t)
+    for suffix, times in byDir.items():
+        with open(f"{os.path.splitext(histFileName)[0]}_{suffix}", "w") as f:
+            f.write("".join(f"{stack} {t}\n" for stack, t in times.items()))
@@ -0,0 +1,130 @@
+import os, sys
+import json
+import hashlib
+import inspect
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from helpers.bootstrap import replicaName
+from helpers.utils import importROOT
+
+# Parallel rendering of the canvases of a plotting script with an on-disk
+# cache. Each canvas is a JSON-able dict with its output name, the histograms
+# it reads and its style options. An output is only rendered again if the
+# content of its histograms, its options, the source of the plotting script
+# (which holds the style helpers of the drawing function) or of the modules of
+# this repository it imports, or the format changed since it was written. The canvases left to render are drawn by a
+# pool of worker processes, each opening the histogram file once.
+
+CACHEFILE = ".render_cache.json"
+
+_files = {}
+
+def histDigest(fdir, name):
+    '''
+    Hash of the bin contents and entries of a histogram, None if it does not exist.
+    '''
+    h = fdir.Get(name)
+    if not h:
+        return None
+    content = [h.GetBinContent(i) for i in range(h.GetNcells())]
+    return hashlib.sha1(json.dumps([h.ClassName(), content, h.GetEntries()]).encode()).hexdigest()
+
+def drawingSource(draw):
+    '''
+    Source of the module of the drawing function and of the modules of this
+    repository it takes functions, classes or modules from.
+    '''
+    module = sys.modules[draw.__module__]
+    repo = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    imported = set()
+    for value in vars(module).values():
+        name = value.__name__ if inspect.ismodule(value) else getattr(value, "__module__", None)
+        dep = sys.modules.get(name) if isinstance(name, str) else None
+        path = getattr(dep, "__file__", None)
+        if dep is not module and path and os.path.abspath(path).startswith(repo + os.sep):
+            imported.add(dep.__name__)
+    return [inspect.getsource(module)] + [inspect.getsource(sys.modules[name]) for name in sorted(imported)]
+
+class RenderCache:
+    def __init__(self, path):
+        self.path = path
+        self.index = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.index = json.load(f)
+
+    def valid(self, output, key):
+        return self.index.get(output) == key and os.path.exists(output)
+
+    def update(self, output, key):
+        self.index[output] = key
+
+    def save(self):
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(self.index, f, indent=1, sort_keys=True)
+        os.replace(tmp, self.path)
+
+def _render(draw, rfile, dirName, canvas, outputs):
+    if rfile not in _files:
+        _files[rfile] = importROOT().TFile.Open(rfile, "READ")
+    draw(_files[rfile].GetDirectory(dirName), canvas, outputs)
+    return outputs
+
+def renderCanvases(draw, rfile, dirName, canvases, formats, jobs=1, cacheFile=None):
+    '''
+    Call draw(fdir, canvas, outputs) for every canvas whose outputs
+    (canvas["name"] + format) are not up to date in the cache, with jobs
+    worker processes. draw must be a module-level function and canvas["hists"]
+    the names of all histograms it reads. Returns the numbers of rendered and
+    cached outputs.
+    '''
+    cache = RenderCache(cacheFile) if cacheFile else None
+    f = importROOT().TFile.Open(rfile, "READ")
+    fdir = f.GetDirectory(dirName)
+    source = drawingSource(draw)
+    digests = {}
+    todo = []
+    cached = 0
+    for canvas in canvases:
+        outputs, keys = [], {}
+        if cache:
+            # Replicas are read whenever they exist, so they are part of the inputs
+            names = sorted(set(canvas["hists"]) | {replicaName(name) for name in canvas["hists"]})
+            for name in names:
+                if name not in digests:
+                    digests[name] = histDigest(fdir, name)
+            inputs = json.dumps([source, canvas, [digests[name] for name in names]], sort_keys=True)
+        for fs in formats:
+            output = f"{canvas['name']}{fs}"
+            if cache:
+                keys[output] = hashlib.sha1(f"{inputs}{fs}".encode()).hexdigest()
+                if cache.valid(output, keys[output]):
+                    cached += 1
+                    continue
+            outputs.append(output)
+        if outputs:
+            todo.append((canvas, outputs, keys))
+    f.Close()
+
+    rendered = 0
+    try:
+        if jobs > 1 and len(todo) > 1:
+            with ProcessPoolExecutor(max_workers=min(jobs, len(todo))) as pool:
+                futures = {pool.submit(_render, draw, rfile, dirName, canvas, outputs): keys for canvas, outputs, keys in todo}
+                for future in as_completed(futures):
+                    for output in future.result():
+                        rendered += 1
+                        if cache:
+                            cache.update(output, futures[future][output])
+        else:
+            for canvas, outputs, keys in todo:
+                for output in _render(draw, rfile, dirName, canvas, outputs):
+                    rendered += 1
+                    if cache:
+                        cache.update(output, keys[output])
+    finally:
+        # Keep the outputs rendered before a failure
+        if cache:
+            cache.save()
+    return rendered, cached
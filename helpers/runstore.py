@@ -0,0 +1,229 @@
+import os, sys
+import glob
+import json
+import numpy as np
+from argparse import ArgumentParser
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+from helpers.histograms import Axis, Hist, RunPartials
+from helpers.lumimask import LumiMask
+
+# Store of the per-run (or per-lumi-block) partial histograms of one output
+# directory, written next to the histogram file as {output}.{directory}.runs.npz.
+# It is a set of NumPy columns: the non-empty (histogram, run, lumi, bin) cells
+# with their counts, and the entries and statistics per (histogram, run, lumi).
+# The histograms of any subset of runs or lumi blocks are rebuilt from it
+# without going back to the NanoAOD files.
+
+SUFFIX = ".runs.npz"
+
+def storePath(histFileName, dirName):
+    return f"{os.path.splitext(histFileName)[0]}.{dirName}{SUFFIX}"
+
+def storeFiles(histFileName):
+    '''
+    The stores written next to a histogram file, by directory name.
+    '''
+    base = os.path.splitext(histFileName)[0]
+    return {path[len(base) + 1:-len(SUFFIX)]: path for path in sorted(glob.glob(f"{glob.escape(base)}.*{SUFFIX}"))}
+
+def _axisDict(axis):
+    if axis is None:
+        return None
+    if axis.variable:
+        return {"edges": axis.edges.tolist()}
+    return {"nbins": axis.nbins, "low": axis.low, "high": axis.high}
+
+def _axis(d):
+    if d is None:
+        return None
+    return Axis(d["edges"]) if "edges" in d else Axis(nbins=d["nbins"], low=d["low"], high=d["high"])
+
+def writeStore(path, directory, split, hists):
+    '''
+    Write the partials of a list of Hist objects.
+    '''
+    meta = {"directory": directory, "split": split,
+            "hists": [{"name": h.name, "title": h.title, "x": _axisDict(h.xaxis), "y": _axisDict(h.yaxis)} for h in hists]}
+    columns = {name: [] for name in ["hist", "key", "bin", "count", "s_hist", "s_key", "s_entries", "s_stats"]}
+    for i, h in enumerate(hists):
+        cells, counts = h.partials.cells()
+        keys, entries, stats = h.partials.keyStats()
+        columns["hist"].append(np.full(len(cells), i, dtype=np.int32))
+        columns["key"].append(cells[:, 0])
+        columns["bin"].append(cells[:, 1].astype(np.int32))
+        columns["count"].append(counts)
+        columns["s_hist"].append(np.full(len(keys), i, dtype=np.int32))
+        columns["s_key"].append(keys)
+        columns["s_entries"].append(entries)
+        columns["s_stats"].append(np.pad(stats, ((0, 0), (0, 7 - stats.shape[1]))))
+    arrays = {name: np.concatenate(parts) if parts else np.zeros(0) for name, parts in columns.items()}
+    # Run and lumi block as separate columns instead of the packed key
+    for prefix in ["", "s_"]:
+        key = arrays.pop(f"{prefix}key").astype(np.int64)
+        arrays[f"{prefix}run"] = (key >> 32).astype(np.uint32)
+        arrays[f"{prefix}lumi"] = (key & 0xffffffff).astype(np.uint32)
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez_compressed(tmp, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(tmp, path)
+
+def writeBookStore(path, directory, book):
+    book.flush()
+    writeStore(path, directory, book.split, list(book.hists.values()))
+
+def parseRuns(text):
+    '''
+    Run ranges from "first-last,run,..." as a list of (first, last).
+    '''
+    ranges = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        ranges.append((int(first), int(last or first)))
+    return ranges
+
+class RunStore:
+    def __init__(self, path):
+        self.path = path
+        with np.load(path) as data:
+            self.meta = json.loads(str(data["meta"]))
+            self.columns = {name: data[name] for name in data.files if name != "meta"}
+
+    @property
+    def directory(self):
+        return self.meta["directory"]
+
+    def runs(self):
+        '''
+        Runs in the store with the number of entries of the first histogram (e.g. h_passreftrig).
+        '''
+        c = self.columns
+        first = c["s_hist"] == 0
+        runs, inv = np.unique(c["s_run"][first], return_inverse=True)
+        return runs, np.bincount(inv.ravel(), weights=c["s_entries"][first], minlength=len(runs)).astype(np.int64)
+
+    def _select(self, prefix, runs, lumiMask):
+        c = self.columns
+        sel = np.ones(len(c[f"{prefix}run"]), dtype=bool)
+        if runs:
+            sel = np.zeros(len(sel), dtype=bool)
+            for first, last in runs:
+                sel |= (c[f"{prefix}run"] >= first) & (c[f"{prefix}run"] <= last)
+        if lumiMask is not None:
+            sel &= lumiMask.containsArray(c[f"{prefix}run"], c[f"{prefix}lumi"])
+        return sel
+
+    def hists(self, runs=None, lumiMask=None):
+        '''
+        Histograms summed over the selected runs, list of (first, last) ranges
+        (all runs if None), and lumi blocks of the lumi mask.
+        '''
+        if lumiMask is not None and self.meta["split"] != "lumi":
+            raise ValueError(f"{self.path} only has per-run partials, a lumi mask needs --run-partials lumi")
+        c = self.columns
+        sel = self._select("", runs, lumiMask)
+        ssel = self._select("s_", runs, lumiMask)
+        hists = []
+        for i, d in enumerate(self.meta["hists"]):
+            h = Hist(d["name"], d["title"], _axis(d["x"]), _axis(d["y"]))
+            cells = sel & (c["hist"] == i)
+            h.counts = np.bincount(c["bin"][cells], weights=c["count"][cells], minlength=len(h.counts)).astype(np.int64)
+            rows = ssel & (c["s_hist"] == i)
+            h.entries = int(c["s_entries"][rows].sum())
+            h.stats = c["s_stats"][rows][:, :len(h.stats)].sum(axis=0)
+            hists.append(h)
+        return hists
+
+    def partialHists(self):
+        '''
+        The stored histograms with their partials, e.g. to merge stores.
+        '''
+        c = self.columns
+        keys = c["run"].astype(np.int64) << 32 | c["lumi"].astype(np.int64)
+        skeys = c["s_run"].astype(np.int64) << 32 | c["s_lumi"].astype(np.int64)
+        hists = self.hists()
+        for i, h in enumerate(hists):
+            h.partials = RunPartials(len(h.stats))
+            cells = c["hist"] == i
+            rows = c["s_hist"] == i
+            h.partials.merge(np.stack([keys[cells], c["bin"][cells].astype(np.int64)], axis=1), c["count"][cells],
+                             skeys[rows], c["s_entries"][rows], c["s_stats"][rows][:, :len(h.stats)])
+        return hists
+
+def mergeStores(output, inputs, scales=None):
+    '''
+    Sum (or with scale -1 subtract) stores of the same directory into output.
+    '''
+    scales = scales or [1] * len(inputs)
+    merged, meta = None, None
+    for path, scale in zip(inputs, scales):
+        store = RunStore(path)
+        if merged is None:
+            merged, meta = store.partialHists(), store.meta
+            if scale != 1:
+                raise ValueError("The first store of a merge cannot be subtracted")
+            continue
+        if store.meta["hists"] != meta["hists"] or store.meta["split"] != meta["split"]:
+            raise ValueError(f"{path} has different histograms than {inputs[0]}")
+        for h, other in zip(merged, store.partialHists()):
+            cells, counts = other.partials.cells()
+            keys, entries, stats = other.partials.keyStats()
+            h.partials.merge(cells, counts, keys, entries, stats, scale)
+    writeStore(output, meta["directory"], meta["split"], merged)
+
+def mergeStoreFiles(histFileName, inputHistFiles, scales=None):
+    '''
+    Merge the stores next to a list of histogram files into the stores next
+    to histFileName, directory by directory.
+    '''
+    scales = scales or [1] * len(inputHistFiles)
+    byDir = {}
+    for fname, scale in zip(inputHistFiles, scales):
+        for directory, path in storeFiles(fname).items():
+            byDir.setdefault(directory, []).append((path, scale))
+    for directory, stores in byDir.items():
+        mergeStores(storePath(histFileName, directory), [path for path, scale in stores], [scale for path, scale in stores])
+
+def moveStores(src, dst, copy=False):
+    for directory, path in storeFiles(src).items():
+        if copy:
+            with open(path, "rb") as fin, open(storePath(dst, directory), "wb") as fout:
+                fout.write(fin.read())
+        else:
+            os.replace(path, storePath(dst, directory))
+
+def removeStores(histFileName):
+    for path in storeFiles(histFileName).values():
+        os.remove(path)
+
+def main(args):
+    stores = [RunStore(path) for path in args.stores]
+    if args.command == "list":
+        for store in stores:
+            runs, entries = store.runs()
+            print(f"{store.path}: directory {store.directory}, per {store.meta['split']}, {len(store.meta['hists'])} histograms, {len(runs)} runs")
+            for run, n in zip(runs, entries):
+                print(f"  {run:8d} {n:12d}")
+        return
+
+    runs = parseRuns(args.runs) if args.runs else None
+    lumiMask = LumiMask(args.lumiMask) if args.lumiMask else None
+    fout = ROOT.TFile.Open(args.output, "RECREATE")
+    for store in stores:
+        directory = fout.mkdir(store.directory)
+        directory.cd()
+        for h in store.hists(runs, lumiMask):
+            h.toROOT().Write()
+    fout.Close()
+    print(f"Wrote the histograms of {args.runs or 'all runs'}{' in ' + args.lumiMask if args.lumiMask else ''} to {args.output}")
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="List the runs of per-run partial histogram stores, or rebuild the histograms of a run range or lumi mask")
+    parser.add_argument("command", choices=["list", "select"], help="list the runs, or write the histograms of the selected runs to --output")
+    parser.add_argument("stores", nargs="+", help="Stores (*.runs.npz) written with --run-partials, one per output directory")
+    parser.add_argument("--runs", dest="runs", type=str, action="store", default=None, help="Runs to keep, e.g. 367080-367090,367095 [default: all]")
+    parser.add_argument("--lumi-mask", dest="lumiMask", type=str, action="store", default=None, help="Golden JSON file of the lumi blocks to keep, needs per-lumi partials [default: all]")
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default="histos_selected.root", help="Output histogram file [default: %s]" % ("histos_selected.root"))
+    args = parser.parse_args()
+    main(args)
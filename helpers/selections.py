@@ -0,0 +1,274 @@
+import operator
+import numpy as np
+import awkward as ak
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+# Declarative object selections shared by the analysis modules. A selection is
+# a list of requirements on the branches of one collection. It is turned into
+# a C++ function compiled by cling that loops over the objects of the current
+# event on its TTreeReaderArrays and returns the passing ones packed as bits of
+# one integer, which is cheaper to hand back to Python than a vector. The event
+# loop itself stays in Python: the function is called once per event by the
+# modules, which then only touch the selected objects. The same requirements
+# can also be evaluated on (jagged) arrays for the columnar mode.
+
+ALL_BITS = (1 << 64) - 1
+
+OPS = {"<": operator.lt, "<=": operator.le, ">": operator.gt, ">=": operator.ge, "==": operator.eq, "!=": operator.ne}
+
+class Cut:
+    '''
+    Keep the object if the condition is true. op=None requires a non-zero
+    flag, op="&" a non-zero bitwise and with value.
+    '''
+    keep = True
+
+    def __init__(self, var, op=None, value=None, absolute=False):
+        self.var = var
+        self.op = op
+        self.value = value
+        self.absolute = absolute
+
+    def condition(self, x):
+        x = f"std::abs({x})" if self.absolute else x
+        if self.op is None:
+            return f"({x} != 0)"
+        if self.op == "&":
+            return f"(({x} & {self.value}) != 0)"
+        return f"({x} {self.op} {self.value!r})"
+
+    def cpp(self, x):
+        return self.condition(x) if self.keep else f"!{self.condition(x)}"
+
+    def evaluate(self, x):
+        if self.op is None:
+            passed = x != 0
+        elif self.op == "&":
+            passed = (x & self.value) != 0
+        else:
+            x = ak.values_astype(x, np.float64) if isinstance(x, ak.Array) else np.asarray(x, dtype=np.float64)
+            passed = OPS[self.op](abs(x) if self.absolute else x, self.value)
+        return passed if self.keep else ~passed
+
+class Veto(Cut):
+    '''
+    Reject the object if the condition is true, like a "continue" in the
+    per-event loops (this also keeps objects with NaN values, as the loops do).
+    '''
+    keep = False
+
+class BranchReaders:
+    '''
+    Branch readers of a list of columns, looked up once per input tree instead
+    of once per event. nanoAOD-tools remakes all the readers of a tree, and
+    bumps its _ttreereaderversion, when a new one is created after the event
+    loop started, so the readers are looked up again when that changes.
+    '''
+    def __init__(self, columns):
+        self.columns = columns
+        self.tree = None
+        self.version = None
+        self.readers = None
+
+    def __call__(self, event):
+        tree = event._tree
+        # Looping until the version is stable, as creating a reader can remake the others
+        while tree is not self.tree or getattr(tree, "_ttreereaderversion", None) != self.version:
+            self.tree, self.version = tree, getattr(tree, "_ttreereaderversion", None)
+            self.readers = [tree.arrayReader(b) for b in self.columns]
+        return self.readers
+
+class ObjectSelection:
+    def __init__(self, name, collection, cuts):
+        self.name = name
+        self.collection = collection
+        self.cuts = cuts
+        self.variables = []
+        for cut in cuts:
+            if cut.var not in self.variables:
+                self.variables.append(cut.var)
+        self._compiled = False
+        self._functions = {}
+        self._readers = BranchReaders(self.columns())
+
+    def branches(self):
+        return [f"n{self.collection}"] + [f"{self.collection}_{var}" for var in self.variables]
+
+    def columns(self):
+        return [f"{self.collection}_{var}" for var in self.variables]
+
+    def expression(self, index="i"):
+        return " && ".join(cut.cpp(f"{cut.var}[{index}]") for cut in self.cuts)
+
+    def formula(self):
+        # Per-object TTreeFormula expression, e.g. for Sum$(...) in a preselection string
+        return " && ".join(cut.cpp(f"{self.collection}_{cut.var}") for cut in self.cuts).replace("std::abs", "abs")
+
+    def compile(self):
+        if self._compiled:
+            return
+        types = ", ".join(f"typename T{i}" for i in range(len(self.variables)))
+        args = ", ".join(f"const T{i} &{var}" for i, var in enumerate(self.variables))
+        ROOT.gInterpreter.Declare(f'''
+        #include <cmath>
+        #include "ROOT/RVec.hxx"
+        namespace trigeff {{
+        template <{types}>
+        ROOT::RVec<int> {self.name}({args}) {{
+            const std::size_t n = {self.variables[0]}.size();
+            ROOT::RVec<int> mask(n);
+            for (std::size_t i = 0; i < n; ++i)
+                mask[i] = {self.expression()};
+            return mask;
+        }}
+        template <{types}>
+        ROOT::RVec<int> {self.name}_indices({args}) {{
+            const std::size_t n = {self.variables[0]}.size();
+            ROOT::RVec<int> indices;
+            for (std::size_t i = 0; i < n; ++i)
+                if ({self.expression()}) indices.push_back(i);
+            return indices;
+        }}
+        template <{types}>
+        unsigned long long {self.name}_bits({args}) {{
+            // Bit i set if object i passes, all bits set beyond 64 objects
+            const std::size_t n = {self.variables[0]}.size();
+            if (n > 64) return ~0ull;
+            unsigned long long bits = 0;
+            for (std::size_t i = 0; i < n; ++i)
+                if ({self.expression()}) bits |= 1ull << i;
+            return bits;
+        }}
+        }}''')
+        self._compiled = True
+
+    def function(self, suffix=""):
+        if suffix not in self._functions:
+            self.compile()
+            self._functions[suffix] = getattr(ROOT.trigeff, self.name + suffix)
+        return self._functions[suffix]
+
+    def mask(self, event):
+        '''
+        Per-object mask of the current event, computed in C++ on the branch readers.
+        '''
+        return self.function()(*self._readers(event))
+
+    def indices(self, event):
+        '''
+        Indices of the objects passing the selection in the current event,
+        computed in C++ on the branch readers.
+        '''
+        bits = self.function("_bits")(*self._readers(event))
+        if bits == ALL_BITS:
+            # More than 64 objects (or 64 passing ones)
+            return list(self.function("_indices")(*self._readers(event)))
+        indices = []
+        while bits:
+            low = bits & -bits
+            indices.append(low.bit_length() - 1)
+            bits ^= low
+        return indices
+
+    def select(self, event, objects):
+        '''
+        Objects of the collection passing the selection in the current event.
+        Only the passing objects are looked up from Python.
+        '''
+        return [objects[i] for i in self.indices(event)]
+
+    def arrayMask(self, events):
+        '''
+        Per-object mask for a chunk of events in columnar mode.
+        '''
+        mask = None
+        for cut in self.cuts:
+            passed = cut.evaluate(events[f"{self.collection}_{cut.var}"])
+            mask = passed if mask is None else mask & passed
+        return mask
+
+class CleanedHT:
+    '''
+    Scalar sum of the pT of the objects passing a selection that are at least
+    minDeltaR away from a reference object (e.g. the selected muon).
+    '''
+    def __init__(self, name, selection, minDeltaR):
+        self.name = name
+        self.selection = selection
+        self.minDeltaR = minDeltaR
+        self._compiled = False
+        self._function = None
+        self._readers = BranchReaders(self.columns())
+
+    def branches(self):
+        return self.selection.branches() + [f"{self.selection.collection}_{var}" for var in ["pt", "eta", "phi"] if var not in self.selection.variables]
+
+    def columns(self):
+        return self.selection.columns() + [f"{self.selection.collection}_{var}" for var in ["pt", "eta", "phi"] if var not in self.selection.variables]
+
+    def compile(self):
+        if self._compiled:
+            return
+        self.selection.compile()
+        extra = [var for var in ["pt", "eta", "phi"] if var not in self.selection.variables]
+        variables = self.selection.variables + extra
+        types = ", ".join(f"typename T{i}" for i in range(len(variables)))
+        args = ", ".join(f"const T{i} &{var}" for i, var in enumerate(variables))
+        ROOT.gInterpreter.Declare(f'''
+        namespace trigeff {{
+        template <{types}>
+        double {self.name}({args}, double refEta, double refPhi) {{
+            const auto mask = {self.selection.name}({", ".join(self.selection.variables)});
+            double sum = 0.;
+            for (std::size_t i = 0; i < mask.size(); ++i) {{
+                if (!mask[i]) continue;
+                double dphi = phi[i] - refPhi;
+                while (dphi > M_PI) dphi -= 2 * M_PI;
+                while (dphi < -M_PI) dphi += 2 * M_PI;
+                const double deta = eta[i] - refEta;
+                if (std::sqrt(deta * deta + dphi * dphi) < {self.minDeltaR!r}) continue;
+                sum += pt[i];
+            }}
+            return sum;
+        }}
+        }}''')
+        self._compiled = True
+
+    def compute(self, event, ref):
+        '''
+        Cleaned HT of the current event with respect to the reference object ref.
+        '''
+        if self._function is None:
+            self.compile()
+            self._function = getattr(ROOT.trigeff, self.name)
+        return self._function(*self._readers(event), ref.eta, ref.phi)
+
+# Muon selection of the MET and PF HT measurements
+tightIsoMuon = ObjectSelection("tightIsoMuon", "Muon", [
+    Veto("pt", "<", 26),
+    Veto("eta", ">", 2.5, absolute=True),
+    Veto("dz", ">", 0.10, absolute=True),
+    Veto("dxy", ">", 0.05, absolute=True),
+    Cut("tightId"),
+    Veto("pfRelIso03_all", ">", 0.15),
+    ])
+
+# Muon selection of the AK8 jet measurement
+looseGlobalMuon = ObjectSelection("looseGlobalMuon", "Muon", [
+    Cut("isGlobal"),
+    Veto("pt", "<", 26),
+    Veto("eta", ">", 2.5, absolute=True),
+    Veto("dz", ">", 0.10, absolute=True),
+    Veto("dxy", ">", 0.05, absolute=True),
+    Cut("looseId"),
+    ])
+
+# Jets entering the PF HT
+htJet = ObjectSelection("htJet", "Jet", [
+    Cut("pt", ">=", 30.0),
+    Cut("eta", "<", 2.5, absolute=True),
+    Cut("jetId", "&", 4),
+    ])
+
+pfJetHT = CleanedHT("pfJetHT", htJet, minDeltaR=0.4)
@@ -0,0 +1,202 @@
+import os, sys
+import glob
+import json
+import array
+import numpy as np
+
+# First pass for adaptive binnings. With --sketch the analysis modules
+# count the values of their observables, of all denominator entries and of
+# those passing the signal trigger(s), exactly on a fine grid per observable
+# (GRIDS, e.g. 1 GeV in pt), written next to the histogram file (one
+# .sketch.npz per directory) and merged across parallel jobs like the run
+# stores. The counts are int64 arrays of a fixed size, so they are added when
+# merging and do not grow with the number of events. deriveBinning.py turns
+# them into binnings with a minimum denominator count and/or a maximum
+# efficiency uncertainty per bin, written as a JSON file that the drivers read
+# with --binning. The bin edges are grid edges, so the counts per bin are
+# exact.
+
+SUFFIX = ".sketch.npz"
+
+# Fine grids of the observables, (low, high, step), around the ranges of the default binnings
+GRIDS = {"pt": (200., 1000., 1.), "mSD": (0., 400., 1.), "eta": (-2.4, 2.4, 0.02), "met_pt": (100., 600., 1.), "pfht": (200., 1500., 2.), "pv": (0., 100., 1.)}
+
+class GridCounts:
+    '''
+    Exact counts of all and of passing entries on the grid from low to high in
+    steps of step, with the entries below and above it in the first and last
+    cell.
+    '''
+    def __init__(self, low, high, step):
+        self.low, self.high, self.step = float(low), float(high), float(step)
+        self.nbins = int(round((self.high - self.low) / self.step))
+        self.counts = np.zeros((2, self.nbins + 2), dtype=np.int64)
+
+    @property
+    def n(self):
+        return int(self.counts[0].sum())
+
+    def fill(self, values, passed):
+        values = np.asarray(values, dtype=np.float64)
+        finite = np.isfinite(values)
+        index = np.floor((values[finite] - self.low) / self.step)
+        np.clip(index, -1, self.nbins, out=index)
+        index = index.astype(np.intp) + 1
+        self.counts[0] += np.bincount(index, minlength=self.nbins + 2)
+        self.counts[1] += np.bincount(index[np.asarray(passed, dtype=bool)[finite]], minlength=self.nbins + 2)
+
+    def merge(self, other):
+        if (other.low, other.high, other.step) != (self.low, self.high, self.step):
+            raise ValueError(f"Cannot merge the counts on grids {(self.low, self.high, self.step)} and {(other.low, other.high, other.step)}")
+        self.counts += other.counts
+
+    def index(self, edges):
+        '''
+        Grid edge numbers of the given edges, which need to be grid edges.
+        '''
+        edges = np.asarray(edges, dtype=np.float64)
+        index = np.rint((edges - self.low) / self.step).astype(np.intp)
+        bad = (index < 0) | (index > self.nbins) | ~np.isclose(self.low + index * self.step, edges, rtol=0., atol=1e-6 * self.step)
+        if bad.any():
+            raise ValueError(f"{edges[bad][0]} is not an edge of the grid from {self.low} to {self.high} in steps of {self.step}")
+        return index
+
+    def cumulative(self, edges):
+        '''
+        Numbers of all and of passing entries below each of the edges.
+        '''
+        cumulative = np.cumsum(self.counts, axis=1)
+        index = self.index(edges)
+        return cumulative[0, index], cumulative[1, index]
+
+    def state(self):
+        return {"counts": self.counts, "axis": np.array([self.low, self.high, self.step])}
+
+    @classmethod
+    def fromState(cls, counts, axis):
+        grid = cls(*axis)
+        grid.counts = np.array(counts, dtype=np.int64)
+        return grid
+
+class SketchBook:
+    '''
+    Grid counts per observable. fill() buffers single values of the per-event
+    loop, fillArray() takes the arrays of the columnar code.
+    '''
+    def __init__(self, names, bufferSize=100000, grids=GRIDS):
+        self.grids = {name: GridCounts(*grids[name]) for name in names}
+        self.buffers = {name: (array.array("d"), array.array("b")) for name in names}
+        self.bufferSize = bufferSize
+
+    def fill(self, name, x, passed):
+        bx, bp = self.buffers[name]
+        bx.append(x)
+        bp.append(1 if passed else 0)
+        if len(bx) >= self.bufferSize:
+            self._flushBuffer(name)
+
+    def fillArray(self, name, x, passed):
+        self.grids[name].fill(x, passed)
+
+    def _flushBuffer(self, name):
+        bx, bp = self.buffers[name]
+        self.fillArray(name, np.frombuffer(bx, dtype=np.float64), np.frombuffer(bp, dtype=np.int8).astype(bool))
+        self.buffers[name] = (array.array("d"), array.array("b"))
+
+    def write(self, path, directory):
+        for name in self.buffers:
+            self._flushBuffer(name)
+        writeSketches(path, directory, self.grids)
+
+def sketchPath(histFileName, dirName):
+    return f"{os.path.splitext(histFileName)[0]}.{dirName}{SUFFIX}"
+
+def sketchFiles(histFileName):
+    '''
+    The sketch files written next to a histogram file, by directory name.
+    '''
+    base = os.path.splitext(histFileName)[0]
+    return {path[len(base) + 1:-len(SUFFIX)]: path for path in sorted(glob.glob(f"{glob.escape(base)}.*{SUFFIX}"))}
+
+def writeSketches(path, directory, grids):
+    arrays = {f"{name}/{key}": value for name, grid in grids.items() for key, value in grid.state().items()}
+    tmp = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp, meta=np.array(json.dumps({"directory": directory, "names": list(grids)})), **arrays)
+    os.replace(tmp, path)
+
+def readSketches(path):
+    '''
+    Directory and {observable: grid counts} of a sketch file.
+    '''
+    with np.load(path) as f:
+        meta = json.loads(str(f["meta"]))
+        grids = {name: GridCounts.fromState(f[f"{name}/counts"], f[f"{name}/axis"]) for name in meta["names"]}
+    return meta["directory"], grids
+
+def mergeSketches(books):
+    '''
+    Merge a list of {observable: grid counts} dicts.
+    '''
+    merged = {}
+    for grids in books:
+        for name, grid in grids.items():
+            if name in merged:
+                merged[name].merge(grid)
+            else:
+                merged[name] = grid
+    return merged
+
+def mergeSketchFiles(histFileName, inputHistFiles):
+    '''
+    Merge the sketch files next to a list of histogram files into those next
+    to histFileName, directory by directory.
+    '''
+    byDir = {}
+    for fname in inputHistFiles:
+        for directory, path in sketchFiles(fname).items():
+            byDir.setdefault(directory, []).append(readSketches(path)[1])
+    for directory, books in byDir.items():
+        writeSketches(sketchPath(histFileName, directory), directory, mergeSketches(books))
+
+def adaptiveEdges(grid, low, high, minCount=1000, maxUncertainty=None, resolution=0.):
+    '''
+    Bin edges from low to high with at least minCount denominator entries
+    and, if given, an efficiency uncertainty sqrt(e (1 - e) / n) of at most
+    maxUncertainty per bin, with e = (k + 1) / (n + 2) so that empty and full
+    bins are not taken as exact. The edges are multiples of resolution, which
+    needs to be a multiple of the grid step, or any grid edges without, which
+    gives bins of about equal statistics. A remainder at the upper end that
+    misses the targets is merged into the last bin.
+    '''
+    step = resolution or grid.step
+    if not np.isclose(step / grid.step, round(step / grid.step)):
+        raise ValueError(f"The resolution {resolution} is not a multiple of the grid step {grid.step}")
+    candidates = low + step * np.arange(int(np.floor((high - low) / step + 1e-9)) + 1)
+    candidates = np.unique(np.round(np.r_[candidates[candidates < high], high], 10))
+    n, k = [counts.astype(np.float64) for counts in grid.cumulative(candidates)]
+
+    edges = [0]
+    for j in range(1, len(candidates)):
+        dn, dk = n[j] - n[edges[-1]], k[j] - k[edges[-1]]
+        if dn < max(minCount, 1):
+            continue
+        if maxUncertainty is not None:
+            e = (dk + 1.) / (dn + 2.)
+            if np.sqrt(e * (1. - e) / dn) > maxUncertainty:
+                continue
+        edges.append(j)
+    if edges[-1] != len(candidates) - 1:
+        if len(edges) > 1:
+            edges[-1] = len(candidates) - 1
+        else:
+            edges.append(len(candidates) - 1)
+    return [float(candidates[j]) for j in edges]
+
+def readBinning(path, directory):
+    '''
+    Bin edges per observable of one analysis directory from a JSON file
+    written by deriveBinning.py, empty if the directory is not in it.
+    '''
+    with open(path) as f:
+        binning = json.load(f)
+    return {var: [float(edge) for edge in edges] for var, edges in binning.get(directory, {}).items()}
@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+'''
+DESCRIPTION:
+Local cache of skimmed NanoAOD files. For every input file the events passing
+the preselection are copied, with only the needed branches, into a compressed
+file in the cache directory. The cache key is built from the input path, its
+size and modification time (for remote inputs the size and UUID from the file
+header) and a hash of the preselection and branch list, so a changed input,
+cut or branch list produces a new entry. The cache is kept below a size limit
+by removing the least recently used entries, except those used in the current
+run, which its parallel jobs may still be reading.
+
+Inspect or purge the cache with:
+  python3 helpers/skimcache.py <cachedir> list
+  python3 helpers/skimcache.py <cachedir> purge [--older-than DAYS]
+'''
+import os, sys
+import json
+import time
+import fcntl
+import hashlib
+from argparse import ArgumentParser
+from contextlib import contextmanager
+import ROOT
+ROOT.PyConfig.IgnoreCommandLineOptions = True
+
+# ZSTD, level 5: small files that are cheap to decompress
+COMPRESSION = 505
+
+# Start of the current run, shared with the parallel jobs of a driver through
+# the environment they inherit: the skims used since then are never evicted
+RUN_START = float(os.environ.setdefault("SKIMCACHE_RUN_START", str(time.time())))
+
+def headerStamp(fname):
+    '''
+    Size and UUID from the header of a ROOT file, which change when the file is
+    rewritten and are kept by a copy.
+    '''
+    f = ROOT.TFile.Open(fname)
+    if not f or f.IsZombie():
+        raise IOError(f"Cannot open {fname}")
+    stamp = [int(f.GetEND()), f.GetUUID().AsString()]
+    f.Close()
+    return stamp
+
+class SkimCache:
+    def __init__(self, cacheDir, maxBytes=50 * 1024**3):
+        self.cacheDir = cacheDir
+        self.maxBytes = maxBytes
+        self.indexFile = os.path.join(cacheDir, "index.json")
+        os.makedirs(cacheDir, exist_ok=True)
+
+    @contextmanager
+    def _lockedIndex(self):
+        # Several parallel jobs can share one cache, serialize the index updates
+        with open(os.path.join(self.cacheDir, ".lock"), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            index = {}
+            if os.path.exists(self.indexFile):
+                with open(self.indexFile) as f:
+                    index = json.load(f)
+            yield index
+            tmp = self.indexFile + ".tmp"
+            with open(tmp, "w") as f:
+                json.dump(index, f, indent=1)
+            os.replace(tmp, self.indexFile)
+
+    @staticmethod
+    def key(fname, cut, branches):
+        if os.path.exists(fname):
+            st = os.stat(fname)
+            fname, stamp = os.path.abspath(fname), [st.st_size, int(st.st_mtime)]
+        else:
+            # Remote input (root://), without a modification time at hand
+            stamp = headerStamp(fname)
+        h = hashlib.sha1(json.dumps([fname, stamp, cut or "", sorted(branches) if branches else None]).encode())
+        return h.hexdigest()
+
+    def get(self, fname, cut, branches=None, treeName="Events"):
+        '''
+        Return the path of the skim of fname, creating it on a cache miss.
+        With branches=None all branches are kept.
+        '''
+        key = self.key(fname, cut, branches)
+        path = os.path.join(self.cacheDir, f"{key}.root")
+        with self._lockedIndex() as index:
+            if key in index and os.path.exists(path):
+                index[key]["lastUsed"] = time.time()
+                return path
+
+        t0 = time.time()
+        nIn, nOut = self._skim(fname, path, cut, branches, treeName)
+        print(f"Skimmed {fname}: {nOut}/{nIn} entries kept in {path} ({time.time()-t0:.1f} s)")
+
+        with self._lockedIndex() as index:
+            index[key] = {"input": fname, "file": path, "cut": cut, "branches": branches,
+                          "entries": nOut, "bytes": os.path.getsize(path),
+                          "created": time.time(), "lastUsed": time.time()}
+            self._evict(index, keep=key)
+        return path
+
+    def skim(self, files, cut, branches=None, treeName="Events"):
+        return [self.get(fname, cut, branches, treeName) for fname in files]
+
+    def _skim(self, fname, path, cut, branches, treeName):
+        fin = ROOT.TFile.Open(fname)
+        if not fin or fin.IsZombie():
+            raise IOError(f"Cannot open {fname}")
+        tree = fin.Get(treeName)
+        if branches:
+            tree.SetBranchStatus("*", 0)
+            for b in branches:
+                tree.SetBranchStatus(b, 1)
+        # Write to a temporary name first so that a crash never leaves a truncated entry
+        tmp = f"{path}.{os.getpid()}.tmp"
+        fout = ROOT.TFile(tmp, "RECREATE", "", COMPRESSION)
+        skim = tree.CopyTree(cut or "")
+        nIn, nOut = tree.GetEntries(), skim.GetEntries()
+        skim.Write()
+        fout.Close()
+        fin.Close()
+        os.replace(tmp, path)
+        return nIn, nOut
+
+    def _evict(self, index, keep=None):
+        total = sum(entry["bytes"] for entry in index.values())
+        for key in sorted(index, key=lambda k: index[k]["lastUsed"]):
+            if total <= self.maxBytes:
+                break
+            if key == keep or index[key]["lastUsed"] >= RUN_START:
+                continue
+            total -= index[key]["bytes"]
+            self._remove(index, key)
+
+    def _remove(self, index, key):
+        if os.path.exists(index[key]["file"]):
+            os.remove(index[key]["file"])
+        del index[key]
+
+    def entries(self):
+        with self._lockedIndex() as index:
+            return dict(index)
+
+    def purge(self, olderThan=None):
+        '''
+        Remove all entries, or only those not used in the last olderThan seconds.
+        '''
+        removed = 0
+        with self._lockedIndex() as index:
+            for key in list(index):
+                if olderThan is None or time.time() - index[key]["lastUsed"] > olderThan:
+                    self._remove(index, key)
+                    removed += 1
+        return removed
+
+def main(args):
+    cache = SkimCache(args.cacheDir)
+    if args.command == "list":
+        entries = cache.entries()
+        total = 0
+        for key, entry in sorted(entries.items(), key=lambda kv: kv[1]["lastUsed"], reverse=True):
+            total += entry["bytes"]
+            print("%s  %8.1f MB  %9d entries  last used %s  %s" % (key[:12], entry["bytes"] / 1024**2, entry["entries"],
+                                                                   time.strftime("%Y-%m-%d %H:%M", time.localtime(entry["lastUsed"])), entry["input"]))
+        print("%d entries, %.1f MB in total" % (len(entries), total / 1024**2))
+    elif args.command == "purge":
+        removed = cache.purge(args.olderThan * 86400 if args.olderThan is not None else None)
+        print("Removed %d entries" % (removed))
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Inspect or purge the local skim cache")
+    parser.add_argument("cacheDir", help="Cache directory")
+    parser.add_argument("command", choices=["list", "purge"], help="list the cached skims or purge them")
+    parser.add_argument("--older-than", dest="olderThan", type=float, default=None, help="Only purge entries not used for this many days [default: all]")
+
+    args = parser.parse_args()
+    main(args)
@@ -0,0 +1,197 @@
+import os, sys
+import numpy as np
+import awkward as ak
+import uproot
+from math import sqrt
+from argparse import ArgumentParser
+
+# Generator of NanoAOD-like files with the branches read by the efficiency
+# modules, for testing and benchmarking without access to EOS. Object
+# multiplicities and spectra are rough approximations of a muon-triggered
+# 2023 data set. Every path fires with a configurable plateau probability
+# times an erf turn-on in the quantity it triggers on, so that the filled
+# efficiencies have the usual shape.
+
+# path: (plateau probability, [(quantity, threshold, width), ...])
+TRIGGERS = {
+    "Mu50":                                       (0.40, []),
+    "IsoMu24":                                    (0.80, []),
+    "PFMET120_PFMHT120_IDTight":                  (0.97, [("met", 170., 30.)]),
+    "PFMETNoMu120_PFMHTNoMu120_IDTight":          (0.98, [("met", 160., 30.)]),
+    "PFMETNoMu120_PFMHTNoMu120_IDTight_FilterHF": (0.97, [("met", 165., 30.)]),
+    "PFHT1050":                                   (0.99, [("ht", 1100., 60.)]),
+    "AK8PFJet420_MassSD30":                       (0.97, [("fatjetPt", 440., 25.), ("fatjetMSD", 35., 8.)]),
+    "AK8PFJet425_SoftDropMass40":                 (0.97, [("fatjetPt", 450., 25.), ("fatjetMSD", 45., 8.)]),
+    "AK8PFJet450":                                (0.99, [("fatjetPt", 470., 25.)]),
+    "AK8PFJet500":                                (0.99, [("fatjetPt", 520., 25.)]),
+    "PFJet500":                                   (0.99, [("jetPt", 520., 25.)]),
+    }
+L1_SEEDS = {"HTT280er": (1.0, [("ht", 300., 40.)])}
+
+MET_FILTERS = ["goodVertices", "globalSuperTightHalo2016Filter", "HBHENoiseFilter", "HBHENoiseIsoFilter",
+               "EcalDeadCellTriggerPrimitiveFilter", "BadPFMuonFilter", "BadPFMuonDzFilter", "eeBadScFilter",
+               "ecalBadCalibFilter"]
+
+def _erf(x):
+    # Abramowitz-Stegun 7.1.26, accurate to 1.5e-7, to avoid depending on scipy
+    s = np.sign(x)
+    x = np.abs(x)
+    t = 1. / (1. + 0.3275911 * x)
+    y = 1. - (((((1.061405429 * t - 1.453152027) * t) + 1.421413741) * t - 0.284496736) * t + 0.254829592) * t * np.exp(-x * x)
+    return s * y
+
+def turnOn(x, threshold, width):
+    return 0.5 * (1. + _erf((x - threshold) / (sqrt(2.) * width)))
+
+def _collection(counts, fields):
+    n = int(counts.sum())
+    return ak.unflatten(ak.zip({name: make(n) for name, make in fields.items()}, depth_limit=1), counts)
+
+def _leading(values, counts, default=0.):
+    # Largest value per event, default for events without objects
+    out = np.full(len(counts), -np.inf)
+    np.maximum.at(out, np.repeat(np.arange(len(counts)), counts), values)
+    out[counts == 0] = default
+    return out
+
+def _sum(values, counts):
+    return np.bincount(np.repeat(np.arange(len(counts)), counts), weights=values, minlength=len(counts))
+
+def generateChunk(rng, nEvents, firstEvent=0, rates={}, runs=(367080, 367100), eventsPerLumi=1000):
+    '''
+    One chunk of events as a dict of branch name (or collection name) to array.
+    '''
+    uniform = lambda n, lo, hi: rng.uniform(lo, hi, n).astype(np.float32)
+
+    # Muons: mostly one isolated muon from the muon-triggered sample, plus soft ones
+    nMuon = rng.poisson(1.2, nEvents) + (rng.random(nEvents) < 0.9)
+    muons = _collection(nMuon, {
+        "pt": lambda n: (15. + rng.exponential(25., n)).astype(np.float32),
+        "eta": lambda n: uniform(n, -2.6, 2.6),
+        "phi": lambda n: uniform(n, -np.pi, np.pi),
+        "dz": lambda n: rng.normal(0., 0.05, n).astype(np.float32),
+        "dxy": lambda n: rng.normal(0., 0.02, n).astype(np.float32),
+        "pfRelIso03_all": lambda n: rng.exponential(0.08, n).astype(np.float32),
+        "tightId": lambda n: rng.random(n) < 0.85,
+        "looseId": lambda n: rng.random(n) < 0.97,
+        "isGlobal": lambda n: rng.random(n) < 0.95,
+        })
+
+    nElectron = rng.poisson(0.3, nEvents)
+    electrons = _collection(nElectron, {
+        "pt": lambda n: (7. + rng.exponential(20., n)).astype(np.float32),
+        "eta": lambda n: uniform(n, -2.6, 2.6),
+        "phi": lambda n: uniform(n, -np.pi, np.pi),
+        "pfRelIso03_all": lambda n: rng.exponential(0.15, n).astype(np.float32),
+        })
+
+    nJet = rng.poisson(5., nEvents)
+    jets = _collection(nJet, {
+        "pt": lambda n: (15. + rng.pareto(2.5, n) * 40.).astype(np.float32),
+        "eta": lambda n: uniform(n, -4.7, 4.7),
+        "phi": lambda n: uniform(n, -np.pi, np.pi),
+        "jetId": lambda n: np.where(rng.random(n) < 0.95, 6, 2).astype(np.uint8),
+        })
+
+    nFatJet = rng.poisson(1.0, nEvents)
+    nMatch = np.repeat(nMuon, nFatJet)
+    fatjets = _collection(nFatJet, {
+        "pt": lambda n: (170. + rng.pareto(2.5, n) * 200.).astype(np.float32),
+        "eta": lambda n: uniform(n, -2.6, 2.6),
+        "phi": lambda n: uniform(n, -np.pi, np.pi),
+        "msoftdrop": lambda n: np.where(rng.random(n) < 0.2, 0., rng.gamma(2., 30., n)).astype(np.float32),
+        # Index of a muon of the same event inside the jet for 15% of the jets, -1 otherwise
+        "muonIdx3SJ": lambda n: np.where((rng.random(n) < 0.15) & (nMatch > 0),
+                                         (rng.random(n) * np.maximum(nMatch, 1)).astype(np.int32), -1).astype(np.int32),
+        })
+
+    met = (rng.exponential(50., nEvents) + rng.pareto(3., nEvents) * 30.).astype(np.float32)
+
+    # Quantities the trigger turn-ons depend on
+    jetPt = ak.to_numpy(ak.flatten(jets.pt)).astype(np.float64)
+    central = ak.to_numpy(ak.flatten((jets.pt > 30) & (abs(jets.eta) < 2.5)))
+    quantities = {
+        "met": met.astype(np.float64),
+        "ht": _sum(np.where(central, jetPt, 0.), nJet),
+        "jetPt": _leading(jetPt, nJet),
+        "fatjetPt": _leading(ak.to_numpy(ak.flatten(fatjets.pt)).astype(np.float64), nFatJet),
+        "fatjetMSD": _leading(ak.to_numpy(ak.flatten(fatjets.msoftdrop)).astype(np.float64), nFatJet),
+        }
+
+    def fires(plateau, legs):
+        prob = np.full(nEvents, plateau)
+        for quantity, threshold, width in legs:
+            prob *= turnOn(quantities[quantity], threshold, width)
+        return rng.random(nEvents) < prob
+
+    entry = firstEvent + np.arange(nEvents)
+    events = {
+        "run": (runs[0] + (entry // (eventsPerLumi * 100)) % (runs[1] - runs[0] + 1)).astype(np.uint32),
+        "luminosityBlock": (1 + (entry // eventsPerLumi) % 100).astype(np.uint32),
+        "event": (entry + 1).astype(np.uint64),
+        "Muon": muons, "Electron": electrons, "Jet": jets, "FatJet": fatjets,
+        "MET_pt": met,
+        "PV_npvsGood": rng.poisson(35., nEvents).astype(np.uint8),
+        }
+    for path, (plateau, legs) in TRIGGERS.items():
+        events[f"HLT_{path}"] = fires(rates.get(path, plateau), legs)
+    for seed, (plateau, legs) in L1_SEEDS.items():
+        events[f"L1_{seed}"] = fires(rates.get(seed, plateau), legs)
+    for flag in MET_FILTERS:
+        events[f"Flag_{flag}"] = rng.random(nEvents) < 0.998
+    return events
+
+def writeFile(fname, nEvents, seed=0, rates={}, firstEvent=0, chunkSize=100000, runs=(367080, 367100)):
+    '''
+    Write nEvents synthetic events into the Events tree of fname, chunkSize events at a time.
+    '''
+    rng = np.random.default_rng(seed)
+    with uproot.recreate(fname) as f:
+        tree = None
+        for start in range(0, nEvents, chunkSize):
+            chunk = generateChunk(rng, min(chunkSize, nEvents - start), firstEvent + start, rates, runs)
+            if tree is None:
+                # An explicit TTree, assigning the arrays directly may write an RNTuple
+                tree = f.mktree("Events", {name: (a.type if isinstance(a, ak.Array) else a.dtype) for name, a in chunk.items()})
+            tree.extend(chunk)
+    return fname
+
+def generateFiles(outDir, nFiles, eventsPerFile, seed=0, rates={}, runs=(367080, 367100)):
+    '''
+    Write nFiles files with eventsPerFile events each into outDir, return their paths.
+    '''
+    os.makedirs(outDir, exist_ok=True)
+    files = []
+    for i in range(nFiles):
+        fname = os.path.join(outDir, f"synthetic_{i:04d}.root")
+        files.append(writeFile(fname, eventsPerFile, seed=seed + i, rates=rates, firstEvent=i * eventsPerFile, runs=runs))
+    return files
+
+def parseRates(items):
+    rates = {}
+    for item in items:
+        name, value = item.split("=")
+        rates[name.replace("HLT_", "").replace("L1_", "")] = float(value)
+    return rates
+
+def main(args):
+    rates = parseRates(args.rates)
+    unknown = [name for name in rates if name not in TRIGGERS and name not in L1_SEEDS]
+    if unknown:
+        sys.exit(f"Unknown trigger(s): {', '.join(unknown)}")
+    files = generateFiles(args.outDir, args.files, args.events, seed=args.seed, rates=rates, runs=tuple(args.runs))
+    print(f"Wrote {args.files} x {args.events} events to {args.outDir}")
+    for fname in files:
+        print(fname)
+
+if __name__ == "__main__":
+
+    parser = ArgumentParser(description="Write NanoAOD-like files with the branches read by the trigger efficiency modules")
+    parser.add_argument("outDir", type=str, help="Output directory")
+    parser.add_argument("-n", "--events", dest="events", type=int, action="store", default=100000, help="Number of events per file [default: %s]" % (100000))
+    parser.add_argument("--files", dest="files", type=int, action="store", default=1, help="Number of files [default: %s]" % (1))
+    parser.add_argument("--seed", dest="seed", type=int, action="store", default=0, help="Random seed of the first file, incremented for each further file [default: %s]" % (0))
+    parser.add_argument("--rate", dest="rates", action="append", default=[], help="Plateau firing probability of a path, e.g. --rate HLT_Mu50=0.5 (repeatable) [default: see TRIGGERS]")
+    parser.add_argument("--runs", dest="runs", type=int, nargs=2, default=[367080, 367100], help="First and last run number [default: %s]" % ("367080 367100"))
+    args = parser.parse_args()
+    main(args)
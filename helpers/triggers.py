@@ -0,0 +1,90 @@
+import os
+import json
+import hashlib
+import numpy as np
+
+from helpers.prefetch import originOf
+
+class TriggerBits:
+    '''
+    Pack the decisions of the configured HLT paths into one integer per event,
+    so that the reference OR, the signal OR and the per-path tests become bit
+    operations instead of repeated branch lookups. The signal paths occupy the
+    lowest bits in the order given, followed by the reference paths that are
+    not also signal paths.
+
+    With a cacheDir the bits of a whole input file are computed once with
+    uproot, stored there as a .npy file and looked up by entry number in the
+    event loop.
+    '''
+    def __init__(self, reference_paths, signal_paths, cacheDir=None):
+        self.reference_paths = list(reference_paths)
+        self.signal_paths = list(signal_paths)
+        self.paths = self.signal_paths + [p for p in self.reference_paths if p not in self.signal_paths]
+        if len(self.paths) > 63:
+            raise ValueError("At most 63 paths fit into the trigger bit mask")
+        self.bit = {path: 1 << i for i, path in enumerate(self.paths)}
+        self.referenceMask = sum(self.bit[p] for p in self.reference_paths)
+        self.signalMask = sum(self.bit[p] for p in self.signal_paths)
+        self.cacheDir = cacheDir
+        self.fileBits = None
+        self.tree = None
+
+    def branches(self):
+        return [f"HLT_{path}" for path in self.paths]
+
+    def fromEvent(self, hlt):
+        bits = 0
+        for path in self.paths:
+            if getattr(hlt, path):
+                bits |= self.bit[path]
+        return bits
+
+    def fromArrays(self, events):
+        '''
+        Bit masks of a chunk of events given as (awkward or NumPy) arrays keyed by branch name.
+        '''
+        bits = np.zeros(len(events[self.branches()[0]]), dtype=np.int64)
+        for path in self.paths:
+            bits |= np.where(np.asarray(events[f"HLT_{path}"]) != 0, self.bit[path], 0)
+        return bits
+
+    def signalBits(self, bits):
+        # Fired signal paths, bit i for signal_paths[i]
+        return bits & self.signalMask
+
+    def beginFile(self, fname, tree=None):
+        self.tree = tree
+        self.fileBits = self.load(fname) if self.cacheDir else None
+
+    def eventBits(self, event, hlt):
+        if self.fileBits is not None:
+            return int(self.fileBits[self.tree.GetReadEntry()])
+        return self.fromEvent(hlt)
+
+    def cacheFile(self, fname, fileId):
+        # Keyed on the full path or URL of the input together with the size and UUID
+        # from its header, which a copy keeps. A local copy of an input (see
+        # helpers/prefetch.py) is looked up under the name of the original.
+        origin = originOf(fname)
+        if "://" not in origin:
+            origin = os.path.abspath(origin)
+        key = hashlib.sha1(json.dumps([origin, fileId, self.paths]).encode()).hexdigest()
+        return os.path.join(self.cacheDir, f"hltbits_{key}.npy")
+
+    def load(self, fname, treeName="Events"):
+        '''
+        Bit masks of all entries of an input file, read from the cache or computed and cached.
+        '''
+        import uproot
+        with uproot.open(fname) as f:
+            uuid = f.file.fUUID
+            cached = self.cacheFile(fname, [int(f.file.fEND), uuid.hex() if isinstance(uuid, bytes) else str(uuid)])
+            if os.path.exists(cached):
+                return np.load(cached)
+            bits = self.fromArrays(f[treeName].arrays(self.branches(), library="np"))
+        os.makedirs(self.cacheDir, exist_ok=True)
+        tmp = f"{cached}.{os.getpid()}.tmp.npy"
+        np.save(tmp, bits)
+        os.replace(tmp, cached)
+        return bits
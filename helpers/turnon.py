@@ -0,0 +1,158 @@
+import math
+import json
+import numpy as np
+from helpers.utils import erfArray
+
+# Batched maximum-likelihood fits of trigger turn-on curves,
+#   eff(x) = plateau * F((x - mu) / sigma),
+# with F the normal CDF ("erf") or the logistic function ("sigmoid"), to the
+# passed (k) and total (n) counts of the bins of many curves at once. The
+# binomial likelihood is maximized by Fisher scoring with a per-curve
+# Levenberg-Marquardt damping, all curves advancing together as stacked
+# NumPy arrays, so hundreds of curves take about as long as one.
+
+MODELS = ["erf", "sigmoid"]
+PARAMETERS = ["mu", "sigma", "plateau"]
+
+def _shape(z, model):
+    '''
+    F(z) and dF/dz.
+    '''
+    if model == "erf":
+        erf, derf = erfArray(z / math.sqrt(2.), derivative=True)
+        return 0.5 * (1. + erf), derf / (2. * math.sqrt(2.))
+    F = 0.5 * (1. + np.tanh(0.5 * z))
+    return F, F * (1. - F)
+
+def _quantile(q, model):
+    '''
+    z at which F(z) = q.
+    '''
+    if model == "sigmoid":
+        return math.log(q / (1. - q))
+    # Bisection on the normal CDF, math has no inverse erf
+    lo, hi = -10., 10.
+    for _ in range(100):
+        mid = 0.5 * (lo + hi)
+        lo, hi = (mid, hi) if 0.5 * (1. + math.erf(mid / math.sqrt(2.))) < q else (lo, mid)
+    return 0.5 * (lo + hi)
+
+def _model(theta, x, model):
+    '''
+    Efficiency and its derivatives with respect to the fit parameters
+    theta = (mu, log sigma, logit plateau), for (curves x bins) x.
+    '''
+    mu, sigma = theta[:, 0:1], np.exp(theta[:, 1:2])
+    plateau = 0.5 * (1. + np.tanh(0.5 * theta[:, 2:3]))
+    z = (x - mu) / sigma
+    F, f = _shape(z, model)
+    p = plateau * F
+    dp = np.stack([-plateau * f / sigma, -plateau * f * z, F * plateau * (1. - plateau)], axis=-1)
+    return p, dp
+
+def _nll(p, n, k):
+    p = np.clip(p, 1e-12, 1. - 1e-12)
+    return -(k * np.log(p) + (n - k) * np.log1p(-p)).sum(axis=1)
+
+def initialValues(x, n, k):
+    '''
+    Starting values of (mu, log sigma, logit plateau) from the measured efficiencies.
+    '''
+    with np.errstate(invalid="ignore", divide="ignore"):
+        eff = np.where(n > 0, k / n, np.nan)
+    filled = n > 0
+    # Empty curves get the range [0, 0], they are not fitted anyway
+    empty = ~filled.any(axis=1)
+    xmin = np.where(empty, 0., np.where(filled, x, np.inf).min(axis=1))
+    xmax = np.where(empty, 0., np.where(filled, x, -np.inf).max(axis=1))
+    # Plateau from the upper half of the filled range, mu where half of it is first reached
+    upper = filled & (x >= 0.5 * (xmin + xmax)[:, None])
+    plateau = np.clip(np.nansum(np.where(upper, k, 0.), axis=1) / np.maximum(np.where(upper, n, 0.).sum(axis=1), 1.), 0.05, 0.995)
+    above = filled & (eff >= 0.5 * plateau[:, None])
+    first = np.where(above.any(axis=1), np.argmax(above, axis=1), 0)
+    mu = x[np.arange(len(x)), first]
+    sigma = np.maximum(0.1 * (xmax - xmin), 1e-3)
+    return np.stack([mu, np.log(sigma), np.log(plateau / (1. - plateau))], axis=1)
+
+def fitTurnOns(x, n, k, model="erf", maxIter=200, tolerance=1e-9):
+    '''
+    Fit all curves at once. x, n and k are (curves x bins) arrays of the
+    bin centers, total and passed counts; bins with n = 0 are ignored, so
+    curves with fewer bins can be padded with them. Returns a dict with the
+    parameters (curves x 3: mu, sigma, plateau), their covariance matrices,
+    the minimum negative log-likelihood and deviance, the number of fitted
+    bins and whether each fit converged (never with fewer than 3 bins or a
+    singular Fisher matrix).
+    '''
+    if model not in MODELS:
+        raise ValueError(f"Unknown turn-on model {model}, choose from {MODELS}")
+    x, n, k = [np.asarray(a, dtype=np.float64) for a in (x, n, k)]
+    theta = initialValues(x, n, k)
+    damping = np.full(len(x), 1e-3)
+    p, dp = _model(theta, x, model)
+    nll = _nll(p, n, k)
+    converged = np.zeros(len(x), dtype=bool)
+    for iteration in range(maxIter):
+        pc = np.clip(p, 1e-12, 1. - 1e-12)
+        w = n / (pc * (1. - pc))
+        grad = np.einsum("cb,cbi->ci", (k - n * pc) / (pc * (1. - pc)), dp)
+        fisher = np.einsum("cb,cbi,cbj->cij", w, dp, dp)
+        # Converged once the expected decrease of the likelihood (Newton decrement) is negligible
+        decrement = 0.5 * np.einsum("ci,ci->c", grad, (np.linalg.pinv(fisher) @ grad[:, :, None])[:, :, 0])
+        converged |= decrement < tolerance
+        failed = damping > 1e10
+        if (converged | failed).all():
+            break
+        scale = np.einsum("cii->ci", fisher) + 1e-12
+        step = np.linalg.solve(fisher + damping[:, None, None] * np.eye(3) * scale[:, :, None], grad[:, :, None])[:, :, 0]
+        step[converged | failed] = 0.
+        trial = theta + step
+        pt, dpt = _model(trial, x, model)
+        nllTrial = _nll(pt, n, k)
+        better = nllTrial <= nll
+        theta[better], p[better], dp[better], nll[better] = trial[better], pt[better], dpt[better], nllTrial[better]
+        damping = np.where(better, np.maximum(damping / 10., 1e-9), damping * 10.)
+
+    # Covariance of (mu, sigma, plateau) from the Fisher information at the minimum
+    pc = np.clip(p, 1e-12, 1. - 1e-12)
+    fisher = np.einsum("cb,cbi,cbj->cij", n / (pc * (1. - pc)), dp, dp)
+    sigma = np.exp(theta[:, 1])
+    plateau = 0.5 * (1. + np.tanh(0.5 * theta[:, 2]))
+    jacobian = np.zeros((len(x), 3, 3))
+    jacobian[:, 0, 0], jacobian[:, 1, 1], jacobian[:, 2, 2] = 1., sigma, plateau * (1. - plateau)
+    cov = jacobian @ np.linalg.pinv(fisher) @ jacobian.transpose(0, 2, 1)
+    # With fewer than 3 filled bins, or bins that do not constrain all the
+    # parameters, the Fisher matrix is singular and its zero Newton decrement
+    # does not mean the fit converged
+    nbins = (n > 0).sum(axis=1)
+    converged &= (nbins >= 3) & (np.linalg.matrix_rank(fisher) == 3)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        deviance = 2. * (np.where(k > 0, k * np.log(k / (n * pc)), 0.) + np.where(n > k, (n - k) * np.log((n - k) / (n * (1. - pc))), 0.)).sum(axis=1)
+    return {"params": np.stack([theta[:, 0], sigma, plateau], axis=1),
+            "cov": cov,
+            "nll": nll,
+            "deviance": deviance,
+            "nbins": nbins,
+            "converged": converged,
+            "iterations": iteration + 1}
+
+def turnOnPoints(params, cov, levels=(0.5, 0.95, 0.99), model="erf"):
+    '''
+    x at which the efficiency reaches each level of its plateau, and the
+    uncertainties from the covariance, both (curves x levels).
+    '''
+    z = np.array([_quantile(level, model) for level in levels])
+    points = params[:, 0:1] + z[None, :] * params[:, 1:2]
+    var = cov[:, 0, 0][:, None] + z[None, :]**2 * cov[:, 1, 1][:, None] + 2. * z[None, :] * cov[:, 0, 1][:, None]
+    return points, np.sqrt(np.maximum(var, 0.))
+
+def readPlateauCuts(path, directory):
+    '''
+    Plateau cuts of one analysis directory from a JSON file written by fitEffs.py.
+    '''
+    with open(path) as f:
+        cuts = json.load(f)
+    if directory not in cuts:
+        raise ValueError(f"{path} has no plateau cuts for {directory}")
+    return {var: float(cut) for var, cut in cuts[directory].items()}
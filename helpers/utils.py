@@ -1,8 +1,14 @@
 import math
-import itertools
-import logging
-import ROOT
-ROOT.PyConfig.IgnoreCommandLineOptions = True
+import numpy as np
+
+def importROOT():
+    '''
+    Import ROOT on first use, so that scripts which only parse their arguments
+    (e.g. --help) or never open a file do not pay the seconds of its startup.
+    '''
+    import ROOT
+    ROOT.PyConfig.IgnoreCommandLineOptions = True
+    return ROOT
 
 def deltaPhi(phi1, phi2):
     try:
@@ -29,3 +35,40 @@ def deltaR(eta1, phi1, eta2=None, phi2=None):
 
 def deltaEta(obj1, obj2):
     return abs(obj1.eta - obj2.eta)
+
+# Array versions of the functions above. They take NumPy arrays (or anything
+# np.asarray accepts) and broadcast, and give the same values as the scalar
+# functions element by element.
+
+def deltaPhiArray(phi1, phi2):
+    dphi = np.asarray(phi1, dtype=np.float64) - np.asarray(phi2, dtype=np.float64)
+    dphi = np.where(dphi > math.pi, dphi - 2 * math.pi, np.where(dphi < -math.pi, dphi + 2 * math.pi, dphi))
+    # Differences of more than one turn do not occur for phi in [-pi, pi], wrap them with the modulo
+    far = np.abs(dphi) > math.pi
+    if np.any(far):
+        dphi = np.where(far, np.remainder(dphi + math.pi, 2 * math.pi) - math.pi, dphi)
+    return dphi
+
+def deltaR2Array(eta1, phi1, eta2, phi2):
+    deta = np.asarray(eta1, dtype=np.float64) - np.asarray(eta2, dtype=np.float64)
+    dphi = deltaPhiArray(phi1, phi2)
+    return deta * deta + dphi * dphi
+
+def deltaRArray(eta1, phi1, eta2, phi2):
+    return np.sqrt(deltaR2Array(eta1, phi1, eta2, phi2))
+
+def erfArray(x, derivative=False):
+    # Abramowitz-Stegun 7.1.26, accurate to 1.5e-7, to avoid depending on scipy
+    # (helpers/synthetic.py keeps its own copy, it runs as a standalone script).
+    # With derivative=True also returns the exact derivative of the
+    # approximation, for fits whose gradients must match the model.
+    s = np.sign(x)
+    x = np.abs(x)
+    t = 1. / (1. + 0.3275911 * x)
+    poly = ((((1.061405429 * t - 1.453152027) * t) + 1.421413741) * t - 0.284496736) * t + 0.254829592
+    e = np.exp(-x * x)
+    y = 1. - poly * t * e
+    if not derivative:
+        return s * y
+    dpoly = (((4. * 1.061405429 * t - 3. * 1.453152027) * t) + 2. * 1.421413741) * t - 0.284496736
+    return s * y, e * ((poly + t * dpoly) * 0.3275911 * t * t + 2. * x * poly * t)
@@ -8,9 +8,16 @@ DESCRIPTION:
 # Import modules
 #================
 from argparse import ArgumentParser
-import ROOT
 import math 
 import time
+import os
+from helpers.bootstrap import readReplicas, bandGraph
+from helpers.render import CACHEFILE, renderCanvases
+from helpers.utils import importROOT
+
+# Imported by setupROOT()
+ROOT = None
+colors = {}
 
 def getCanvas():
     d = ROOT.TCanvas("", "", 800, 700)
@@ -53,106 +60,140 @@ def SetStyle(h, color, marker_style):
     h.SetMarkerStyle(marker_style)
     return h
 
-ROOT.gROOT.SetBatch(True)
-ROOT.gStyle.SetOptStat(0)
-ROOT.gStyle.SetTextFont(42)
-
 def SetStyle(h, COLOR):
     h.SetMarkerStyle(21)
     h.SetMarkerColor(COLOR)
     h.SetLineColor(COLOR)
     return h
 
-colors = {0: ROOT.kBlack,
-          1: ROOT.kBlue,
-          2: ROOT.kGreen+1,
-          3: ROOT.kRed+1,
-          4: ROOT.kOrange-3,
-          5: ROOT.kMagenta+2,
-          6: ROOT.kTeal+3,
-          }
+def setupROOT():
+    '''
+    Import ROOT in batch mode with the plot style when the first plot is made,
+    so that the argument parsing (e.g. --help) does not wait for it.
+    '''
+    global ROOT, colors
+    if ROOT is not None:
+        return
+    ROOT = importROOT()
+    ROOT.gROOT.SetBatch(True)
+    ROOT.gStyle.SetOptStat(0)
+    ROOT.gStyle.SetTextFont(42)
+
+    colors = {0: ROOT.kBlack,
+              1: ROOT.kBlue,
+              2: ROOT.kGreen+1,
+              3: ROOT.kRed+1,
+              4: ROOT.kOrange-3,
+              5: ROOT.kMagenta+2,
+              6: ROOT.kTeal+3,
+              }
           
 
-def main(args):
+def drawCanvas(fdir, canvas, outputs):
+    '''
+    Draw one canvas described by a dict of getCanvases() and save it as each of outputs.
+    '''
+    # Also in the worker processes, which may not be forked from the main one
+    setupROOT()
+    c = getCanvas()
+    if canvas["kind"] == "eff2D":
+        eff2D = ROOT.TEfficiency(fdir.Get(canvas["num"]), fdir.Get(canvas["den"]))
+        eff2D.Draw("COLZ")
+    else:
+        leg = createLegend()
+        den = fdir.Get(canvas["den"])
+        denReplicas = readReplicas(fdir, canvas["den"]) if canvas["bootstrap"] else None
+
+        nums = {}
+        effs = {}
+        bands = {}
+        for j, (trg, numName) in enumerate(canvas["nums"]):
+            nums[trg] = fdir.Get(numName)
+            effs[trg] = ROOT.TEfficiency(nums[trg], den)
+            effs[trg].SetStatisticOption(canvas["statOption"])
+            effs[trg] = SetStyle(effs[trg], canvas["colors"][j])
+            if j == 0:
+                effs[trg].Draw()
+            else:
+                effs[trg].Draw("same")
+            leg.AddEntry(effs[trg], trg.replace("_HLT", "HLT"), "ep")
+            if denReplicas is not None:
+                # 68% band of the bootstrap replicas around the efficiency
+                bands[trg] = bandGraph(nums[trg], den, readReplicas(fdir, numName), denReplicas)
+                bands[trg].SetFillColorAlpha(canvas["colors"][j], 0.25)
+                bands[trg].SetLineWidth(0)
+                bands[trg].Draw("2 same")
+
+        c.Modified()
+        c.Update()
+        effs["TrgOR"].GetPaintedGraph().GetYaxis().SetRangeUser(0.0, 1.2)
+        effs["TrgOR"].GetPaintedGraph().GetYaxis().SetTitle("#varepsilon_{L1+HLT}")
+        leg.Draw("same")
+
+    c.Modified()
+    c.Update()
+    # Styling stuff
+    tex_cms = AddCMSText()
+    tex_cms.Draw("same")
+
+    private = AddPrivateWorkText()
+    private.Draw("same")
+
+    header = ROOT.TLatex()
+    header.SetTextSize(0.04)
+    header.DrawLatexNDC(0.57, 0.905, "2023, #sqrt{s} = 13.6 TeV")
+
+    c.Update()
+    c.Modified()
+    for savename in outputs:
+        c.SaveAs(savename)
 
-    f = ROOT.TFile(args.rfile, "READ")
-    fdir = f.GetDirectory("hadTrigAnalyzerNanoAOD")
-    statOption = ROOT.TEfficiency.kFCP
+def getCanvases(args):
+    '''
+    The canvases to draw, as dicts of the output name, the histograms read and the style options.
+    '''
+    statOption = int(ROOT.TEfficiency.kFCP)
 
     variables  = ["pt", "mSD", "eta"]
     selections = ["", "plateauPt", "plateauMSD", "plateauMSDPt"]
     triggers   = ["TrgOR", "_HLT_AK8PFJet420_MassSD30", "_HLT_AK8PFJet425_SoftDropMass40", "_HLT_AK8PFJet450", "_HLT_AK8PFJet500"]
 
+    canvases = []
     for sel in selections:
         for var in variables:
-            c = getCanvas()
-            leg = createLegend()
             if sel == "":
-                den = fdir.Get(f'h_AK8_{var}')
+                denName = f'h_AK8_{var}'
+                nums = [(trg, f'h_AK8_{var}_pass{trg}') for trg in triggers]
             else:
-                den = fdir.Get(f'h_AK8_{var}_{sel}')
-
-            nums = {}
-            effs = {}
-            for j, trg in enumerate(triggers):
-                if sel == "":
-                    nums[trg] = fdir.Get(f'h_AK8_{var}_pass{trg}')
-                else:
-                    nums[trg] = fdir.Get(f'h_AK8_{var}_pass{trg}_{sel}')
-                effs[trg] = ROOT.TEfficiency(nums[trg], den)
-                effs[trg].SetStatisticOption(statOption)
-                effs[trg] = SetStyle(effs[trg], colors[j])
-                if j == 0:
-                    effs[trg].Draw()
-                else:
-                    effs[trg].Draw("same")
-                leg.AddEntry(effs[trg], trg.replace("_HLT", "HLT"), "ep")
-                    
-            c.Modified()
-            c.Update()
-            effs["TrgOR"].GetPaintedGraph().GetYaxis().SetRangeUser(0.0, 1.2)
-            effs["TrgOR"].GetPaintedGraph().GetYaxis().SetTitle("#varepsilon_{L1+HLT}")
-            leg.Draw("same")
-            
-            # Styling stuff
-            tex_cms = AddCMSText()
-            tex_cms.Draw("same")
-            
-            private = AddPrivateWorkText()
-            private.Draw("same")
-            
-            header = ROOT.TLatex()
-            header.SetTextSize(0.04)
-            header.DrawLatexNDC(0.57, 0.905, "2023, #sqrt{s} = 13.6 TeV")
-            
-            c.Update()
-            c.Modified()
-            for fs in args.formats:
-                savename = f'plots/TrgEffs_AK8_{var}{fs}' if sel == "" else f'plots/TrgEffs_AK8_{var}_{sel}{fs}'
-                c.SaveAs(savename)
-
+                denName = f'h_AK8_{var}_{sel}'
+                nums = [(trg, f'h_AK8_{var}_pass{trg}_{sel}') for trg in triggers]
+            canvases.append({"name": f'plots/TrgEffs_AK8_{var}' if sel == "" else f'plots/TrgEffs_AK8_{var}_{sel}',
+                             "kind": "eff",
+                             "den": denName,
+                             "nums": nums,
+                             "hists": [denName] + [numName for trg, numName in nums],
+                             "statOption": statOption,
+                             "colors": [int(colors[j]) for j in range(len(triggers))],
+                             "bootstrap": args.bootstrap,
+                             })
 
     # Plot 2D:
-    c2D = getCanvas()
+    canvases.append({"name": "plots/Eff2D_AK8trigger_mSDvsPt",
+                     "kind": "eff2D",
+                     "den": 'h_AK8_mSD_vs_pt',
+                     "num": 'h_AK8_mSD_vs_pt_passTrgOR',
+                     "hists": ['h_AK8_mSD_vs_pt', 'h_AK8_mSD_vs_pt_passTrgOR'],
+                     })
+    return canvases
 
-    den = fdir.Get('h_AK8_mSD_vs_pt')
-    num = fdir.Get('h_AK8_mSD_vs_pt_passTrgOR')
+def main(args):
+    setupROOT()
 
-    eff2D = ROOT.TEfficiency(num, den)
-    eff2D.Draw("COLZ")
-    c2D.Modified()
-    c2D.Update()
-    tex_cms = AddCMSText()
-    tex_cms.Draw("same")
-    private = AddPrivateWorkText()
-    private.Draw("same")
-    header = ROOT.TLatex()
-    header.SetTextSize(0.04)
-    header.DrawLatexNDC(0.57, 0.905, "2023, #sqrt{s} = 13.6 TeV")
-    c2D.Update()
-    c2D.Modified()
-    for fs in args.formats:
-        c2D.SaveAs("plots/Eff2D_AK8trigger_mSDvsPt%s" % (fs))
+    start = time.time()
+    cacheFile = None if args.noCache else args.renderCache
+    rendered, cached = renderCanvases(drawCanvas, args.rfile, "hadTrigAnalyzerNanoAOD", getCanvases(args), args.formats, jobs=args.jobs, cacheFile=cacheFile)
+    if args.verbose:
+        print(f"Rendered {rendered} plots, {cached} up to date, in {time.time() - start:.1f} s")
 
 if __name__ == "__main__":
 
@@ -160,12 +201,19 @@ if __name__ == "__main__":
     YEAR          = "2023"
     TRGROOTFILE   = "histos_HadTrigNanoAOD.root"
     FORMATS       = ['.png', '.pdf']
+    JOBS          = os.cpu_count()
+    RENDERCACHE   = os.path.join("plots", CACHEFILE)
 
     parser = ArgumentParser(description="Derive the trigger scale factors")
     parser.add_argument("-v", "--verbose", dest="verbose", default=VERBOSE, action="store_true", help="Verbose mode for debugging purposes [default: %s]" % (VERBOSE))
     parser.add_argument("--rfile", dest="rfile", type=str, action="store", default=TRGROOTFILE, help="ROOT file containing the denominators and numerators [default: %s]" % (TRGROOTFILE))
     parser.add_argument("--year", dest="year", action="store", default=YEAR, help="Process year")
-    parser.add_argument("--formats", dest="formats", default=FORMATS, action="store", help="Formats to save histograms")
+    parser.add_argument("--formats", dest="formats", default=FORMATS, nargs="+", help="Formats to save histograms")
+    parser.add_argument("--bootstrap", dest="bootstrap", default=False, action="store_true", help="Draw the one sigma bands (16-84 percent quantiles) of the bootstrap replicas, if the file has them (see --bootstrap of the getEffs scripts) [default: %s]" % (False))
+
+    parser.add_argument("-j", "--jobs", dest="jobs", type=int, action="store", default=JOBS, help="Number of processes rendering the canvases [default: %s]" % (JOBS))
+    parser.add_argument("--render-cache", dest="renderCache", type=str, action="store", default=RENDERCACHE, help="Index of the rendered plots, plots whose histograms and options did not change since are not rendered again [default: %s]" % (RENDERCACHE))
+    parser.add_argument("--no-cache", dest="noCache", default=False, action="store_true", help="Render all plots, ignoring and not updating the render cache [default: %s]" % (False))
 
     args = parser.parse_args()
     main(args)
@@ -8,9 +8,14 @@ DESCRIPTION:
 # Import modules
 #================
 from argparse import ArgumentParser
-import ROOT
 import math 
 import time
+from helpers.bootstrap import readReplicas, bandGraph
+from helpers.utils import importROOT
+
+# Imported by setupROOT()
+ROOT = None
+colors = {}
 
 def getCanvas():
     d = ROOT.TCanvas("", "", 800, 700)
@@ -53,27 +58,37 @@ def SetStyle(h, color, marker_style):
     h.SetMarkerStyle(marker_style)
     return h
 
-ROOT.gROOT.SetBatch(True)
-ROOT.gStyle.SetOptStat(0)
-ROOT.gStyle.SetTextFont(42)
-
 def SetStyle(h, COLOR):
     h.SetMarkerStyle(21)
     h.SetMarkerColor(COLOR)
     h.SetLineColor(COLOR)
     return h
 
-colors = {0: ROOT.kBlack,
-          1: ROOT.kBlue,
-          2: ROOT.kGreen+1,
-          3: ROOT.kRed+1,
-          4: ROOT.kOrange-3,
-          5: ROOT.kMagenta+2,
-          6: ROOT.kTeal+3,
-          }
+def setupROOT():
+    '''
+    Import ROOT in batch mode with the plot style when the first plot is made,
+    so that the argument parsing (e.g. --help) does not wait for it.
+    '''
+    global ROOT, colors
+    if ROOT is not None:
+        return
+    ROOT = importROOT()
+    ROOT.gROOT.SetBatch(True)
+    ROOT.gStyle.SetOptStat(0)
+    ROOT.gStyle.SetTextFont(42)
+
+    colors = {0: ROOT.kBlack,
+              1: ROOT.kBlue,
+              2: ROOT.kGreen+1,
+              3: ROOT.kRed+1,
+              4: ROOT.kOrange-3,
+              5: ROOT.kMagenta+2,
+              6: ROOT.kTeal+3,
+              }
           
 
 def main(args):
+    setupROOT()
 
     f = ROOT.TFile(args.rfile, "READ")
     fdir = f.GetDirectory("pfhtTrigAnalyzerNanoAOD")
@@ -86,9 +101,11 @@ def main(args):
         c = getCanvas()
         leg = createLegend()
         den = fdir.Get(f'h_{var}_all')
+        denReplicas = readReplicas(fdir, f'h_{var}_all') if args.bootstrap else None
 
         nums = {}
         effs = {}
+        bands = {}
         for j, trg in enumerate(triggers):
             nums[trg] = fdir.Get(f'h_{var}_{trg}')
             effs[trg] = ROOT.TEfficiency(nums[trg], den)
@@ -99,6 +116,12 @@ def main(args):
             else:
                 effs[trg].Draw("same")
             leg.AddEntry(effs[trg], trg.replace("passed", ""), "ep")
+            if denReplicas is not None:
+                # 68% band of the bootstrap replicas around the efficiency
+                bands[trg] = bandGraph(nums[trg], den, readReplicas(fdir, f'h_{var}_{trg}'), denReplicas)
+                bands[trg].SetFillColorAlpha(colors[j], 0.25)
+                bands[trg].SetLineWidth(0)
+                bands[trg].Draw("2 same")
                 
         c.Modified()
         c.Update()
@@ -157,6 +180,7 @@ if __name__ == "__main__":
     parser.add_argument("--rfile", dest="rfile", type=str, action="store", default=TRGROOTFILE, help="ROOT file containing the denominators and numerators [default: %s]" % (TRGROOTFILE))
     parser.add_argument("--year", dest="year", action="store", default=YEAR, help="Process year")
     parser.add_argument("--formats", dest="formats", default=FORMATS, action="store", help="Formats to save histograms")
+    parser.add_argument("--bootstrap", dest="bootstrap", default=False, action="store_true", help="Draw the one sigma bands (16-84 percent quantiles) of the bootstrap replicas, if the file has them (see --bootstrap of the getEffs scripts) [default: %s]" % (False))
 
     args = parser.parse_args()
     main(args)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+'''
+DESCRIPTION:
+Project the sparse N-dimensional histograms (THnSparseD) filled with --sparse,
+e.g. h_AK8_sparse and h_AK8_sparse_passTrgOR over pt x mSD x eta x PV, to one
+or two of their axes, after selecting ranges of the other axes and merging
+bins. The projections are written as TH1F or TH2F named as the booked
+histograms of those axes (h_AK8_pt_passTrgOR, h_AK8_mSD_vs_pt_passTrgOR, ...),
+so that the plotting, fitting and export scripts read them directly.
+
+'''
+#================
+# Import modules
+#================
+import os, sys
+from argparse import ArgumentParser
+from helpers.utils import importROOT
+
+def parseRange(text):
+    name, low, high = text.split(":")
+    return name, float(low), float(high)
+
+def parseRebin(text):
+    name, edges = text.split(":")
+    edges = [float(edge) for edge in edges.split(",")]
+    return name, int(edges[0]) if len(edges) == 1 else edges
+
+def project(sparse, axes, selections, rebins):
+    for name, low, high in selections:
+        sparse = sparse.select(name, low, high)
+    for name, edges in rebins:
+        sparse = sparse.rebin(name, edges)
+    return sparse.project(*axes)
+
+def main(args):
+
+    ROOT = importROOT()
+    from helpers.histograms import SparseHist
+
+    selections = [parseRange(text) for text in args.select]
+    rebins = [parseRebin(text) for text in args.rebin]
+    label = args.axes[0] if len(args.axes) == 1 else f"{args.axes[1]}_vs_{args.axes[0]}"
+
+    f = ROOT.TFile(args.rfile, "READ")
+    fdir = f.GetDirectory(args.dir)
+    if not fdir:
+        raise SystemExit(f"No directory {args.dir} in {args.rfile}")
+    names = [key.GetName() for key in fdir.GetListOfKeys() if key.GetClassName().startswith("THnSparse")]
+    if not names:
+        raise SystemExit(f"No sparse histograms in {args.rfile}:{args.dir}, fill them with --sparse")
+
+    fout = ROOT.TFile(args.output, "RECREATE")
+    dout = fout.mkdir(args.dir)
+    for name in names:
+        sparse = SparseHist.fromROOT(fdir.Get(name))
+        projected = project(sparse, args.axes, selections, rebins)
+        # Axis titles of the kept axes, from the ";x;y;z;..." title of the sparse histogram
+        titles = sparse.title.split(";")[1:]
+        projected.title = ";".join([""] + [titles[sparse.names.index(axis)] for axis in args.axes] + ["Efficiency"])
+        h = projected.toHist(name.replace("sparse", label)).toROOT()
+        dout.cd()
+        h.Write()
+        if args.verbose:
+            print(f"{name} ({len(sparse.cells()[0])} occupied bins) -> {h.GetName()}")
+    fout.Close()
+    f.Close()
+    print(f"Wrote {len(names)} projections on {' x '.join(args.axes)} to {args.output}")
+
+if __name__ == "__main__":
+
+    VERBOSE     = False
+    TRGROOTFILE = "histos_HadTrigNanoAOD.root"
+    HISTDIR     = "hadTrigAnalyzerNanoAOD"
+    OUTPUT      = "histos_projected.root"
+
+    parser = ArgumentParser(description="Project the sparse efficiency histograms to one or two of their axes")
+    parser.add_argument("-v", "--verbose", dest="verbose", default=VERBOSE, action="store_true", help="Print every projected histogram [default: %s]" % (VERBOSE))
+    parser.add_argument("--rfile", dest="rfile", type=str, action="store", default=TRGROOTFILE, help="ROOT file containing the sparse histograms [default: %s]" % (TRGROOTFILE))
+    parser.add_argument("--dir", dest="dir", type=str, action="store", default=HISTDIR, help="Directory of the sparse histograms [default: %s]" % (HISTDIR))
+    parser.add_argument("--axes", dest="axes", nargs="+", required=True, help="One or two axes to project to, x first, e.g. pt mSD")
+    parser.add_argument("--select", dest="select", nargs="+", default=[], metavar="AXIS:LOW:HIGH", help="Only keep the bins of an axis with their centre in [LOW, HIGH), e.g. eta:-1.3:1.3 [default: all bins]")
+    parser.add_argument("--rebin", dest="rebin", nargs="+", default=[], metavar="AXIS:EDGES", help="Merge the bins of an axis, by a factor (pv:5) or to a subset of its edges (pt:200,400,600,1000) [default: no rebinning]")
+    parser.add_argument("-o", "--output", dest="output", type=str, action="store", default=OUTPUT, help="Output ROOT file [default: %s]" % (OUTPUT))
+
+    args = parser.parse_args()
+    if not 1 <= len(args.axes) <= 2:
+        parser.error("Project to one or two axes")
+    main(args)
@@ -0,0 +1,4 @@
+import os, sys
+
+# The helpers are imported as in the scripts, from the top directory of the repository
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
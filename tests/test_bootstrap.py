@@ -0,0 +1,46 @@
+import math
+import numpy as np
+import pytest
+
+from helpers.bootstrap import POISSON_TABLE, Bootstrap, efficiencyQuantiles
+
+def testPoissonTable():
+    # Fractions of the 16-bit numbers mapped to each weight follow Poisson(1)
+    fractions = np.bincount(POISSON_TABLE, minlength=6)[:6] / len(POISSON_TABLE)
+    assert np.allclose(fractions, [math.exp(-1.) / math.factorial(k) for k in range(6)], atol=1e-4)
+
+def testWeights():
+    bootstrap = Bootstrap(100)
+    rng = np.random.default_rng(5)
+    ids = bootstrap.eventIds(rng.integers(360000, 370000, 20000), rng.integers(1, 1000, 20000), rng.integers(1, 10**9, 20000))
+    weights = bootstrap.weights(ids)
+    assert weights.shape == (20000, 100) and weights.dtype == np.uint8
+    assert abs(weights.mean() - 1.) < 0.01
+    assert abs(weights.var() - 1.) < 0.02
+    # Replicas are uncorrelated
+    corr = np.corrcoef(weights[:, :10].T.astype(np.float64))
+    assert np.abs(corr[~np.eye(10, dtype=bool)]).max() < 0.05
+
+def testEventIdsDeterministic():
+    bootstrap = Bootstrap(8)
+    ids = bootstrap.eventIds([367080, 367080], [12, 12], [1, 2])
+    assert ids[0] != ids[1]
+    # The per-event and the columnar loop see the same weights, as does any other job
+    assert bootstrap.eventId(367080, 12, 2) == ids[1]
+    assert np.array_equal(Bootstrap(8).weights(ids), bootstrap.weights(ids))
+    assert not np.array_equal(Bootstrap(8, seed=1).eventIds([367080], [12], [1]), ids[:1])
+
+def testBlocks():
+    bootstrap = Bootstrap(100, maxCells=1000)
+    assert [(b.start, b.stop) for b in bootstrap.blocks(25)] == [(0, 10), (10, 20), (20, 25)]
+    with pytest.raises(ValueError):
+        Bootstrap(0)
+
+def testEfficiencyQuantiles():
+    num = np.array([[1., 0., 5.], [2., 0., 6.], [3., 0., 7.]])
+    den = np.array([[4., 0., 10.], [4., 0., 10.], [4., 1., 10.]])
+    lo, hi = efficiencyQuantiles(num, den, quantiles=(0., 1.))
+    assert np.allclose(lo[[0, 2]], [0.25, 0.5]) and np.allclose(hi[[0, 2]], [0.75, 0.7])
+    # Only the replica with a denominator counts in the second bin
+    assert lo[1] == hi[1] == 0.
+    assert np.isnan(efficiencyQuantiles(num, np.zeros_like(den))).all()
@@ -0,0 +1,108 @@
+import numpy as np
+import pytest
+
+pa = pytest.importorskip("pyarrow")
+from helpers.effstable import EfficiencyTable, tableKey, writeTable
+from helpers.lookup import EfficiencyLookup
+
+def columns(xedges, yedges=None, seed=0):
+    rng = np.random.default_rng(seed)
+    xlow, xhigh = np.asarray(xedges[:-1], dtype=np.float64), np.asarray(xedges[1:], dtype=np.float64)
+    if yedges is None:
+        ylow = yhigh = np.full(len(xlow), np.nan)
+    else:
+        ny = len(yedges) - 1
+        xlow, xhigh = np.tile(xlow, ny), np.tile(xhigh, ny)
+        ylow, yhigh = np.repeat(yedges[:-1], len(xedges) - 1).astype(np.float64), np.repeat(yedges[1:], len(xedges) - 1).astype(np.float64)
+    n = len(xlow)
+    den = rng.integers(1, 100, n).astype(np.float64)
+    num = np.floor(den * rng.uniform(size=n))
+    return {"bin": np.arange(1, n + 1), "xlow": xlow, "xhigh": xhigh, "ylow": ylow, "yhigh": yhigh,
+            "num": num, "den": den, "eff": num / den, "effLow": num / den - 0.1, "effHigh": num / den + 0.1,
+            "bootstrapLow": np.full(n, np.nan), "bootstrapHigh": np.full(n, np.nan)}
+
+@pytest.fixture
+def table(tmp_path):
+    groups = [(("metTrigAnalyzerNanoAOD", "met_pt", "", "OR"), columns([100., 200., 300., 600.])),
+              (("hadTrigAnalyzerNanoAOD", "mSD_vs_pt", "", "OR"), columns([200., 400., 1000.], [0., 50., 400.], seed=1)),
+              (("hadTrigAnalyzerNanoAOD", "pt", "plateauMSD", "HLT_AK8PFJet500"), columns([200., 500., 1000.], seed=2))]
+    path = str(tmp_path / "effs.arrow")
+    assert writeTable(path, groups, {"level": 0.68}) == 3
+    return EfficiencyTable(path), dict(groups)
+
+def testKeysAndMetadata(table):
+    t, groups = table
+    assert sorted(t.keys()) == sorted(groups)
+    assert t.metadata == {"level": 0.68}
+    assert tableKey("a", "b", "", "OR") == "a/b//OR"
+
+def testGet(table):
+    t, groups = table
+    for key, cols in groups.items():
+        batch = t.get(*key)
+        assert batch.column("analysis").to_pylist() == [key[0]] * len(cols["bin"])
+        for name in ["bin", "xlow", "num", "den", "eff"]:
+            assert np.array_equal(batch.column(name).to_numpy(), cols[name])
+    assert t.read().num_rows == sum(len(cols["bin"]) for cols in groups.values())
+    with pytest.raises(KeyError):
+        t.get("metTrigAnalyzerNanoAOD", "met_pt", "", "HLT_PFMET120")
+
+def testLookupFromTable(table):
+    t, groups = table
+    cols = groups[("hadTrigAnalyzerNanoAOD", "mSD_vs_pt", "", "OR")]
+    lookup = EfficiencyLookup.fromTable(t, "hadTrigAnalyzerNanoAOD", "mSD_vs_pt")
+    assert lookup.dimension == 2
+    assert np.allclose(lookup([300., 700., 700.], [10., 10., 100.]), cols["eff"][[0, 1, 3]])
+    lookup1D = EfficiencyLookup.fromTable(t, "metTrigAnalyzerNanoAOD", "met_pt")
+    assert lookup1D.dimension == 1 and np.allclose(lookup1D([150., 450.]), groups[("metTrigAnalyzerNanoAOD", "met_pt", "", "OR")]["eff"][[0, 2]])
+
+class StubAxis:
+    def __init__(self, edges):
+        self.edges = edges
+
+    def GetBinLowEdge(self, i):
+        return self.edges[i - 1]
+
+    def GetBinUpEdge(self, i):
+        return self.edges[i]
+
+class StubHist:
+    '''
+    The parts of a TH1D used by exportEffs.binColumns.
+    '''
+    def __init__(self, contents, edges):
+        self.contents = contents
+        self.axis = StubAxis(edges)
+
+    def GetNbinsX(self):
+        return len(self.axis.edges) - 1
+
+    def GetDimension(self):
+        return 1
+
+    def GetXaxis(self):
+        return self.axis
+
+    def GetYaxis(self):
+        return self.axis
+
+    def GetBinContent(self, i):
+        return self.contents[i]
+
+class StubROOT:
+    class TEfficiency:
+        @staticmethod
+        def ClopperPearson(n, k, level, upper):
+            return 1. if upper else 0.
+
+def testBinColumnsBands():
+    exportEffs = pytest.importorskip("exportEffs")
+    den = StubHist([0., 10., 20., 40., 0.], [0., 1., 2., 3.])
+    num = StubHist([0., 5., 10., 40., 0.], [0., 1., 2., 3.])
+    # Replicas (replicas x cells), indexed by global bin number with the underflow first
+    denReplicas = np.array([[0., 10., 20., 40., 0.], [0., 10., 20., 40., 0.]])
+    numReplicas = np.array([[0., 4., 10., 40., 0.], [0., 6., 12., 40., 0.]])
+    cols = exportEffs.binColumns(StubROOT, num, den, 0.68, numReplicas, denReplicas)
+    assert np.array_equal(cols["eff"], [0.5, 0.5, 1.])
+    assert np.allclose(cols["bootstrapLow"], [0.4 + 0.16 * 0.2, 0.5 + 0.16 * 0.1, 1.])
+    assert np.allclose(cols["bootstrapHigh"], [0.4 + 0.84 * 0.2, 0.5 + 0.84 * 0.1, 1.])
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from helpers.lookup import EfficiencyLookup, findBins, uniformAxis
+
+def referenceBins(edges, values):
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+@pytest.mark.parametrize("xedges, yedges", [(np.linspace(0., 2000., 81), np.linspace(0., 400., 41)),
+                                            (np.array([0., 50., 100., 200., 500., 1000., 3000.]), np.linspace(0., 100., 11))])
+def testBinned(xedges, yedges):
+    rng = np.random.default_rng(1)
+    nx, ny = len(xedges) - 1, len(yedges) - 1
+    eff = rng.uniform(size=nx * ny)
+    eff[3] = np.nan
+    lookup = EfficiencyLookup(xedges, eff, yedges, empty=-1., chunkSize=1000)
+    x = rng.uniform(xedges[0] - 500., xedges[-1] + 500., 10000)
+    y = rng.uniform(yedges[0] - 50., yedges[-1] + 50., 10000)
+    # Exact edges and infinities
+    x[:5], y[:5] = xedges[:5], yedges[:5]
+    x[5], y[6] = np.inf, -np.inf
+    expected = np.where(np.isnan(eff), -1., eff)[referenceBins(yedges, y) * nx + referenceBins(xedges, x)]
+    assert np.array_equal(lookup(x, y), expected)
+
+def testUniformAxis():
+    assert uniformAxis(np.linspace(0., 1., 11)) == (0., 1.)
+    assert uniformAxis(np.array([0., 1., 3.])) is None
+
+def testFindBinsNaN():
+    values = np.array([np.nan, 0.5, 2.5])
+    for edges in [np.array([0., 1., 2., 3.]), np.array([0., 1., 2.5, 3.])]:
+        index = findBins(edges, uniformAxis(edges), values)
+        assert index[0] == 0
+        assert np.array_equal(index[1:], referenceBins(edges, values[1:]))
+
+def testInterpolation1D():
+    lookup = EfficiencyLookup([0., 1., 2., 4.], [0.1, 0.2, 0.3], interpolate=True)
+    # Constant beyond the outer centres, linear between them
+    assert np.allclose(lookup([-1., 0.5, 1., 2.25, 3., 10.]), [0.1, 0.1, 0.15, 0.25, 0.3, 0.3])
+
+def testInterpolation2D():
+    xedges, yedges = np.linspace(0., 4., 5), np.linspace(0., 2., 3)
+    eff = np.arange(8, dtype=np.float64) / 10.
+    lookup = EfficiencyLookup(xedges, eff, yedges, interpolate=True)
+    cx, cy = 0.5 * (xedges[1:] + xedges[:-1]), 0.5 * (yedges[1:] + yedges[:-1])
+    X, Y = np.meshgrid(cx, cy)
+    assert np.allclose(lookup(X.ravel(), Y.ravel()), eff)
+    assert np.isclose(lookup([1.], [1.])[0], np.mean(eff[[0, 1, 4, 5]]))
+
+def testInterpolationEmptyBins():
+    lookup = EfficiencyLookup([0., 1., 2., 3.], [0.2, np.nan, 0.6], interpolate=True)
+    # The empty neighbour drops out, also where its weight is zero, NaN at its centre
+    out = lookup([0.5, 1., 1.25, 1.5, 2., 2.5])
+    assert np.allclose(out[[0, 1, 2, 4, 5]], [0.2, 0.2, 0.2, 0.6, 0.6])
+    assert np.isnan(out[3])
+    assert np.isnan(EfficiencyLookup([0., 1., 2.], [np.nan, np.nan], interpolate=True)([0.7])[0])
+
+@pytest.mark.parametrize("interpolate", [False, True])
+def testNaNCoordinates(interpolate):
+    lookup = EfficiencyLookup([0., 1., 2.], [0.1, 0.2, 0.3, 0.4], [0., 1., 2.], interpolate=interpolate)
+    out = lookup([np.nan, 0.5, 0.5], [0.5, np.nan, 0.5])
+    assert np.isnan(out[:2]).all()
+    assert np.isfinite(out[2])
+
+def testShapesAndErrors():
+    lookup = EfficiencyLookup([0., 1., 2.], [0.1, 0.2])
+    assert lookup(np.zeros((3, 4))).shape == (3, 4)
+    with pytest.raises(ValueError):
+        lookup([0.5], [0.5])
+    with pytest.raises(ValueError):
+        EfficiencyLookup([0., 1., 2.], [0.1, 0.2, 0.3])
+
+def testSaveLoad(tmp_path):
+    lookup = EfficiencyLookup([0., 1., 2.], [0.1, 0.2, 0.3, 0.4], [0., 5., 10.])
+    lookup.save(tmp_path / "lookup.npz")
+    loaded = EfficiencyLookup.load(tmp_path / "lookup.npz")
+    assert np.array_equal(loaded([0.5, 1.5], [7., 2.]), lookup([0.5, 1.5], [7., 2.]))
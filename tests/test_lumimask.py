@@ -0,0 +1,24 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ROOT")
+pytest.importorskip("PhysicsTools.NanoAODTools")
+from helpers.lumimask import LumiMask
+
+def testLumiMask():
+    mask = LumiMask({"367080": [[1, 10], [11, 20], [30, 30]], "367081": [[5, 5]]})
+    # Adjacent ranges are merged
+    assert len(mask.starts) == 3
+    assert [mask.contains(367080, lumi) for lumi in [0, 1, 20, 21, 30, 31]] == [False, True, True, False, True, False]
+    run = np.array([367080, 367080, 367081, 367081, 367082])
+    lumi = np.array([15, 25, 5, 6, 5])
+    assert mask.containsArray(run, lumi).tolist() == [True, False, True, False, False]
+    assert mask.runs().tolist() == [367080, 367081]
+
+def testLumiMaskFile(tmp_path):
+    path = tmp_path / "golden.json"
+    path.write_text('{"367080": [[1, 10]]}')
+    mask = LumiMask(str(path))
+    assert mask.contains(367080, 10) and not mask.contains(367080, 11)
+    # The cached last lookup does not leak into the next key
+    assert not mask.contains(367081, 10)
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ROOT")
+pytest.importorskip("PhysicsTools.NanoAODTools")
+from helpers.histograms import Axis, Hist, HistBook
+from helpers.lumimask import LumiMask
+from helpers.runstore import RunStore, mergeStores, parseRuns, writeBookStore
+
+def events(n=20000, seed=11):
+    rng = np.random.default_rng(seed)
+    run = rng.integers(367080, 367090, n)
+    lumi = rng.integers(1, 50, n)
+    return run, lumi, rng.exponential(150., n) + 100., rng.poisson(30, n).astype(np.float64)
+
+def book(split, run, lumi, x, y, perEvent=100):
+    b = HistBook(bufferSize=997, split=split)
+    b.book("h_x", "", Axis(nbins=50, low=0., high=1000.))
+    b.book("h_x_vs_y", "", Axis([0., 200., 500., 1000.]), Axis(nbins=10, low=0., high=100.))
+    # The first events through the per-event path, the others as a chunk
+    for i in range(perEvent):
+        b.setEvent(run[i], lumi[i])
+        b.fill("h_x", x[i])
+        b.fill("h_x_vs_y", x[i], y[i])
+    b.setChunk(run, lumi, np.zeros(len(run)))
+    index = np.arange(perEvent, len(run))
+    b.fillArray("h_x", x[index], index=index)
+    b.fillArray("h_x_vs_y", x[index], y[index], index=index)
+    b.flush()
+    return b
+
+def same(h, other):
+    return np.array_equal(h.counts, other.counts) and h.entries == other.entries and np.allclose(h.stats, other.stats)
+
+def testParseRuns():
+    assert parseRuns("367080-367085,367090") == [(367080, 367085), (367090, 367090)]
+
+@pytest.mark.parametrize("split", ["run", "lumi"])
+def testStoreRoundTrip(tmp_path, split):
+    run, lumi, x, y = events()
+    b = book(split, run, lumi, x, y)
+    path = tmp_path / "out.had.runs.npz"
+    writeBookStore(str(path), "had", b)
+    store = RunStore(str(path))
+    assert store.directory == "had"
+    runs, entries = store.runs()
+    assert np.array_equal(runs, np.unique(run)) and entries.sum() == len(run)
+    # All runs give back the full histograms, a run range those of its events
+    for h, stored in zip(b.hists.values(), store.hists()):
+        assert same(h, stored)
+    selected = (run >= 367082) & (run <= 367084)
+    h = Hist("h_x", "", Axis(nbins=50, low=0., high=1000.))
+    h.fill(x[selected])
+    assert same(h, store.hists(runs=[(367082, 367084)])[0])
+
+def testStoreLumiMask(tmp_path):
+    run, lumi, x, y = events()
+    path = tmp_path / "out.had.runs.npz"
+    writeBookStore(str(path), "had", book("lumi", run, lumi, x, y))
+    mask = LumiMask({"367083": [[1, 20]], "367085": [[10, 49]]})
+    h = Hist("h_x", "", Axis(nbins=50, low=0., high=1000.))
+    h.fill(x[mask.containsArray(run, lumi)])
+    assert same(h, RunStore(str(path)).hists(lumiMask=mask)[0])
+    writeBookStore(str(tmp_path / "runs.had.runs.npz"), "had", book("run", run, lumi, x, y))
+    with pytest.raises(ValueError):
+        RunStore(str(tmp_path / "runs.had.runs.npz")).hists(lumiMask=mask)
+
+def testMergeAndSubtract(tmp_path):
+    run, lumi, x, y = events()
+    half = len(run) // 2
+    paths = [str(tmp_path / f"{name}.had.runs.npz") for name in ["a", "b", "all", "merged", "subtracted"]]
+    writeBookStore(paths[0], "had", book("run", run[:half], lumi[:half], x[:half], y[:half]))
+    writeBookStore(paths[1], "had", book("run", run[half:], lumi[half:], x[half:], y[half:]))
+    writeBookStore(paths[2], "had", book("run", run, lumi, x, y))
+    mergeStores(paths[3], paths[:2])
+    for h, merged in zip(RunStore(paths[2]).hists(), RunStore(paths[3]).hists()):
+        assert same(h, merged)
+    mergeStores(paths[4], [paths[2], paths[1]], [1, -1])
+    for h, subtracted in zip(RunStore(paths[0]).hists(), RunStore(paths[4]).hists()):
+        assert same(h, subtracted)
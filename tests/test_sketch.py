@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from helpers.sketch import GridCounts, SketchBook, adaptiveEdges, mergeSketchFiles, readSketches, sketchPath
+
+def sample(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.exponential(150., n) + 200.
+    passed = rng.uniform(size=n) < 1. / (1. + np.exp(-(x - 480.) / 30.))
+    return x, passed
+
+def testGridCounts():
+    grid = GridCounts(0., 10., 1.)
+    grid.fill([-1., 0., 0.5, 9.99, 10., np.nan, np.inf], [True, True, False, True, False, True, True])
+    # Underflow, 0 and 0.5 in the first bin, 9.99 in the last, 10 as overflow, NaN and inf dropped
+    assert grid.n == 5
+    assert grid.counts[0, [0, 1, 10, 11]].tolist() == [1, 2, 1, 1]
+    assert grid.counts[1, [0, 1, 10, 11]].tolist() == [1, 1, 1, 0]
+
+def testCumulativeMatchesHistogram():
+    x, passed = sample(100000)
+    grid = GridCounts(200., 1000., 1.)
+    grid.fill(x, passed)
+    edges = np.array([200., 250., 400., 401., 1000.])
+    n, k = [np.diff(c) for c in grid.cumulative(edges)]
+    assert np.array_equal(n, np.histogram(x, edges)[0])
+    assert np.array_equal(k, np.histogram(x[passed], edges)[0])
+    with pytest.raises(ValueError):
+        grid.cumulative([200.5])
+
+def testMergeFiles(tmp_path):
+    x, passed = sample(50000)
+    outputs = []
+    for i, part in enumerate(np.array_split(np.arange(len(x)), 3)):
+        book = SketchBook(["pt"], bufferSize=1000)
+        for j in part[:100]:
+            book.fill("pt", x[j], passed[j])
+        book.fillArray("pt", x[part[100:]], passed[part[100:]])
+        output = str(tmp_path / f"part_{i}.root")
+        book.write(sketchPath(output, "had"), "had")
+        outputs.append(output)
+    merged = str(tmp_path / "merged.root")
+    mergeSketchFiles(merged, outputs)
+    directory, grids = readSketches(sketchPath(merged, "had"))
+    single = GridCounts(200., 1000., 1.)
+    single.fill(x, passed)
+    assert directory == "had"
+    assert np.array_equal(grids["pt"].counts, single.counts)
+    with pytest.raises(ValueError):
+        single.merge(GridCounts(200., 1000., 2.))
+
+@pytest.mark.parametrize("resolution", [0., 5.])
+def testAdaptiveEdgesMinCount(resolution):
+    x, passed = sample(200000)
+    grid = GridCounts(200., 1000., 1.)
+    grid.fill(x, passed)
+    edges = adaptiveEdges(grid, 200., 1000., minCount=1000, resolution=resolution)
+    assert edges[0] == 200. and edges[-1] == 1000.
+    if resolution:
+        assert np.allclose(np.mod(edges, resolution), 0.)
+    assert np.histogram(x, edges)[0].min() >= 1000
+
+def testAdaptiveEdgesUncertainty():
+    x, passed = sample(200000)
+    grid = GridCounts(200., 1000., 1.)
+    grid.fill(x, passed)
+    edges = adaptiveEdges(grid, 200., 1000., minCount=100, maxUncertainty=0.02, resolution=5.)
+    n, k = np.histogram(x, edges)[0], np.histogram(x[passed], edges)[0]
+    e = (k + 1.) / (n + 2.)
+    # Only the merged remainder at the upper end may miss the target
+    assert np.all(np.sqrt(e * (1. - e) / n)[:-1] <= 0.02)
+    with pytest.raises(ValueError):
+        adaptiveEdges(grid, 200., 1000., resolution=2.5)
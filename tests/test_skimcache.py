@@ -0,0 +1,34 @@
+import time
+import pytest
+
+pytest.importorskip("ROOT")
+import helpers.skimcache as skimcache
+from helpers.skimcache import SkimCache, RUN_START
+
+def testRemoteKeyFollowsHeader(monkeypatch):
+    url = "root://eos.example//store/data/nano.root"
+    monkeypatch.setattr(skimcache, "headerStamp", lambda fname: [1000, "uuid-1"])
+    key = SkimCache.key(url, "nMuon > 0", ["Muon_pt"])
+    assert SkimCache.key(url, "nMuon > 0", ["Muon_pt"]) == key
+    # A rewritten remote file has a new UUID and gets a new skim
+    monkeypatch.setattr(skimcache, "headerStamp", lambda fname: [1000, "uuid-2"])
+    assert SkimCache.key(url, "nMuon > 0", ["Muon_pt"]) != key
+
+def testLocalKeyFollowsFile(tmp_path):
+    fname = tmp_path / "nano.root"
+    fname.write_bytes(b"x" * 10)
+    key = SkimCache.key(str(fname), None, None)
+    fname.write_bytes(b"x" * 20)
+    assert SkimCache.key(str(fname), None, None) != key
+
+def testEvictKeepsSkimsOfCurrentRun(tmp_path):
+    cache = SkimCache(str(tmp_path / "cache"), maxBytes=10)
+    index = {}
+    for key, lastUsed in [("old", RUN_START - 100.), ("older", RUN_START - 200.), ("current", time.time())]:
+        path = tmp_path / "cache" / f"{key}.root"
+        path.write_bytes(b"x" * 8)
+        index[key] = {"file": str(path), "bytes": 8, "lastUsed": lastUsed}
+    cache._evict(index)
+    # Over the limit, but the skim used in this run may still be read by a parallel job
+    assert list(index) == ["current"]
+    assert not (tmp_path / "cache" / "old.root").exists()
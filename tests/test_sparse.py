@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("ROOT")
+from helpers.histograms import Axis, Hist, HistBook, SparseHist
+
+AXES = [Axis([200., 300., 400., 500., 700., 1000.]), Axis(nbins=40, low=0., high=400.), Axis(nbins=24, low=-2.4, high=2.4), Axis(nbins=50, low=0., high=100.)]
+NAMES = ["pt", "mSD", "eta", "pv"]
+
+@pytest.fixture(scope="module")
+def filled():
+    rng = np.random.default_rng(3)
+    n = 50000
+    values = [rng.uniform(150., 1100., n), rng.uniform(-5., 420., n), rng.uniform(-2.6, 2.6, n), rng.poisson(30, n).astype(np.float64)]
+    values[0][:10] = np.nan
+    sparse = SparseHist("h_AK8_sparse", "", AXES, NAMES, maxPending=5000)
+    for start in range(0, n, 7000):
+        sparse.fill(*[v[start:start + 7000] for v in values])
+    return sparse, values
+
+def dense(axes, *values):
+    h = Hist("dense", "", *axes)
+    h.fill(*values)
+    return h
+
+def testCells(filled):
+    sparse, values = filled
+    bins, counts = sparse.cells()
+    assert np.all(np.diff(bins) > 0)
+    assert counts.sum() == sparse.entries == len(values[0])
+
+def testProject(filled):
+    sparse, values = filled
+    projected = sparse.project("pt", "mSD").toHist()
+    h = dense(AXES[:2], values[0], values[1])
+    assert np.array_equal(projected.counts, h.counts)
+    assert projected.entries == h.entries
+    assert np.array_equal(sparse.project("pv").toHist().counts, dense(AXES[3:], values[3]).counts)
+
+def testSelect(filled):
+    sparse, values = filled
+    selected = sparse.select("eta", -1.3, 1.3).project("pt")
+    index = AXES[2].index(values[2])
+    centres = np.r_[-np.inf, 0.5 * (AXES[2].edges[1:] + AXES[2].edges[:-1]), np.inf][index]
+    inside = (centres >= -1.3) & (centres < 1.3)
+    h = dense(AXES[:1], values[0][inside])
+    assert np.array_equal(selected.toHist().counts, h.counts)
+    # The entries are those of the selected bins, not of the parent
+    assert selected.entries == inside.sum() < sparse.entries
+
+def testRebin(filled):
+    sparse, values = filled
+    edges = [200., 400., 1000.]
+    assert np.array_equal(sparse.rebin("pt", edges).project("pt").toHist().counts, dense([Axis(edges)], values[0]).counts)
+    assert np.array_equal(sparse.rebin("pv", 5).project("pv").toHist().counts, dense([Axis(nbins=10, low=0., high=100.)], values[3]).counts)
+    with pytest.raises(ValueError):
+        sparse.rebin("pt", [200., 350., 1000.])
+
+def testStats(filled):
+    sparse, values = filled
+    h = sparse.project("mSD").toHist()
+    centres = 0.5 * (AXES[1].edges[1:] + AXES[1].edges[:-1])
+    counts = h.counts[1:-1]
+    assert np.allclose(h.stats, [counts.sum(), counts.sum(), (counts * centres).sum(), (counts * centres**2).sum()])
+    h2 = sparse.project("pt", "mSD").toHist()
+    assert len(h2.stats) == 7
+    assert h2.stats[0] == dense(AXES[:2], values[0], values[1]).stats[0]
+
+def testBook(filled):
+    sparse, values = filled
+    book = HistBook(bufferSize=1000)
+    book.bookSparse("x", "", AXES[:2], NAMES[:2])
+    for i in range(3000):
+        book.fillSparse("x", values[0][i], values[1][i])
+    book.fillSparseArrays("x", values[0][3000:4000], values[1][3000:4000])
+    book.flush()
+    assert np.array_equal(book.sparse["x"].toHist().counts, dense(AXES[:2], values[0][:4000], values[1][:4000]).counts)
@@ -0,0 +1,85 @@
+import json
+import math
+import numpy as np
+import pytest
+
+from helpers.turnon import fitTurnOns, readPlateauCuts, turnOnPoints
+from helpers.utils import erfArray
+from fitEffs import PLATEAU_CURVES, PLATEAU_CUTS, plateauCuts
+
+def generate(truth, model, nbins=60, nPerBin=20000, seed=7):
+    rng = np.random.default_rng(seed)
+    x = np.tile(np.linspace(200., 800., nbins), (len(truth), 1))
+    n = np.full(x.shape, nPerBin)
+    p = []
+    for (mu, sigma, plateau), xs in zip(truth, x):
+        z = (xs - mu) / sigma
+        F = 0.5 * (1. + np.array([math.erf(v / math.sqrt(2.)) for v in z])) if model == "erf" else 1. / (1. + np.exp(-z))
+        p.append(plateau * F)
+    return x, n, rng.binomial(n, np.array(p))
+
+@pytest.mark.parametrize("model", ["erf", "sigmoid"])
+def testFitRecoversTruth(model):
+    truth = np.array([[450., 30., 0.98], [500., 60., 0.9], [350., 15., 0.999]])
+    x, n, k = generate(truth, model)
+    fit = fitTurnOns(x, n, k, model=model)
+    assert fit["converged"].all()
+    errors = np.sqrt(np.einsum("cii->ci", fit["cov"]))
+    assert np.all(np.abs(fit["params"] - truth) < 5. * errors + 1e-3)
+    # Deviance of a good fit is about the number of degrees of freedom
+    assert np.all(fit["deviance"] < 2. * (fit["nbins"] - 3))
+
+def testEmptyBinsIgnored():
+    truth = np.array([[450., 30., 0.98]])
+    x, n, k = generate(truth, "erf")
+    padded = [np.pad(a, ((0, 0), (0, 10))) for a in (x, n, k)]
+    fit, fitPadded = fitTurnOns(x, n, k), fitTurnOns(*padded)
+    assert fitPadded["nbins"][0] == fit["nbins"][0]
+    assert np.allclose(fitPadded["params"], fit["params"])
+
+def testDegenerateCurvesNotConverged():
+    truth = np.array([[450., 30., 0.98]])
+    x, n, k = generate(truth, "erf")
+    # A good curve, an empty one and one with only two filled bins
+    few = np.where(np.arange(x.shape[1]) < 2, n[0], 0)
+    fit = fitTurnOns(np.repeat(x, 3, axis=0), np.stack([n[0], np.zeros_like(n[0]), few]), np.stack([k[0], np.zeros_like(k[0]), np.minimum(k[0], few)]))
+    assert fit["converged"].tolist() == [True, False, False]
+    assert fit["nbins"].tolist() == [x.shape[1], 0, 2]
+    assert np.all(fit["cov"][1] == 0.)
+
+def fitResult(var, converged, cov):
+    sel, label = PLATEAU_CURVES[var]
+    return {"directory": "hadTrigAnalyzerNanoAOD", "variable": var, "selection": sel, "numerator": label,
+            "converged": converged, "cov": cov.tolist(), "points": {"0.99": [512.3, 2.]}}
+
+def testPlateauCutsRejectDegenerateFits():
+    good = np.diag([4., 1., 1e-4])
+    assert plateauCuts([fitResult("pt", True, good)], "0.99", 0.99, PLATEAU_CUTS)["hadTrigAnalyzerNanoAOD"] == {"mSD": 50., "pt": 513.}
+    for converged, cov in [(False, good), (True, np.zeros((3, 3))), (True, np.full((3, 3), np.nan))]:
+        cuts = plateauCuts([fitResult("pt", converged, cov)], "0.99", 0.99, PLATEAU_CUTS)
+        assert cuts["hadTrigAnalyzerNanoAOD"] == PLATEAU_CUTS
+
+def testErfArray():
+    # Away from 0, where the approximation is discontinuous by 1e-9
+    x = np.linspace(-5., 5., 2000)
+    erf, derf = erfArray(x, derivative=True)
+    assert np.allclose(erf, [math.erf(v) for v in x], rtol=0., atol=2e-7)
+    h = 1e-6
+    assert np.allclose(derf, (erfArray(x + h) - erfArray(x - h)) / (2. * h), rtol=0., atol=1e-8)
+
+def testTurnOnPoints():
+    params = np.array([[450., 30., 0.98]])
+    cov = np.zeros((1, 3, 3))
+    cov[0, 0, 0], cov[0, 1, 1] = 4., 1.
+    points, errors = turnOnPoints(params, cov, levels=(0.5, 0.99))
+    assert np.allclose(points, [[450., 450. + 2.326348 * 30.]], atol=1e-3)
+    assert np.allclose(errors, [[2., math.sqrt(4. + 2.326348**2)]], atol=1e-4)
+    with pytest.raises(ValueError):
+        fitTurnOns(np.zeros((1, 3)), np.ones((1, 3)), np.ones((1, 3)), model="step")
+
+def testReadPlateauCuts(tmp_path):
+    path = tmp_path / "cuts.json"
+    path.write_text(json.dumps({"hadTrigAnalyzerNanoAOD": {"pt": 480, "mSD": 50}, "level": 0.99}))
+    assert readPlateauCuts(path, "hadTrigAnalyzerNanoAOD") == {"pt": 480., "mSD": 50.}
+    with pytest.raises(ValueError):
+        readPlateauCuts(path, "metTrigAnalyzerNanoAOD")
@@ -0,0 +1,37 @@
+import math
+import numpy as np
+import pytest
+
+from helpers.utils import deltaPhi, deltaR, deltaR2, deltaPhiArray, deltaR2Array, deltaRArray
+
+def randomAngles(n, seed=3):
+    rng = np.random.default_rng(seed)
+    eta1, eta2 = rng.uniform(-2.5, 2.5, (2, n))
+    phi1, phi2 = rng.uniform(-math.pi, math.pi, (2, n))
+    # Pairs across the +-pi boundary, and on it
+    phi1[:6] = [3.1, -3.1, math.pi, -math.pi, math.pi, 0.]
+    phi2[:6] = [-3.1, 3.1, -math.pi, math.pi, math.pi, math.pi]
+    return eta1, phi1, eta2, phi2
+
+def testDeltaPhiArray():
+    _, phi1, _, phi2 = randomAngles(1000)
+    dphi = deltaPhiArray(phi1, phi2)
+    assert np.array_equal(dphi, [deltaPhi(a, b) for a, b in zip(phi1, phi2)])
+    assert np.all(np.abs(dphi) <= math.pi)
+    assert dphi[0] == pytest.approx(6.2 - 2 * math.pi) and dphi[1] == pytest.approx(2 * math.pi - 6.2)
+
+def testDeltaPhiArrayMoreThanOneTurn():
+    rng = np.random.default_rng(5)
+    phi1, phi2 = rng.uniform(-20., 20., (2, 1000))
+    assert np.allclose(deltaPhiArray(phi1, phi2), [deltaPhi(a, b) for a, b in zip(phi1, phi2)], rtol=0., atol=1e-12)
+
+def testDeltaRArray():
+    eta1, phi1, eta2, phi2 = randomAngles(1000)
+    assert np.array_equal(deltaR2Array(eta1, phi1, eta2, phi2), [deltaR2(*v) for v in zip(eta1, phi1, eta2, phi2)])
+    assert np.array_equal(deltaRArray(eta1, phi1, eta2, phi2), [deltaR(*v) for v in zip(eta1, phi1, eta2, phi2)])
+
+def testDeltaRArrayBroadcasts():
+    eta1, phi1, _, _ = randomAngles(100)
+    # One object against many, and lists as input
+    assert np.array_equal(deltaRArray(list(eta1), list(phi1), 0.5, -3.), [deltaR(a, b, 0.5, -3.) for a, b in zip(eta1, phi1)])
+    assert deltaRArray([], [], [], []).shape == (0,)